@@ -37,3 +37,10 @@ class CustomUser(AbstractUser):
 
     def __str__(self):
         return self.username
+
+    def get_session_auth_hash(self):
+        # Users served from a core.identity snapshot carry the hash instead of
+        # the password, until the password is loaded or changed.
+        if hasattr(self, '_session_auth_hash') and 'password' in self.get_deferred_fields():
+            return self._session_auth_hash
+        return super().get_session_auth_hash()
@@ -2,6 +2,7 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
+from core.branches import get_branch_by_id
 from .forms import CustomUserCreationForm
 
 # 🔐 User Login View
@@ -14,7 +15,7 @@ def user_login(request):
         if user:
             login(request, user)
             role = user.role
-            branch = user.branch.name.lower()
+            branch = get_branch_by_id(user.branch_id).name.lower()
 
 
             # Redirect to respective dashboard
@@ -50,7 +51,7 @@ def create_user_view(request):
         if form.is_valid():
             form.save()
             messages.success(request, "User created successfully.")
-            return redirect('superadmin_dashboard' if request.user.role == 'superadmin' else f'/dashboard/admin/{request.user.branch.lower()}/')
+            return redirect('superadmin_dashboard' if request.user.role == 'superadmin' else f'/dashboard/admin/{request.user.branch.name.lower()}/')
     else:
         form = CustomUserCreationForm()
 
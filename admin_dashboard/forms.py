@@ -1,6 +1,7 @@
 from django import forms
 from accounts.models import CustomUser
-from core.models import VetTask, MedicalRecord, SupportTicket, TicketReply
+from core.forms import AnimalLookupField
+from core.models import Animal, VetTask, MedicalRecord, SupportTicket, TicketReply
 
 
 class CustomUserForm(forms.ModelForm):
@@ -23,6 +24,7 @@ class AssignTaskForm(forms.ModelForm):
     class Meta:
         model = VetTask
         fields = ['title', 'description', 'animal', 'assigned_to', 'priority', 'due_date']
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
             'due_date': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
@@ -32,6 +34,7 @@ class AssignTaskForm(forms.ModelForm):
         branch = kwargs.pop('branch', None)
         super().__init__(*args, **kwargs)
         if branch:
+            self.fields['animal'].queryset = Animal.objects.filter(branch=branch)
             self.fields['assigned_to'].queryset = CustomUser.objects.filter(
                 branch=branch, 
                 role__in=['user', 'veterinarian', 'staff']
@@ -42,6 +45,7 @@ class MedicalRecordForm(forms.ModelForm):
     class Meta:
         model = MedicalRecord
         fields = ['animal', 'report_type', 'diagnosis', 'treatment', 'document']
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'diagnosis': forms.Textarea(attrs={'rows': 3}),
             'treatment': forms.Textarea(attrs={'rows': 3}),
@@ -52,6 +56,7 @@ class VetTaskForm(forms.ModelForm):
     class Meta:
         model = VetTask
         fields = ['title', 'description', 'animal', 'assigned_to', 'priority', 'due_date']
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
             'due_date': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
@@ -61,6 +66,7 @@ class VetTaskForm(forms.ModelForm):
         branch = kwargs.pop('branch', None)
         super().__init__(*args, **kwargs)
         if branch:
+            self.fields['animal'].queryset = Animal.objects.filter(branch=branch)
             self.fields['assigned_to'].queryset = CustomUser.objects.filter(
                 branch=branch, 
                 role__in=['user', 'veterinarian', 'staff']
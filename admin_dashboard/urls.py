@@ -25,6 +25,7 @@ from .views import (
 
 urlpatterns = [
     path('<str:branch>/', admin_dashboard, name='admin_dashboard'),
+    path('<str:branch>/activity/', views.activity_feed, name='admin_activity_feed'),
     path('<str:branch>/create-user/', create_user, name='create_user'),  # 🔁 Fix this line
     path('<str:branch>/task_assign/', task_assign, name='task_assign'),
     path('<str:branch>/approve-activities/', approve_activities, name='approve_activities'),
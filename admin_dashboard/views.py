@@ -14,6 +14,10 @@ from core.models import (
     SupportTicket, TicketReply, EmergencyIncident, Branch, Message
 )
 from core.utils import log_action, create_notification, can_access_branch
+from core.stats import get_branch_stats, get_daily_stats
+from core.pagination import paginate
+from core.activity import branch_feed
+from core.branches import get_branch, get_branch_or_404
 
 
 @login_required
@@ -23,21 +27,13 @@ def admin_dashboard_view(request, branch):
         return render(request, 'errors/unauthorized.html', status=403)
 
     # Main stats
+    stats = get_branch_stats(request.user.branch)
     total_users = CustomUser.objects.filter(branch=branch, role__in=['user', 'veterinarian']).count()
-    pending_tasks = VetTask.objects.filter(branch=branch, status='pending').count()
-    total_animals = Animal.objects.filter(branch=branch).count()
-    reports_today = DailyActivityReport.objects.filter(branch=branch, date__date=timezone.now().date()).count()
-    open_tickets = SupportTicket.objects.filter(branch=branch, status='open').count()
-    closed_tickets = SupportTicket.objects.filter(branch=branch, status='closed').count()
-
-    # Recent equipment logs
-    recent_equipment_logs = EquipmentLog.objects.filter(branch=branch).order_by('-created_at')[:5]
-
-    # Unread notifications for this admin
-    unread_notifications = Notification.objects.filter(
-        user__branch=branch,
-        is_read=False
-    ).order_by('-created_at')[:5]
+    pending_tasks = stats.tasks_pending
+    total_animals = stats.animal_count
+    reports_today = get_daily_stats(request.user.branch).report_count
+    open_tickets = stats.tickets_open
+    closed_tickets = stats.tickets_closed
 
     # Unread messages for this admin
     unread_messages = Message.objects.filter(
@@ -45,12 +41,8 @@ def admin_dashboard_view(request, branch):
         is_read=False
     ).order_by('-timestamp')[:5]
 
-    # Combine all recent activities for unified feed
-    recent_activities = sorted(
-        list(recent_equipment_logs) + list(unread_notifications) + list(unread_messages),
-        key=lambda x: getattr(x, 'created_at', getattr(x, 'timestamp', timezone.now())),
-        reverse=True
-    )[:5]
+    # Branch activity feed (see core.activity)
+    recent_activities = branch_feed(request.user.branch)[:5]
 
     # Quick stats (example metrics, adjust as needed)
     quick_stats = [
@@ -71,8 +63,6 @@ def admin_dashboard_view(request, branch):
         'reports_today': reports_today,
         'open_tickets': open_tickets,
         'closed_tickets': closed_tickets,
-        'recent_equipment_logs': recent_equipment_logs,
-        'unread_notifications': unread_notifications,
         'unread_messages': unread_messages,
         'recent_activities': recent_activities,
         'quick_stats': quick_stats,
@@ -93,11 +83,24 @@ def admin_dashboard(request, branch):
         return render(request, 'errors/unauthorized.html', status=403)
 
     context = {
-        'branch': request.user.branch.name.title()
-
+        'branch': request.user.branch.name.title(),
+        'recent_activities': branch_feed(request.user.branch)[:5],
     }
     return render(request, 'admin_dashboard/dashboard.html', context)
 
+
+@login_required
+def activity_feed(request, branch):
+    if request.user.branch is None or request.user.branch.name.lower() != branch.lower():
+        return render(request, 'errors/unauthorized.html', status=403)
+
+    activities = paginate(request, branch_feed(request.user.branch))
+    return render(request, 'admin_dashboard/activity_feed.html', {
+        'branch': branch,
+        'activities': activities,
+        'page_obj': activities,
+    })
+
 # 👤 Create User
 @login_required
 def create_user(request, branch):
@@ -140,8 +143,8 @@ def task_list(request, branch):
     if request.user.branch != branch or request.user.role != 'admin':
         return render(request, 'errors/unauthorized.html', status=403)
 
-    tasks = VetTask.objects.filter(branch=branch).order_by('-created_at')
-    return render(request, 'admin_dashboard/task_list.html', {'tasks': tasks, 'branch': branch})
+    tasks = paginate(request, VetTask.objects.filter(branch=branch).order_by('-created_at').for_list())
+    return render(request, 'admin_dashboard/task_list.html', {'tasks': tasks, 'page_obj': tasks, 'branch': branch})
 
 # Task Detail
 def task_detail(request, branch, task_id):
@@ -182,7 +185,7 @@ def admin_user_list(request, branch):
     if request.user.role != 'admin' or request.user.branch.name.lower() != branch.lower():
         return render(request, 'errors/unauthorized.html', status=403)
 
-    branch_obj = Branch.objects.filter(name__iexact=branch).first()
+    branch_obj = get_branch(branch)
     if not branch_obj:
         return render(request, 'errors/not_found.html', status=404)
 
@@ -264,7 +267,7 @@ def admin_incident_logs(request, branch):
     if request.user.role != 'admin' and request.user.branch.lower() != branch.lower():
         return render(request, 'errors/unauthorized.html', status=403)
 
-    incidents = EmergencyIncident.objects.filter(animal__branch=branch).order_by('-date_reported')
+    incidents = EmergencyIncident.objects.filter(animal__branch__name__iexact=branch).order_by('-date_reported').for_list()
     return render(request, 'admin_dashboard/incident_logs.html', {
         'branch': branch,
         'incidents': incidents
@@ -275,7 +278,7 @@ def admin_care_logs(request, branch):
     if request.user.role != 'admin' and request.user.branch.lower() != branch.lower():
         return render(request, 'errors/unauthorized.html', status=403)
 
-    logs = AnimalLog.objects.filter(animal__branch=branch).order_by('-date')
+    logs = AnimalLog.objects.filter(animal__branch__name__iexact=branch).order_by('-date').for_list()
     return render(request, 'admin_dashboard/care_logs.html', {
         'branch': branch,
         'logs': logs,
@@ -299,7 +302,7 @@ def support_ticket_list(request, branch):
     if request.user.role != 'admin' or request.user.branch != branch:
         return HttpResponseForbidden("Unauthorized")
 
-    tickets = SupportTicket.objects.filter(created_by__branch=branch).order_by('-created_at')
+    tickets = SupportTicket.objects.filter(created_by__branch=branch).order_by('-created_at').for_list()
     return render(request, 'admin_dashboard/support_list.html', {'tickets': tickets, 'branch': branch})
 
 @login_required
@@ -346,7 +349,7 @@ def notifications(request, branch):
 
 def admin_medical_records(request, branch_slug):
     # Get branch
-    branch = Branch.objects.get(name__iexact=branch_slug)
+    branch = get_branch_or_404(branch_slug)
 
     # Filter records for animals in this branch
     records = MedicalRecord.objects.filter(animal__branch=branch)
@@ -0,0 +1,257 @@
+"""
+Show SQLite query plans for the dashboard hot paths before and after the
+composite indexes added in core/migrations/0025_hot_path_indexes.py.
+
+Runs against a throwaway SQLite file (never db.sqlite3):
+
+    python benchmarks/query_plans.py --rows 1000000
+
+The script migrates the scratch database to 0024 (no indexes), seeds it with
+roughly --rows rows spread over the hot tables, prints EXPLAIN QUERY PLAN and
+timings for each dashboard query, then applies 0025 and prints them again.
+Seeding and the "before" queries go through the historical models of the
+migrated schema, so columns added by later migrations don't break them.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tpf_animal_system.settings')
+
+BEFORE_MIGRATION = '0024_branchstats_branchdailystats'
+BATCH_SIZE = 10000
+
+# Share of --rows given to each table.
+ROW_SHARES = {
+    'animals': 0.02,
+    'tasks': 0.20,
+    'medical_records': 0.18,
+    'notifications': 0.25,
+    'messages': 0.20,
+    'system_logs': 0.15,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='approximate total rows to seed')
+    parser.add_argument('--branches', type=int, default=15)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--keep', action='store_true', help='keep the database file afterwards')
+    return parser.parse_args()
+
+
+def configure(database):
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = database
+    settings.DEBUG = False
+
+    import django
+    django.setup()
+
+
+def bulk(model, objects):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def historical_apps():
+    """Models as of the migrations currently applied to the scratch database"""
+    from django.db import connection
+    from django.db.migrations.executor import MigrationExecutor
+
+    loader = MigrationExecutor(connection).loader
+    return loader.project_state(list(loader.applied_migrations), at_end=True).apps
+
+
+def seed(args, apps):
+    from django.db import transaction
+    from django.utils import timezone
+
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    Branch, Animal, VetTask, MedicalRecord, Notification, Message, SystemLog = (
+        apps.get_model('core', name)
+        for name in ('Branch', 'Animal', 'VetTask', 'MedicalRecord', 'Notification', 'Message', 'SystemLog')
+    )
+
+    rng = random.Random(806)
+    now = timezone.now()
+    counts = {name: max(1, int(args.rows * share)) for name, share in ROW_SHARES.items()}
+
+    def moment():
+        return now - timedelta(minutes=rng.randrange(0, 60 * 24 * 365 * 3))
+
+    with transaction.atomic():
+        branches = Branch.objects.bulk_create([Branch(name=f'BRANCH_{i}') for i in range(args.branches)])
+        users = CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f'user{i}', email=f'user{i}@example.com',
+                role=rng.choice(['admin', 'veterinarian', 'user', 'staff']),
+                branch=branches[i % len(branches)],
+            )
+            for i in range(args.users)
+        ])
+        bulk(Animal, (
+            Animal(
+                name=f'Animal {i}', species=rng.choice(['dog', 'horse']), force_number=f'F-{i}',
+                age=rng.randint(1, 12), owner_name='TPF', branch=branches[i % len(branches)],
+            )
+            for i in range(counts['animals'])
+        ))
+        animal_ids = list(Animal.objects.values_list('id', 'branch_id'))
+
+        def tasks():
+            for i in range(counts['tasks']):
+                animal_id, branch_id = rng.choice(animal_ids)
+                yield VetTask(
+                    title=f'Task {i}', description='', animal_id=animal_id,
+                    assigned_by=rng.choice(users), assigned_to=rng.choice(users), branch_id=branch_id,
+                    status=rng.choice(['pending', 'in_progress', 'completed', 'cancelled']),
+                    due_date=moment(),
+                )
+        bulk(VetTask, tasks())
+
+        bulk(MedicalRecord, (
+            MedicalRecord(
+                animal_id=rng.choice(animal_ids)[0], veterinarian=rng.choice(users),
+                report_type='checkup', diagnosis='', treatment='',
+            )
+            for _ in range(counts['medical_records'])
+        ))
+        bulk(Notification, (
+            Notification(
+                user=rng.choice(users), notification_type='system_alert', title='Alert',
+                message='', is_read=rng.random() < 0.8,
+            )
+            for _ in range(counts['notifications'])
+        ))
+        bulk(Message, (
+            Message(
+                sender=rng.choice(users), receiver=rng.choice(users), subject='Hi', content='',
+                is_read=rng.random() < 0.7, is_deleted=rng.random() < 0.05,
+            )
+            for _ in range(counts['messages'])
+        ))
+        bulk(SystemLog, (
+            SystemLog(
+                user=rng.choice(users), role='user', branch='', action='other', message='',
+            )
+            for _ in range(counts['system_logs'])
+        ))
+
+        # auto_now_add stamps every row with "now"; spread the timestamps out so
+        # ORDER BY has real work to do.
+        for model, field in [
+            (VetTask, 'created_at'), (VetTask, 'date_assigned'), (MedicalRecord, 'date_recorded'),
+            (Notification, 'created_at'), (Message, 'timestamp'), (SystemLog, 'timestamp'),
+        ]:
+            ids = list(model.objects.values_list('id', flat=True))
+            objs = [model(id=pk, **{field: moment()}) for pk in ids]
+            model.objects.bulk_update(objs, [field], batch_size=BATCH_SIZE)
+
+    analyze()
+    return counts
+
+
+def analyze():
+    from django.db import connection
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def dashboard_queries(apps):
+    """(label, queryset) pairs mirroring the list/dashboard views."""
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    Branch, Animal, VetTask, MedicalRecord, Notification, Message, SupportTicket, SystemLog = (
+        apps.get_model('core', name)
+        for name in (
+            'Branch', 'Animal', 'VetTask', 'MedicalRecord', 'Notification', 'Message', 'SupportTicket', 'SystemLog',
+        )
+    )
+
+    user = CustomUser.objects.order_by('id').first()
+    branch = Branch.objects.order_by('id').first()
+    animal = Animal.objects.order_by('id').first()
+
+    return [
+        ('unread messages (admin dashboard)',
+         Message.objects.filter(receiver=user, is_read=False, is_deleted=False).order_by('-timestamp')[:5]),
+        ('inbox',
+         Message.objects.filter(receiver=user, is_deleted=False).order_by('-timestamp')[:15]),
+        ('sent messages',
+         Message.objects.filter(sender=user).order_by('-timestamp')[:15]),
+        ('unread notifications',
+         Notification.objects.filter(user=user, is_read=False).order_by('-created_at')[:5]),
+        ('branch pending tasks',
+         VetTask.objects.filter(branch=branch, status='pending').order_by('-created_at')[:20]),
+        ('user dashboard tasks',
+         VetTask.objects.filter(assigned_to=user).order_by('-date_assigned')[:5]),
+        ('vet task list',
+         VetTask.objects.filter(assigned_by=user).order_by('-created_at')[:20]),
+        ('animal medical records',
+         MedicalRecord.objects.filter(animal=animal).order_by('-date_recorded')),
+        ('vet medical records',
+         MedicalRecord.objects.filter(veterinarian=user).order_by('-date_recorded')[:20]),
+        ('open branch tickets',
+         SupportTicket.objects.filter(branch=branch, status='open').order_by('-created_at')[:15]),
+        ('system logs',
+         SystemLog.objects.order_by('-timestamp')[:200]),
+    ]
+
+
+def report(title, apps, repeat=5):
+    print(f'\n=== {title} ===')
+    for label, queryset in dashboard_queries(apps):
+        plan = queryset.explain()
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        print(f'\n-- {label}: {best * 1000:.2f} ms')
+        for line in plan.splitlines():
+            print(f'   {line}')
+
+
+def main():
+    args = parse_args()
+    database = args.database or tempfile.mktemp(prefix='tpf_query_plans_', suffix='.sqlite3')
+    configure(database)
+
+    from django.core.management import call_command
+
+    try:
+        call_command('migrate', verbosity=0)
+        call_command('migrate', 'core', BEFORE_MIGRATION, verbosity=0)
+
+        started = time.perf_counter()
+        apps = historical_apps()
+        counts = seed(args, apps)
+        print(f'Seeded {sum(counts.values()):,} rows in {time.perf_counter() - started:.1f}s: {counts}')
+
+        report('before composite indexes', apps)
+        call_command('migrate', 'core', verbosity=0)
+        analyze()
+        report('after composite indexes', historical_apps())
+    finally:
+        if not args.keep and not args.database and os.path.exists(database):
+            os.remove(database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Branch activity feed.
+
+Every domain model listed in ACTIVITY_SOURCES appends an ActivityEvent when
+a row is created or its state field changes (task status, ticket status,
+incident resolved); the receivers in core.signals do the writing, so the
+feed is a single indexed range read however many sources feed it:
+
+    page = paginate(request, branch_feed(branch), per_page=20)
+    page = paginate(request, actor_feed(user), per_page=20)
+
+`message` is a phrase that follows the actor's name in templates
+("assigned task 'Checkup'"); events are never updated or deleted.
+"""
+from collections import namedtuple
+
+from .models import (
+    ActivityEvent, VetTask, MedicalRecord, EmergencyIncident, AnimalLog,
+    EquipmentLog, SupportTicket, TicketReply, Message,
+)
+
+
+def _animal_branch(instance):
+    return instance.animal.branch_id if instance.animal_id else None
+
+
+def _task_message(task, verb):
+    if verb == 'created':
+        return f"assigned task '{task.title}' for {task.animal.name}"
+    return f"marked task '{task.title}' {task.get_status_display().lower()}"
+
+
+def _incident_message(incident, verb):
+    subject = f"{incident.get_severity_display().lower()} {incident.get_incident_type_display().lower()} incident"
+    if verb == 'created':
+        return f"reported a {subject}"
+    return f"resolved a {subject}" if incident.resolved else f"reopened a {subject}"
+
+
+def _ticket_message(ticket, verb):
+    if verb == 'created':
+        return f"opened ticket #{ticket.pk}: {ticket.subject}"
+    return f"moved ticket #{ticket.pk} to {ticket.get_status_display().lower()}"
+
+
+# `branch` and `actor` read the branch and user ids off an instance for a
+# verb; `state` names the field whose changes are recorded as 'changed'.
+ActivitySource = namedtuple('ActivitySource', ['kind', 'model', 'branch', 'actor', 'message', 'state'])
+
+ACTIVITY_SOURCES = [
+    ActivitySource(
+        'vet_task', VetTask, lambda task: task.branch_id,
+        lambda task, verb: task.assigned_by_id if verb == 'created' else task.assigned_to_id,
+        _task_message, 'status',
+    ),
+    ActivitySource(
+        'medical_record', MedicalRecord, _animal_branch, lambda record, verb: record.veterinarian_id,
+        lambda record, verb: f"added a {record.get_report_type_display().lower()} record for {record.animal.name}",
+        None,
+    ),
+    ActivitySource(
+        'emergency_incident', EmergencyIncident,
+        lambda incident: _animal_branch(incident) or incident.reporter.branch_id,
+        lambda incident, verb: incident.reporter_id if verb == 'created' else incident.resolved_by_id,
+        _incident_message, 'resolved',
+    ),
+    ActivitySource(
+        'animal_log', AnimalLog, _animal_branch, lambda log, verb: log.user_id,
+        lambda log, verb: f"logged {log.get_activity_type_display().lower()} for {log.animal.name}",
+        None,
+    ),
+    ActivitySource(
+        'equipment_log', EquipmentLog, lambda log: log.user.branch_id, lambda log, verb: log.user_id,
+        lambda log, verb: f"logged {log.get_equipment_display()}: {log.get_action_display().lower()}",
+        None,
+    ),
+    ActivitySource(
+        'support_ticket', SupportTicket, lambda ticket: ticket.branch_id,
+        lambda ticket, verb: ticket.created_by_id if verb == 'created' else ticket.assigned_to_id,
+        _ticket_message, 'status',
+    ),
+    ActivitySource(
+        'ticket_reply', TicketReply, lambda reply: reply.ticket.branch_id, lambda reply, verb: reply.replied_by_id,
+        lambda reply, verb: f"replied to ticket #{reply.ticket_id}", None,
+    ),
+    ActivitySource(
+        'message', Message, lambda message: message.branch_id or message.sender.branch_id,
+        lambda message, verb: message.sender_id,
+        lambda message, verb: f"sent a message to {message.receiver}", None,
+    ),
+]
+
+
+def get_activity_source(model):
+    for source in ACTIVITY_SOURCES:
+        if source.model is model:
+            return source
+    return None
+
+
+def record_activity(model, instance, verb):
+    """Append the event for `instance` being created or changing state"""
+    source = get_activity_source(model)
+    return ActivityEvent.objects.create(
+        branch_id=source.branch(instance),
+        actor_id=source.actor(instance, verb),
+        verb=verb,
+        kind=source.kind,
+        object_id=instance.pk,
+        animal_id=getattr(instance, 'animal_id', None),
+        message=source.message(instance, verb)[:255],
+        link=f'/core/animals/{instance.animal_id}/' if getattr(instance, 'animal_id', None) else '',
+    )
+
+
+def branch_feed(branch):
+    return ActivityEvent.objects.filter(branch=branch).select_related('actor')
+
+
+def actor_feed(user):
+    return ActivityEvent.objects.filter(actor=user).select_related('actor')
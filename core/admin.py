@@ -1,11 +1,30 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils import timezone
 
-# Register your models here.
-from django.contrib import admin
-from .models import SupportTicket, TicketReply
-from .models import SystemLog
+from .models import Job
 
-# admin.site.register(SupportTicket)
-# admin.site.register(TicketReply)
-# admin.site.register(SystemLog)
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Background job monitor (core.jobs): what is queued, running and failing"""
+    list_display = ['id', 'task', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'last_error']
+    readonly_fields = [
+        'task', 'args', 'kwargs', 'attempts', 'unique_key', 'locked_by', 'locked_at',
+        'last_error', 'created_at', 'finished_at',
+    ]
+    actions = ['retry_now', 'cancel']
+    date_hierarchy = 'created_at'
+
+    @admin.action(description="Run again now")
+    def retry_now(self, request, queryset):
+        count = queryset.exclude(status='running').update(
+            status='queued', run_at=timezone.now(), attempts=0, locked_by='', finished_at=None,
+        )
+        messages.success(request, f"{count} jobs queued.")
+
+    @admin.action(description="Cancel")
+    def cancel(self, request, queryset):
+        count = queryset.filter(status='queued').update(status='cancelled', finished_at=timezone.now())
+        messages.success(request, f"{count} jobs cancelled.")
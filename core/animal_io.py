@@ -0,0 +1,277 @@
+"""
+Bulk import and streaming export of the Animal registry.
+
+Files have one row per training record, with the animal columns repeated
+(rows sharing a force_number belong to the same animal). An animal without
+training records is a single row with the training columns left blank.
+
+Imports stream the file row by row, check force_number uniqueness against an
+in-memory set, and insert animals, their training records and the creator's
+assignment with bulk_create() in chunks, all inside one transaction: any
+invalid row rolls the whole import back. One summary notification and one
+SystemLog entry are written per import.
+
+XLSX support needs the optional openpyxl package; CSV always works.
+"""
+import csv
+import io
+import tempfile
+from collections import namedtuple
+
+from django.db import transaction
+from django.http import FileResponse, StreamingHttpResponse
+
+from .forms import AnimalImportForm, TrainingRecordForm
+from .models import Animal, TrainingRecord
+from .search import index_objects
+from .stats import apply_created_stats
+from .tasks import notify_branch_admins
+from .utils import log_action
+
+ANIMAL_COLUMNS = ['force_number', 'name', 'species', 'breed', 'age', 'date_of_birth', 'owner_name']
+TRAINING_BOOLEAN_COLUMNS = [
+    'training_tracking', 'training_sniffer', 'training_explosives',
+    'training_govt_trophies', 'training_narcotics',
+]
+TRAINING_COLUMNS = TRAINING_BOOLEAN_COLUMNS + [
+    'training_other', 'training_place', 'training_duration', 'training_time', 'training_handler',
+]
+COLUMNS = ANIMAL_COLUMNS + TRAINING_COLUMNS
+
+IMPORT_CHUNK_SIZE = 500
+EXPORT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'x'}
+UNREADABLE_CSV = "The file must be UTF-8 encoded CSV."
+
+ImportResult = namedtuple('ImportResult', ['animals', 'training_records', 'errors'])
+
+
+class AnimalFileError(Exception):
+    """The uploaded file cannot be read at all"""
+
+
+# ------------------------------
+# Reading
+# ------------------------------
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        raise AnimalFileError("XLSX files need the openpyxl package; upload a CSV file instead.")
+    return openpyxl
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'date') and callable(value.date):
+        value = value.date()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def read_rows(upload, filename):
+    """Yield (line number, {column: text}) for every non-empty row of a CSV or XLSX upload"""
+    if filename.lower().endswith('.xlsx'):
+        workbook = _openpyxl().load_workbook(upload, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    else:
+        rows = csv.reader(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''))
+
+    try:
+        header = [_cell(name).lower() for name in next(rows)]
+    except StopIteration:
+        raise AnimalFileError("The file is empty.")
+    except (UnicodeDecodeError, csv.Error):
+        raise AnimalFileError(UNREADABLE_CSV)
+    missing = [column for column in ('force_number', 'name', 'species', 'age', 'owner_name') if column not in header]
+    if missing:
+        raise AnimalFileError(f"Missing columns: {', '.join(missing)}")
+
+    try:
+        for line, values in enumerate(rows, start=2):
+            row = {column: _cell(value) for column, value in zip(header, values) if column}
+            if any(row.values()):
+                yield line, row
+    except (UnicodeDecodeError, csv.Error):
+        raise AnimalFileError(UNREADABLE_CSV)
+
+
+# ------------------------------
+# Import
+# ------------------------------
+
+class _Importer:
+
+    def __init__(self, branch, user, chunk_size):
+        self.branch = branch
+        self.user = user
+        self.chunk_size = chunk_size
+        self.existing = set(Animal.objects.values_list('force_number', flat=True))
+        self.animals = {}
+        self.pending_animals = []
+        self.pending_training = []
+        self.animal_count = 0
+        self.training_count = 0
+        self.errors = []
+
+    def error(self, line, message):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def add_row(self, line, row):
+        force_number = row.get('force_number', '')
+        animal = self.animals.get(force_number)
+        if animal is None:
+            if force_number in self.existing:
+                self.error(line, f"Force number {force_number} already exists.")
+                return
+            form = AnimalImportForm(data={column: row.get(column, '') for column in ANIMAL_COLUMNS})
+            if not form.is_valid():
+                self.error(line, _form_errors(form))
+                return
+            animal = form.save(commit=False)
+            animal.branch = self.branch
+            self.animals[force_number] = animal
+            self.pending_animals.append(animal)
+
+        if any(row.get(column) for column in TRAINING_COLUMNS):
+            data = {column: row.get(column, '') for column in TRAINING_COLUMNS}
+            for column in TRAINING_BOOLEAN_COLUMNS:
+                data[column] = data[column].lower() in TRUE_VALUES
+            form = TrainingRecordForm(data=data)
+            if not form.is_valid():
+                self.error(line, _form_errors(form))
+                return
+            self.pending_training.append((animal, form.save(commit=False)))
+
+        if len(self.pending_animals) + len(self.pending_training) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        # Once anything failed the transaction is rolled back, so stop writing
+        # and only keep validating to report further errors.
+        if self.errors:
+            self.pending_animals, self.pending_training = [], []
+            return
+
+        if self.pending_animals:
+            Animal.objects.bulk_create(self.pending_animals)
+            Animal.assigned_users.through.objects.bulk_create([
+                Animal.assigned_users.through(animal_id=animal.pk, customuser_id=self.user.pk)
+                for animal in self.pending_animals
+            ])
+            apply_created_stats(Animal, self.pending_animals)
+            index_objects(Animal, self.pending_animals)
+            self.animal_count += len(self.pending_animals)
+
+        if self.pending_training:
+            records = []
+            for animal, record in self.pending_training:
+                record.animal = animal
+                records.append(record)
+            TrainingRecord.objects.bulk_create(records)
+            self.training_count += len(records)
+
+        self.pending_animals, self.pending_training = [], []
+
+
+def _form_errors(form):
+    return '; '.join(
+        f"{field}: {' '.join(messages)}" if field != '__all__' else ' '.join(messages)
+        for field, messages in form.errors.items()
+    )
+
+
+def import_animals(upload, filename, branch, user, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import animals (and their training records) into `branch` on behalf of
+    `user`. Returns an ImportResult; when `errors` is non-empty nothing was
+    saved. Raises AnimalFileError for unreadable files.
+    """
+    importer = _Importer(branch, user, chunk_size)
+    with transaction.atomic():
+        for line, row in read_rows(upload, filename):
+            importer.add_row(line, row)
+        importer.flush()
+        if importer.errors:
+            transaction.set_rollback(True)
+            return ImportResult(0, 0, importer.errors)
+
+        if importer.animal_count:
+            notify_branch_admins.delay(
+                branch_id=branch.id,
+                notification_type='animal_assigned',
+                title='Animals Imported',
+                message=(
+                    f"{importer.animal_count} animals and {importer.training_count} training records "
+                    f"imported into {branch.name} by {user.get_full_name() or user.username}."
+                ),
+                link='/core/animals/',
+            )
+            log_action(
+                user=user,
+                action='create',
+                message=f"Imported {importer.animal_count} animals ({importer.training_count} training records) from {filename}",
+            )
+    return ImportResult(importer.animal_count, importer.training_count, [])
+
+
+# ------------------------------
+# Export
+# ------------------------------
+
+def export_rows(queryset):
+    """Yield the header and one row per training record (or per untrained animal)"""
+    yield COLUMNS
+    animals = (
+        queryset.order_by('pk')
+        .prefetch_related('training_records')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for animal in animals:
+        base = [_cell(getattr(animal, column)) for column in ANIMAL_COLUMNS]
+        records = animal.training_records.all()
+        if not records:
+            yield base + [''] * len(TRAINING_COLUMNS)
+        for record in records:
+            yield base + [
+                ('yes' if getattr(record, column) else '') if column in TRAINING_BOOLEAN_COLUMNS
+                else _cell(getattr(record, column))
+                for column in TRAINING_COLUMNS
+            ]
+
+
+class _Echo:
+    """File-like object whose write() returns the data, for csv.writer streaming"""
+
+    def write(self, value):
+        return value
+
+
+def export_csv_response(queryset, filename='animals.csv'):
+    writer = csv.writer(_Echo())
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in export_rows(queryset)),
+        content_type='text/csv',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_xlsx_response(queryset, filename='animals.xlsx'):
+    """Write-only workbook spooled to disk, so rows never pile up in memory"""
+    workbook = _openpyxl().Workbook(write_only=True)
+    sheet = workbook.create_sheet('Animals')
+    for row in export_rows(queryset):
+        sheet.append(row)
+    spool = tempfile.SpooledTemporaryFile(max_size=5 * 1024 * 1024)
+    workbook.save(spool)
+    spool.seek(0)
+    return FileResponse(
+        spool, as_attachment=True, filename=filename,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
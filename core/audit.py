@@ -0,0 +1,161 @@
+"""
+Batched SystemLog writer.
+
+core.utils.log_action() hands entries to the process-wide AuditLogWriter,
+which keeps them in a bounded in-memory queue and writes them with a single
+bulk_create() from a background thread whenever SYSTEM_LOG_BATCH_SIZE
+entries are waiting or SYSTEM_LOG_FLUSH_INTERVAL seconds have passed. Pending
+entries are flushed when the process exits.
+
+With SYSTEM_LOG_ASYNC = False (the default under `manage.py test`) entries
+are written immediately inside the caller's transaction instead.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from .models import SystemLog
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+
+    def __init__(self, batch_size=200, flush_interval=2.0, max_queue_size=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self._flush_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.last_flush_at = None
+
+    def _count(self, **increments):
+        with self._metrics_lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def enqueue(self, entry):
+        """Queue an unsaved SystemLog; drops it (and counts the drop) when the queue is full"""
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self._count(dropped=1)
+            logger.warning("SystemLog queue full; dropping audit entry: %s", entry.message)
+            return False
+        self._count(enqueued=1)
+        if self.queue.qsize() >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def flush(self):
+        """Write everything queued so far in the calling thread; returns rows written"""
+        total = 0
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    break
+                try:
+                    SystemLog.objects.bulk_create(batch)
+                except Exception:
+                    logger.exception("Failed to write %d SystemLog entries", len(batch))
+                    self._count(dropped=len(batch))
+                    continue
+                total += len(batch)
+                self._count(written=len(batch), flushes=1)
+                self.last_flush_at = time.time()
+        return total
+
+    def metrics(self):
+        with self._metrics_lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'queue_capacity': self.queue.maxsize,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'flushes': self.flushes,
+                'last_flush_at': self.last_flush_at,
+                'worker_alive': bool(self._thread and self._thread.is_alive()),
+            }
+
+    # ------------------------------
+    # Background worker
+    # ------------------------------
+
+    def start(self):
+        """Start the flush thread in this process (again after a fork)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='systemlog-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self.flush()
+        finally:
+            connections.close_all()
+
+    def shutdown(self, timeout=5.0):
+        """Stop the worker and write whatever is still queued"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditLogWriter(
+                    batch_size=getattr(settings, 'SYSTEM_LOG_BATCH_SIZE', 200),
+                    flush_interval=getattr(settings, 'SYSTEM_LOG_FLUSH_INTERVAL', 2.0),
+                    max_queue_size=getattr(settings, 'SYSTEM_LOG_QUEUE_SIZE', 10000),
+                )
+                atexit.register(_writer.shutdown)
+    return _writer
+
+
+def write_system_log(entry):
+    """Persist an unsaved SystemLog now (sync mode) or via the batched writer"""
+    if not getattr(settings, 'SYSTEM_LOG_ASYNC', True):
+        entry.save()
+        return
+    writer = get_audit_writer()
+    writer.start()
+    writer.enqueue(entry)
+
+
+def get_audit_metrics():
+    return get_audit_writer().metrics()
@@ -0,0 +1,63 @@
+"""
+Animal lookup by partial force number or name.
+
+Matches are gathered in order of usefulness, each stage a single indexed
+query that only runs while fewer than `limit` animals have been found:
+
+1. force numbers starting with the term (case-insensitive),
+2. names starting with the term,
+3. force numbers or names containing the term (3+ characters), which uses
+   the pg_trgm index on PostgreSQL and a branch-scoped LIKE elsewhere.
+
+Prefix stages are range scans on the (branch, UPPER(force_number)) and
+(branch, LOWER(name)) expression indexes declared on Animal.
+"""
+from django.db.models import Q
+from django.db.models.functions import Lower, Upper
+
+from .models import Animal
+
+LOOKUP_FIELDS = ['id', 'force_number', 'name', 'species', 'branch_id']
+MAX_LIMIT = 25
+MIN_INFIX_LENGTH = 3
+# Sorts after every real character, closing the prefix range.
+RANGE_END = '\U0010ffff'
+
+
+def _prefix(queryset, expression, prefix):
+    return (
+        queryset.annotate(lookup_key=expression)
+        .filter(lookup_key__gte=prefix, lookup_key__lt=prefix + RANGE_END)
+        .order_by('lookup_key')
+    )
+
+
+def lookup_animals(term, branch_id=None, limit=10):
+    """Up to `limit` animal dicts (LOOKUP_FIELDS plus `label`) best matching `term`"""
+    term = (term or '').strip()
+    if not term:
+        return []
+    limit = min(limit, MAX_LIMIT)
+
+    animals = Animal.objects.all()
+    if branch_id is not None:
+        animals = animals.filter(branch_id=branch_id)
+
+    stages = [
+        lambda: _prefix(animals, Upper('force_number'), term.upper()),
+        lambda: _prefix(animals, Lower('name'), term.lower()),
+    ]
+    if len(term) >= MIN_INFIX_LENGTH:
+        stages.append(lambda: animals.filter(
+            Q(force_number__icontains=term) | Q(name__icontains=term)
+        ).order_by('force_number'))
+
+    found = {}
+    for stage in stages:
+        rows = stage().exclude(pk__in=list(found)).values(*LOOKUP_FIELDS)[:limit - len(found)]
+        for row in rows:
+            row['label'] = f"{row['name']} ({row['force_number']})"
+            found[row['id']] = row
+        if len(found) >= limit:
+            break
+    return list(found.values())
@@ -0,0 +1,121 @@
+"""
+Process-local registry of branches.
+
+Dashboard URLs carry the branch name (`/dashboard/vet/<branch>/...`). There
+are only a handful of Branch rows and they rarely change, so each process
+keeps them all in memory, keyed by normalized name and by id, instead of
+running a case-insensitive lookup on every request:
+
+    branch = get_branch('Dar_es_Salaam')   # Branch or None, no query
+
+    @login_required
+    @with_branch
+    def vet_dashboard(request, branch, branch_obj):
+        ...
+
+Saving or deleting a Branch (core.signals) clears this process's copy and,
+once the transaction commits, bumps a version token in the cache named by
+BRANCH_REGISTRY_CACHE, which every process compares before answering; so
+the steady state costs one cache read and no database queries. The Branch
+objects are shared between requests and must not be modified.
+"""
+import threading
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import Http404
+
+from .models import Branch
+
+VERSION_KEY = 'branches:version'
+
+_lock = threading.Lock()
+_registry = None  # (version, {normalized name: Branch}, {id: Branch})
+
+
+def normalize_branch_name(name):
+    """
+    Normalize branch names by:
+    - Stripping whitespace
+    - Lowercasing
+    - Removing spaces and underscores
+    """
+    if not name:
+        return ""
+    return name.strip().lower().replace("_", "").replace(" ", "")
+
+
+def _cache():
+    return caches[getattr(settings, 'BRANCH_REGISTRY_CACHE', 'default')]
+
+
+def _load(version):
+    branches = list(Branch.objects.all())
+    by_name = {}
+    for branch in branches:
+        by_name.setdefault(normalize_branch_name(branch.name), branch)
+    return version, by_name, {branch.pk: branch for branch in branches}
+
+
+def _current():
+    global _registry
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        # Evicted or never set: a fresh token, so no process keeps a stale copy.
+        _cache().add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = _cache().get(VERSION_KEY)
+    registry = _registry
+    if registry is not None and registry[0] == version:
+        return registry
+    with _lock:
+        if _registry is None or _registry[0] != version:
+            _registry = _load(version)
+        return _registry
+
+
+def invalidate_branch_registry():
+    """Drop this process's copy now and tell the others once the transaction commits"""
+    global _registry
+    _registry = None
+    transaction.on_commit(lambda: _cache().set(VERSION_KEY, uuid.uuid4().hex, timeout=None))
+
+
+# ------------------------------
+# Lookups
+# ------------------------------
+
+def get_branch(name):
+    """The Branch whose normalized name matches `name`, or None"""
+    return _current()[1].get(normalize_branch_name(name))
+
+
+def get_branch_by_id(branch_id):
+    return _current()[2].get(branch_id)
+
+
+def get_branch_or_404(name):
+    branch = get_branch(name)
+    if branch is None:
+        raise Http404(f"No branch named '{name}'")
+    return branch
+
+
+def all_branches():
+    return sorted(_current()[2].values(), key=lambda branch: branch.name)
+
+
+def is_same_branch(branch, name):
+    """Whether a Branch (or None) is the one a URL segment names"""
+    return branch is not None and normalize_branch_name(branch.name) == normalize_branch_name(name)
+
+
+def with_branch(view):
+    """Resolve the view's `branch` URL argument and pass the Branch as `branch_obj` (404 if unknown)"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        kwargs['branch_obj'] = get_branch_or_404(kwargs['branch'])
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,162 @@
+"""
+Per-user unread counters for notifications and messages, kept in the cache
+named by UNREAD_COUNTER_CACHE (see CACHES in settings).
+
+Counters are loaded from the database the first time they are read and then
+adjusted in place with cache.incr() as Notification and Message rows
+change (core.signals, core.utils.notify_users). The reconcile_unread_counters
+management command recomputes them to repair any drift. incr() has to be
+atomic across workers (Redis); with UNREAD_COUNTER_CACHE unset the counts
+are read from the database instead.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count
+
+from accounts.models import CustomUser
+from .models import Branch, Notification, Message
+
+
+def _cache():
+    """The counter cache, or None to count in the database (no atomic incr() available)"""
+    alias = getattr(settings, 'UNREAD_COUNTER_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def notification_key(user_id):
+    return f'unread:notifications:{user_id}'
+
+
+def message_key(user_id, branch_id=None):
+    if branch_id is None:
+        return f'unread:messages:{user_id}'
+    return f'unread:messages:{user_id}:{branch_id}'
+
+
+def _get_or_load(key, load):
+    cache = _cache()
+    if cache is None:
+        return load()
+    value = cache.get(key)
+    if value is None:
+        value = load()
+        # add() rather than set() so a concurrent reload doesn't clobber an incr
+        cache.add(key, value, timeout=None)
+    return value
+
+
+# ------------------------------
+# Readers
+# ------------------------------
+
+def get_unread_notification_count(user_id):
+    return _get_or_load(
+        notification_key(user_id),
+        lambda: Notification.objects.filter(user_id=user_id, is_read=False).count(),
+    )
+
+
+def get_unread_message_count(user_id, branch_id=None):
+    """Unread, not deleted messages received by a user, optionally per message branch"""
+    def load():
+        messages = Message.objects.filter(receiver_id=user_id, is_read=False, is_deleted=False)
+        if branch_id is not None:
+            messages = messages.filter(branch_id=branch_id)
+        return messages.count()
+
+    return _get_or_load(message_key(user_id, branch_id), load)
+
+
+# ------------------------------
+# Write-through updates
+# ------------------------------
+
+def notification_counter_keys(values):
+    """Counter keys a notification row (dict of user_id/is_read) contributes 1 to"""
+    if values is None or values['is_read']:
+        return []
+    return [notification_key(values['user_id'])]
+
+
+def message_counter_keys(values):
+    """Counter keys a message row (dict of receiver_id/branch_id/is_read/is_deleted) contributes 1 to"""
+    if values is None or values['is_read'] or values['is_deleted']:
+        return []
+    keys = [message_key(values['receiver_id'])]
+    if values['branch_id'] is not None:
+        keys.append(message_key(values['receiver_id'], values['branch_id']))
+    return keys
+
+
+def adjust_counters(added=(), removed=()):
+    """
+    Increment every key in `added` and decrement every key in `removed` once
+    the current transaction commits. Keys that are not cached yet are left
+    alone; they are loaded from the database on their next read.
+    """
+    deltas = Counter(added)
+    deltas.subtract(Counter(removed))
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas or _cache() is None:
+        return
+
+    def apply():
+        cache = _cache()
+        for key, delta in deltas.items():
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                pass
+
+    transaction.on_commit(apply)
+
+
+# ------------------------------
+# Reconciliation
+# ------------------------------
+
+def reconcile_unread_counters():
+    """
+    Recompute every user's counters from the database and overwrite the
+    cached values. Returns (keys checked, keys that had drifted); (0, 0)
+    when the counters are read from the database.
+    """
+    if _cache() is None:
+        return 0, 0
+    user_ids = list(CustomUser.objects.values_list('id', flat=True))
+    branch_ids = list(Branch.objects.values_list('id', flat=True))
+
+    expected = {}
+    for user_id in user_ids:
+        expected[notification_key(user_id)] = 0
+        expected[message_key(user_id)] = 0
+        for branch_id in branch_ids:
+            expected[message_key(user_id, branch_id)] = 0
+
+    unread_notifications = (
+        Notification.objects.filter(is_read=False)
+        .values('user_id').annotate(n=Count('id')).order_by()
+    )
+    for row in unread_notifications:
+        expected[notification_key(row['user_id'])] = row['n']
+
+    unread_messages = (
+        Message.objects.filter(is_read=False, is_deleted=False)
+        .values('receiver_id', 'branch_id').annotate(n=Count('id')).order_by()
+    )
+    for row in unread_messages:
+        expected[message_key(row['receiver_id'])] += row['n']
+        if row['branch_id'] is not None:
+            expected[message_key(row['receiver_id'], row['branch_id'])] = row['n']
+
+    cache = _cache()
+    cached = cache.get_many(list(expected))
+    drifted = [
+        key for key, value in expected.items()
+        if key in cached and cached[key] != value
+    ]
+    cache.set_many(expected, timeout=None)
+    return len(expected), len(drifted)
@@ -3,18 +3,112 @@ from .models import TrainingRecord
 from .models import Report
 from django.forms import inlineformset_factory
 from django.core.exceptions import ValidationError
+from django.urls import reverse_lazy
 from .models import (
     VetTask, SupportTicket, TicketReply, Animal, Message, 
     MedicalRecord, AnimalLog, EquipmentLog, EmergencyIncident,
-    DailyActivityReport
+    DailyActivityReport, Branch
 )
 from accounts.models import CustomUser
+from .uploads import get_completed_upload, validate_uploaded_file
+
+
+class AnimalLookupWidget(forms.TextInput):
+    """
+    Force-number text box whose suggestions are fetched as the user types
+    (static/js/animal_lookup.js), instead of a <select> of every animal.
+    """
+    template_name = 'core/widgets/animal_lookup.html'
+
+    def __init__(self, attrs=None):
+        defaults = {
+            'autocomplete': 'off',
+            'placeholder': 'Force number or name',
+            'data-animal-lookup': reverse_lazy('animal_autocomplete'),
+        }
+        super().__init__({**defaults, **(attrs or {})})
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        widget_attrs = context['widget']['attrs']
+        widget_attrs['list'] = f"{widget_attrs.get('id') or name}_options"
+        return context
+
+
+class AnimalLookupField(forms.ModelChoiceField):
+    """Chooses an animal from `queryset` by its force number"""
+    widget = AnimalLookupWidget
+
+    def __init__(self, queryset=None, **kwargs):
+        kwargs['to_field_name'] = 'force_number'
+        super().__init__(Animal.objects.all() if queryset is None else queryset, **kwargs)
+
+    def prepare_value(self, value):
+        # A ModelForm's initial data holds the primary key, not the force number.
+        if isinstance(value, int):
+            return self.queryset.filter(pk=value).values_list('force_number', flat=True).first()
+        return super().prepare_value(value)
+
+
+class UploadReference(str):
+    """The id of a finished chunked upload, as submitted in place of a file"""
+
+
+class ChunkedFileInput(forms.ClearableFileInput):
+    """
+    File input that sends the chosen file in resumable chunks
+    (static/js/chunked_upload.js) and submits only the upload's id, in a
+    hidden '<name>_upload' input, with the form.
+    """
+    template_name = 'core/widgets/chunked_upload.html'
+
+    def __init__(self, purpose, attrs=None):
+        self.purpose = purpose
+        defaults = {'data-chunked-upload': reverse_lazy('upload_start'), 'data-purpose': purpose}
+        super().__init__({**defaults, **(attrs or {})})
+
+    def value_from_datadict(self, data, files, name):
+        upload_id = data.get(f'{name}_upload')
+        if upload_id:
+            return UploadReference(upload_id)
+        return super().value_from_datadict(data, files, name)
+
+    def value_omitted_from_data(self, data, files, name):
+        return super().value_omitted_from_data(data, files, name) and f'{name}_upload' not in data
+
+
+class ChunkedUploadField(forms.FileField):
+    """
+    FileField accepting either a finished chunked upload (see core.uploads)
+    or, without JavaScript, a normally posted file; both are checked for
+    type, size and the branch quota. Forms call bind() with the user and
+    branch the upload is charged to.
+    """
+
+    def __init__(self, purpose, **kwargs):
+        self.purpose = purpose
+        self.user = self.branch = None
+        kwargs['widget'] = ChunkedFileInput(purpose)
+        super().__init__(**kwargs)
+
+    def bind(self, user, branch):
+        self.user, self.branch = user, branch
+
+    def clean(self, data, initial=None):
+        if isinstance(data, UploadReference):
+            # A stored name: the model field keeps it without saving a file.
+            return get_completed_upload(data, self.user, self.purpose).blob_name
+        cleaned = super().clean(data, initial)
+        if cleaned and cleaned is not initial and hasattr(cleaned, 'size'):
+            validate_uploaded_file(self.purpose, cleaned, self.branch)
+        return cleaned
 
 
 class VetTaskForm(forms.ModelForm):
     class Meta:
         model = VetTask
         fields = ['title', 'description', 'animal', 'assigned_to', 'priority', 'due_date', 'notes']
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'description': forms.Textarea(attrs={'rows': 4}),
             'notes': forms.Textarea(attrs={'rows': 3}),
@@ -87,7 +181,38 @@ class AnimalForm(forms.ModelForm):
         return force_number
 
 
+class AnimalImportForm(forms.ModelForm):
+    """Validates one row of a bulk animal import (see core.animal_io)"""
+
+    class Meta:
+        model = Animal
+        fields = ['force_number', 'name', 'species', 'breed', 'age', 'date_of_birth', 'owner_name']
+
+    def validate_unique(self):
+        # force_number uniqueness is checked against the importer's in-memory set
+        pass
+
+
+class AnimalImportUploadForm(forms.Form):
+    file = forms.FileField(help_text="CSV or XLSX file, one row per animal or training record")
+    branch = forms.ModelChoiceField(queryset=Branch.objects.filter(is_active=True), required=False)
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+        if not user or user.role != 'superadmin':
+            del self.fields['branch']
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if not upload.name.lower().endswith(('.csv', '.xlsx')):
+            raise ValidationError("Upload a .csv or .xlsx file.")
+        return upload
+
+
 class MedicalRecordForm(forms.ModelForm):
+    document = ChunkedUploadField('medical_document', required=False)
+
     class Meta:
         model = MedicalRecord
         fields = [
@@ -100,6 +225,7 @@ class MedicalRecordForm(forms.ModelForm):
             'dip_type', 'dipping_location', 'surgery_type', 'anesthesia_used',
             'vaccine_name', 'next_due_date'
         ]
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'diagnosis': forms.Textarea(attrs={'rows': 4}),
             'treatment': forms.Textarea(attrs={'rows': 4}),
@@ -114,6 +240,7 @@ class MedicalRecordForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
+        self.fields['document'].bind(user, getattr(user, 'branch', None))
         if user and user.branch:
             # Only show animals from the same branch
             self.fields['animal'].queryset = Animal.objects.filter(branch=user.branch)
@@ -123,6 +250,7 @@ class AnimalLogForm(forms.ModelForm):
     class Meta:
         model = AnimalLog
         fields = ['animal', 'activity_type', 'notes', 'photo']
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'notes': forms.Textarea(attrs={'rows': 4}),
         }
@@ -148,6 +276,7 @@ class EmergencyIncidentForm(forms.ModelForm):
     class Meta:
         model = EmergencyIncident
         fields = ['animal', 'incident_type', 'severity', 'description', 'photo', 'location']
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'description': forms.Textarea(attrs={'rows': 4}),
         }
@@ -245,7 +374,7 @@ class TrainingRecordForm(forms.ModelForm):
             cleaned_data.get('training_narcotics'),
         ]
 
-        has_other_training = cleaned_data.get('training_other', '').strip()
+        has_other_training = (cleaned_data.get('training_other') or '').strip()
 
         if not any(training_types) and not has_other_training:
             raise forms.ValidationError(
@@ -256,6 +385,8 @@ class TrainingRecordForm(forms.ModelForm):
 
 
 class ReportForm(forms.ModelForm):
+    file = ChunkedUploadField('report_file', required=False)
+
     class Meta:
         model = Report
         fields = ['title', 'report_type', 'specific_report_type', 'description', 'file']
@@ -264,6 +395,7 @@ class ReportForm(forms.ModelForm):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
         self.role_category_value = None  # default
+        self.fields['file'].bind(user, getattr(user, 'branch', None))
 
         if user:
             role = getattr(user, 'role', None)
@@ -0,0 +1,123 @@
+"""
+Dashboard fragment cache.
+
+Sidebars, stats cards and recent-item lists look the same for everyone with
+the same role in the same branch, so they are rendered once and kept in the
+cache named by FRAGMENT_CACHE:
+
+    {% load fragments %}
+    {% cachefragment "vet_stats" branch=branch depends="stats" %}
+      ...
+    {% endcachefragment %}
+
+A fragment is keyed by its name, the user's role, the branch, any extra
+vary-on values and the current version token of each topic it `depends` on.
+Writes to the models in FRAGMENT_SOURCES bump their topic's token for the
+row's branch and for 'all' (core.signals), and apply_stat_deltas bumps
+'stats', so a cached fragment is never served after the data under it
+changed; the old entries simply expire. Fragments without a branch read the
+'all' tokens. Views pass lazy values (querysets, SimpleLazyObject) so a
+cache hit skips the queries as well as the rendering.
+"""
+import hashlib
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from accounts.models import CustomUser
+from .branches import get_branch
+from .models import Animal, VetTask, MedicalRecord, SupportTicket, DailyActivityReport, ActivityEvent, Branch
+
+ALL_BRANCHES = 'all'
+
+# `branch` is the value lookup giving a row's branch id.
+FragmentSource = namedtuple('FragmentSource', ['topic', 'model', 'branch'])
+
+FRAGMENT_SOURCES = [
+    FragmentSource('animals', Animal, 'branch_id'),
+    FragmentSource('tasks', VetTask, 'branch_id'),
+    FragmentSource('records', MedicalRecord, 'animal__branch_id'),
+    FragmentSource('tickets', SupportTicket, 'branch_id'),
+    FragmentSource('reports', DailyActivityReport, 'branch_id'),
+    FragmentSource('users', CustomUser, 'branch_id'),
+    FragmentSource('activity', ActivityEvent, 'branch_id'),
+    FragmentSource('branches', Branch, 'pk'),
+]
+
+
+def _cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE', 'default')]
+
+
+def version_key(topic, scope):
+    return f'fragments:version:{topic}:{scope}'
+
+
+def get_fragment_source(model):
+    for source in FRAGMENT_SOURCES:
+        if source.model is model:
+            return source
+    return None
+
+
+def bump_fragment_versions(topics, branch_ids):
+    """New tokens for `topics` in each branch and in 'all', now and again after commit"""
+    scopes = {branch_id for branch_id in branch_ids if branch_id is not None} | {ALL_BRANCHES}
+    keys = [version_key(topic, scope) for topic in topics for scope in scopes]
+
+    def bump():
+        _cache().set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+
+    bump()
+    # Re-bump once the rows are visible, in case another request rendered
+    # the old data under the first token meanwhile.
+    transaction.on_commit(bump)
+
+
+def _versions(topics, scope):
+    cache = _cache()
+    keys = [version_key(topic, scope) for topic in topics]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # A fresh token rather than a default, so an evicted token can't
+            # bring back fragments cached under an older one.
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _branch_scope(branch):
+    if branch is None or branch == '':
+        return ALL_BRANCHES
+    if isinstance(branch, Branch):
+        return branch.pk
+    if isinstance(branch, int):
+        return branch
+    found = get_branch(str(branch))
+    return found.pk if found else None
+
+
+def render_fragment(name, render, role='', branch=None, depends=(), vary_on=()):
+    """
+    The cached output of `render()` for this name, role, branch and vary-on
+    values at the current versions of the `depends` topics. Branch names the
+    registry doesn't know are rendered uncached.
+    """
+    scope = _branch_scope(branch)
+    if scope is None:
+        return render()
+    topics = sorted(set(depends))
+    parts = [name, role or '', scope, *vary_on, *zip(topics, _versions(topics, scope))]
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    key = f'fragments:{name}:{digest}'
+
+    cache = _cache()
+    output = cache.get(key)
+    if output is None:
+        output = render()
+        cache.set(key, output, timeout=getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 600))
+    return output
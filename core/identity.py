@@ -0,0 +1,112 @@
+"""
+Cached identity for authenticated requests.
+
+Django's AuthenticationMiddleware loads request.user from the database on
+every request, and views then follow request.user.branch. CachedUserBackend
+(AUTHENTICATION_BACKENDS) serves the user from a snapshot kept in the cache
+named by USER_SNAPSHOT_CACHE instead: the user's column values, plus their
+Django permission set once it has been checked, keyed by user id. Each
+user shares one snapshot across all their sessions. The password hash is
+left out; the snapshot carries the session auth hash derived from it, and
+the password is loaded on first access like a deferred field:
+
+    request.user.role                 # no query
+    request.user.branch.name          # from core.branches, no query
+    request.user.has_perm('core.x')   # no query after the first check
+
+With sessions in the cache as well (SESSION_ENGINE), identity and
+authorization cost no queries once a snapshot exists. Saving or deleting a
+user, or changing their groups or permissions, drops their snapshot
+(core.signals). Changing a group's permissions bumps a version token that
+every snapshot is checked against (an evicted token is replaced by a fresh
+one rather than read as empty). The branch is not part of the snapshot:
+it is looked up in the branch registry, which tracks Branch edits by
+itself.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import transaction
+
+from accounts.models import CustomUser
+from .branches import get_branch_by_id
+
+VERSION_KEY = 'users:version'
+
+# Kept out of the snapshot.
+SECRET_FIELDS = {'password'}
+
+
+def _cache():
+    return caches[getattr(settings, 'USER_SNAPSHOT_CACHE', 'default')]
+
+
+def snapshot_key(user_id):
+    return f'users:snapshot:{user_id}'
+
+
+def invalidate_user_snapshot(user_id):
+    """Drop one user's snapshot now and again once the transaction commits"""
+    _cache().delete(snapshot_key(user_id))
+    transaction.on_commit(lambda: _cache().delete(snapshot_key(user_id)))
+
+
+def invalidate_all_user_snapshots():
+    transaction.on_commit(lambda: _cache().set(VERSION_KEY, uuid.uuid4().hex, timeout=None))
+
+
+class CachedUserBackend(ModelBackend):
+    """ModelBackend whose get_user() reads the per-user snapshot"""
+
+    def get_user(self, user_id):
+        cache = _cache()
+        key = snapshot_key(user_id)
+        cached = cache.get_many([VERSION_KEY, key])
+        version = cached.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(VERSION_KEY)
+        snapshot = cached.get(key)
+        if snapshot is None or snapshot['version'] != version:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            snapshot = {
+                'version': version,
+                'values': {
+                    field.attname: getattr(user, field.attname)
+                    for field in CustomUser._meta.concrete_fields if field.attname not in SECRET_FIELDS
+                },
+                'session_auth_hash': user.get_session_auth_hash(),
+                'permissions': None,
+            }
+            cache.set(key, snapshot, timeout=getattr(settings, 'USER_SNAPSHOT_TIMEOUT', 3600))
+        return self._restore(snapshot)
+
+    def _restore(self, snapshot):
+        values = snapshot['values']
+        names = [field.attname for field in CustomUser._meta.concrete_fields if field.attname in values]
+        user = CustomUser.from_db(CustomUser.objects.db, names, [values[name] for name in names])
+        if not self.user_can_authenticate(user):
+            return None
+        # A branch missing from the registry was deleted (SET_NULL).
+        user.branch = get_branch_by_id(user.branch_id) if user.branch_id else None
+        user._session_auth_hash = snapshot['session_auth_hash']
+        if snapshot['permissions'] is not None:
+            user._perm_cache = set(snapshot['permissions'])
+        return user
+
+    def get_all_permissions(self, user_obj, obj=None):
+        loaded = hasattr(user_obj, '_perm_cache')
+        permissions = super().get_all_permissions(user_obj, obj)
+        if not loaded and hasattr(user_obj, '_perm_cache'):
+            # First permission check since the snapshot was taken: keep the set
+            cache = _cache()
+            key = snapshot_key(user_obj.pk)
+            snapshot = cache.get(key)
+            if snapshot is not None and snapshot['permissions'] is None:
+                snapshot['permissions'] = sorted(permissions)
+                cache.set(key, snapshot, timeout=getattr(settings, 'USER_SNAPSHOT_TIMEOUT', 3600))
+        return permissions
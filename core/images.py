@@ -0,0 +1,178 @@
+"""
+Thumbnails for uploaded photos.
+
+Animal, AnimalLog and EmergencyIncident keep the original upload in `photo`
+and a description of its derivatives in `photo_variants`:
+
+    {'hash': '<sha256 of the original>', 'width': 4032, 'height': 3024,
+     'sizes': [96, 320, 960]}
+
+Each size exists as WebP and JPEG under
+`thumbs/<hash[:2]>/<hash>/<width>.<webp|jpeg>` in the default storage, so the
+derivative cache is keyed by content: re-uploading the same picture, or the
+same picture on another record, reuses the files already there. Derivatives
+are auto-rotated from the EXIF orientation and written without any EXIF
+(GPS, camera serials). The original is re-encoded the same way before it is
+stored (strip_metadata), so a linked original does not leak the location
+either.
+
+The receivers in core.signals queue a core.tasks.make_thumbnails job for
+changed photos once the transaction commits; under `manage.py test` the job
+runs immediately (JOB_QUEUE_ASYNC = False).
+Templates render them with {% responsive_image %} from core.templatetags.images.
+"""
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .models import Animal, AnimalLog, EmergencyIncident
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (96, 320, 960)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVE_ROOT = 'thumbs'
+# Formats whose originals are re-encoded without metadata, with their save
+# options; JPEG keeps the source quantisation so the re-encode is near-lossless.
+STRIPPED_FORMATS = {
+    'JPEG': {'quality': 'keep', 'subsampling': 'keep'},
+    'PNG': {'optimize': True},
+    'WEBP': {'lossless': True},
+}
+EXIF_ORIENTATION = 0x0112
+
+# (model, image field) pairs that get derivatives in '<field>_variants'.
+PHOTO_FIELDS = [
+    (Animal, 'photo'),
+    (AnimalLog, 'photo'),
+    (EmergencyIncident, 'photo'),
+]
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def derivative_name(digest, width, ext):
+    return f'{DERIVATIVE_ROOT}/{digest[:2]}/{digest}/{width}.{ext}'
+
+
+def content_hash(field_file):
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+
+def _target_widths(width):
+    """The standard widths narrower than the original; the original width if it is smaller than all of them"""
+    return [size for size in THUMBNAIL_WIDTHS if size < width] or [width]
+
+
+def _encode(image, width, image_format, options):
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    # Saving a fresh RGB image without exif= drops every metadata block.
+    resized.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def strip_metadata(upload):
+    """
+    The upload re-encoded without EXIF (GPS, camera serials), XMP or text
+    chunks, turned upright from the EXIF orientation; None for files that are
+    not images in one of STRIPPED_FORMATS, which are stored as uploaded.
+    """
+    upload.seek(0)
+    try:
+        with Image.open(upload) as source:
+            options = STRIPPED_FORMATS.get(source.format)
+            if options is None:
+                return None
+            image_format = source.format
+            if source.getexif().get(EXIF_ORIENTATION, 1) != 1:
+                image = ImageOps.exif_transpose(source)
+                if image_format == 'JPEG':
+                    options = {'quality': 95}
+            else:
+                source.load()
+                image = source
+            buffer = io.BytesIO()
+            # Only the colour profile is carried over; exif= and the text
+            # chunks are not passed on, so they are dropped.
+            image.save(buffer, format=image_format, icc_profile=source.info.get('icc_profile'), **options)
+    except (OSError, Image.DecompressionBombError):
+        return None
+    finally:
+        upload.seek(0)
+    return buffer.getvalue()
+
+
+def generate_derivatives(field_file, storage=None):
+    """Write the thumbnails of an uploaded image (unless cached) and return its variants dict"""
+    storage = storage or default_storage
+    digest = content_hash(field_file)
+
+    field_file.open('rb')
+    try:
+        with Image.open(field_file) as source:
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    finally:
+        field_file.close()
+    if image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+
+    sizes = _target_widths(image.width)
+    for width in sizes:
+        for ext, (image_format, options) in THUMBNAIL_FORMATS.items():
+            name = derivative_name(digest, width, ext)
+            if not storage.exists(name):
+                storage.save(name, ContentFile(_encode(image, width, image_format, options)))
+    return {'hash': digest, 'width': image.width, 'height': image.height, 'sizes': sizes}
+
+
+def process_photo(model, pk, field_name='photo'):
+    """
+    (Re)build the derivatives for one row and store its variants. The update
+    only applies if the row still holds the same file, so a worker that lags
+    behind a newer upload cannot overwrite the newer variants.
+    """
+    instance = model.objects.filter(pk=pk).only(field_name).first()
+    if instance is None:
+        return None
+    field_file = getattr(instance, field_name)
+    variants = {}
+    if field_file:
+        same_file = Q(**{field_name: field_file.name})
+        try:
+            variants = generate_derivatives(field_file)
+        except (OSError, Image.DecompressionBombError):
+            logger.exception("Could not make thumbnails for %s %s (%s)", model.__name__, pk, field_file.name)
+    else:
+        same_file = Q(**{field_name: ''}) | Q(**{f'{field_name}__isnull': True})
+    model.objects.filter(same_file, pk=pk).update(**{variants_field(field_name): variants})
+    return variants
+
+
+def schedule_photo_processing(model, pk, field_name='photo'):
+    """Make the derivatives in a background job (see core.jobs)"""
+    from .tasks import make_thumbnails
+
+    make_thumbnails.delay(model._meta.label, pk, field_name)
@@ -0,0 +1,231 @@
+"""
+Database-backed background jobs.
+
+Slow side effects (notification fan-out, thumbnails) are declared as tasks
+and queued as Job rows instead of running in the request:
+
+    @background_task(max_attempts=3)
+    def notify_branch_admins(branch_id, title, message):
+        ...
+
+    notify_branch_admins.delay(branch.id, 'New animal', text)
+
+`delay()` queues the job when the surrounding transaction commits, so a
+worker never sees a job for rows that were rolled back. Arguments must be
+JSON-serializable (pass ids, not model instances). Workers started with
+`manage.py run_jobs` claim due jobs, run them and retry failures with
+exponential backoff; a job whose worker died is requeued after
+JOB_LOCK_TIMEOUT, or failed if that was its last attempt. Tasks declared with `every=timedelta(...)` are enqueued
+once per period by whichever worker gets there first.
+
+With JOB_QUEUE_ASYNC = False (the default under `manage.py test`) `delay()`
+runs the task immediately instead.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+class Task:
+
+    def __init__(self, func, name, max_attempts, retry_delay, priority, every):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.priority = priority
+        self.every = every
+        self.__doc__ = func.__doc__
+        self.__wrapped__ = func
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<Task {self.name}>"
+
+    def delay(self, *args, **kwargs):
+        """Run in a worker once the current transaction commits"""
+        return self.schedule(None, *args, **kwargs)
+
+    def schedule(self, run_at, *args, **kwargs):
+        """Run in a worker at `run_at` (a datetime, or a timedelta from now)"""
+        if not getattr(settings, 'JOB_QUEUE_ASYNC', True):
+            self.func(*args, **kwargs)
+            return None
+        if isinstance(run_at, timedelta):
+            run_at = timezone.now() + run_at
+        job = Job(
+            task=self.name, priority=self.priority, max_attempts=self.max_attempts,
+            run_at=run_at or timezone.now(),
+            # Round-trip through JSON now, so bad arguments fail in the caller.
+            args=json.loads(json.dumps(list(args), cls=DjangoJSONEncoder)),
+            kwargs=json.loads(json.dumps(kwargs, cls=DjangoJSONEncoder)),
+        )
+        transaction.on_commit(job.save)
+        return job
+
+
+def background_task(func=None, *, name=None, max_attempts=5, retry_delay=30, priority=0, every=None):
+    """
+    Register a function as a background task; see the module docstring.
+    `retry_delay` is the first backoff in seconds, doubled on each retry.
+    """
+    def register(func):
+        task = Task(
+            func, name or f'{func.__module__}.{func.__qualname__}',
+            max_attempts=max_attempts, retry_delay=retry_delay, priority=priority, every=every,
+        )
+        TASKS[task.name] = task
+        return task
+    return register(func) if func is not None else register
+
+
+def load_tasks():
+    """Import every installed app's `tasks` module so its tasks are registered"""
+    autodiscover_modules('tasks')
+
+
+# ------------------------------
+# Running jobs
+# ------------------------------
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def retry_backoff(task, attempts):
+    """Seconds to wait after `attempts` failures: doubling, capped at an hour, with jitter"""
+    delay = min(task.retry_delay * 2 ** (attempts - 1), 3600)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_jobs(worker, limit=10, now=None):
+    """Mark up to `limit` due jobs as running for `worker` and return them"""
+    now = now or timezone.now()
+    due = Job.objects.filter(status='queued', run_at__lte=now).order_by('priority', 'run_at')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('pk', flat=True)[:limit])
+        # The status condition keeps two workers from claiming the same job
+        # on databases without SKIP LOCKED.
+        Job.objects.filter(pk__in=ids, status='queued').update(
+            status='running', locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(pk__in=ids, status='running', locked_by=worker, locked_at=now))
+
+
+def run_job(job):
+    """
+    Run one claimed job, then record success, a retry or the final failure.
+    The outcome is only recorded while the claim is still this one's: a job
+    requeued by requeue_stale_jobs meanwhile belongs to its next run.
+    """
+    task = TASKS.get(job.task)
+    claim = Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by, locked_at=job.locked_at)
+    try:
+        if task is None:
+            raise LookupError(f"Unknown task '{job.task}'")
+        task.func(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) failed, attempt %d/%d", job.pk, job.task, job.attempts, job.max_attempts)
+        if task is not None and job.attempts < job.max_attempts:
+            retry_at = timezone.now() + timedelta(seconds=retry_backoff(task, job.attempts))
+            recorded = claim.update(status='queued', run_at=retry_at, last_error=error, locked_by='')
+        else:
+            recorded = claim.update(status='failed', last_error=error, finished_at=timezone.now())
+        succeeded = False
+    else:
+        recorded = claim.update(status='done', finished_at=timezone.now(), last_error='')
+        succeeded = True
+    if not recorded:
+        logger.warning("Job %s (%s) was requeued while it ran; its outcome was not recorded", job.pk, job.task)
+    return succeeded
+
+
+def requeue_stale_jobs(now=None):
+    """
+    Put back jobs whose worker stopped answering, or mark them failed once
+    they have used all their attempts; returns how many
+    """
+    now = now or timezone.now()
+    timeout = getattr(settings, 'JOB_LOCK_TIMEOUT', timedelta(minutes=15))
+    stale = Job.objects.filter(status='running', locked_at__lt=now - timeout)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', locked_by='', finished_at=now, last_error='Worker stopped answering on the last attempt',
+    )
+    return failed + stale.update(status='queued', locked_by='')
+
+
+# Periods this process has already queued, to skip the INSERT on every poll.
+_queued_slots = {}
+
+
+def enqueue_periodic_tasks(now=None):
+    """Queue one run of every periodic task for the current period"""
+    now = now or timezone.now()
+    for task in TASKS.values():
+        if not task.every:
+            continue
+        slot = int(now.timestamp() // task.every.total_seconds())
+        if _queued_slots.get(task.name) == slot:
+            continue
+        _queued_slots[task.name] = slot
+        try:
+            with transaction.atomic():
+                Job.objects.create(
+                    task=task.name, priority=task.priority, max_attempts=task.max_attempts,
+                    run_at=now, unique_key=f'{task.name}@{slot}',
+                )
+        except IntegrityError:
+            pass  # another worker queued this period already
+
+
+def run_pending(worker=None, limit=10):
+    """Claim and run one batch of due jobs; returns how many ran"""
+    worker = worker or worker_name()
+    enqueue_periodic_tasks()
+    requeue_stale_jobs()
+    jobs = claim_jobs(worker, limit=limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+def run_worker(poll_interval=2.0, batch_size=10, stop=None):
+    """Work until `stop()` is true, sleeping `poll_interval` seconds when idle"""
+    load_tasks()
+    worker = worker_name()
+    logger.info("Job worker %s started", worker)
+    while not (stop and stop()):
+        if not run_pending(worker, limit=batch_size):
+            time.sleep(poll_interval)
+
+
+def get_job_metrics():
+    counts = dict(Job.objects.values_list('status').annotate(count=Count('pk')).order_by())
+    oldest = Job.objects.filter(status='queued', run_at__lte=timezone.now()).order_by('run_at').values_list('run_at', flat=True).first()
+    return {
+        **{status: counts.get(status, 0) for status, _ in Job.STATUS_CHOICES},
+        'oldest_due_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0,
+    }
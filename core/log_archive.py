@@ -0,0 +1,259 @@
+"""
+Monthly partitioning, retention and archive search for SystemLog.
+
+SystemLog rows are partitioned by calendar month of their timestamp. The live
+table keeps the current month plus the previous SYSTEM_LOG_RETENTION_MONTHS - 1
+months; older partitions are moved by the archive_system_logs command into
+gzip-compressed JSON-lines files under SYSTEM_LOG_ARCHIVE_DIR, named
+systemlog-YYYY-MM.<run>.jsonl.gz (one or more files per month). Next to
+each archive a small systemlog-YYYY-MM.<run>.index.json lists the user ids
+and actions it contains.
+
+search_system_logs() queries the live table and the archives together,
+counting a row that is in both (archived with --keep-rows) once. Archives
+whose index rules out the user or action filter are not decompressed.
+"""
+import gzip
+import json
+import os
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import SystemLog
+
+ARCHIVE_PREFIX = 'systemlog-'
+ARCHIVE_SUFFIX = '.jsonl.gz'
+INDEX_SUFFIX = '.index.json'
+
+LOG_FIELDS = ['id', 'user_id', 'username', 'role', 'branch', 'action', 'message', 'ip_address', 'timestamp']
+ACTION_LABELS = dict(SystemLog.ACTION_CHOICES)
+
+
+class LogRecord(namedtuple('LogRecord', LOG_FIELDS)):
+    """A SystemLog entry read from either the live table or an archive"""
+
+    def get_action_display(self):
+        return ACTION_LABELS.get(self.action, self.action)
+
+    def to_json(self):
+        data = self._asdict()
+        data['timestamp'] = self.timestamp.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, line):
+        data = json.loads(line)
+        data['timestamp'] = datetime.fromisoformat(data['timestamp'])
+        return cls(**data)
+
+
+# ------------------------------
+# Partitions
+# ------------------------------
+
+def month_start(year, month):
+    return datetime(year, month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(year, month, delta):
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
+
+
+def partition_bounds(year, month):
+    """[start, end) timestamps of a monthly partition"""
+    return month_start(year, month), month_start(*add_months(year, month, 1))
+
+
+def retention_cutoff(months=None, now=None):
+    """Start of the oldest month that stays in the live table"""
+    months = getattr(settings, 'SYSTEM_LOG_RETENTION_MONTHS', 6) if months is None else months
+    now = (now or timezone.now()).astimezone(dt_timezone.utc)
+    return month_start(*add_months(now.year, now.month, -(months - 1)))
+
+
+def expired_partitions(cutoff):
+    """(year, month) of every live partition that starts before the cutoff"""
+    months = (
+        SystemLog.objects.filter(timestamp__lt=cutoff)
+        .datetimes('timestamp', 'month', tzinfo=dt_timezone.utc)
+    )
+    return [(day.year, day.month) for day in months]
+
+
+def _live_records(queryset, limit=None):
+    rows = queryset.values(
+        'id', 'user_id', 'user__username', 'role', 'branch', 'branch_fk__name',
+        'action', 'message', 'ip_address', 'timestamp',
+    )
+    rows = rows[:limit] if limit is not None else rows.iterator(chunk_size=2000)
+    for row in rows:
+        yield LogRecord(
+            id=row['id'], user_id=row['user_id'], username=row['user__username'],
+            role=row['role'], branch=row['branch_fk__name'] or row['branch'],
+            action=row['action'], message=row['message'],
+            ip_address=row['ip_address'], timestamp=row['timestamp'],
+        )
+
+
+# ------------------------------
+# Archiving
+# ------------------------------
+
+def get_archive_dir(archive_dir=None):
+    return Path(archive_dir or getattr(settings, 'SYSTEM_LOG_ARCHIVE_DIR', 'log_archive'))
+
+
+def index_path(path):
+    """The index file next to an archive"""
+    return path.with_name(path.name[:-len(ARCHIVE_SUFFIX)] + INDEX_SUFFIX)
+
+
+def _write_atomically(tmp_path, path):
+    with open(tmp_path, 'rb') as written:
+        os.fsync(written.fileno())
+    os.replace(tmp_path, path)
+
+
+def archive_partition(year, month, archive_dir=None, delete=True):
+    """
+    Write one month of SystemLog rows to a new archive file and, once the
+    file is safely on disk, delete those rows. Returns (rows archived, path).
+    """
+    start, end = partition_bounds(year, month)
+    queryset = SystemLog.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by('-timestamp', '-id')
+    last_id = queryset.order_by('-id').values_list('id', flat=True).first()
+    if last_id is None:
+        return 0, None
+    queryset = queryset.filter(id__lte=last_id)
+
+    directory = get_archive_dir(archive_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    run = timezone.now().strftime('%Y%m%d%H%M%S%f')
+    path = directory / f'{ARCHIVE_PREFIX}{year:04d}-{month:02d}.{run}{ARCHIVE_SUFFIX}'
+    tmp_path = path.with_name(path.name + '.tmp')
+
+    count, user_ids, actions = 0, set(), set()
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as archive:
+        for record in _live_records(queryset):
+            archive.write(record.to_json() + '\n')
+            count += 1
+            user_ids.add(record.user_id)
+            actions.add(record.action)
+    # The index goes first, so every archive on disk has one unless it
+    # predates indexes (those are always read).
+    index = index_path(path)
+    tmp_index = index.with_name(index.name + '.tmp')
+    with open(tmp_index, 'w', encoding='utf-8') as index_file:
+        json.dump({'user_ids': sorted(user_ids, key=str), 'actions': sorted(actions)}, index_file)
+    _write_atomically(tmp_index, index)
+    _write_atomically(tmp_path, path)
+
+    if delete:
+        with transaction.atomic():
+            SystemLog.objects.filter(timestamp__gte=start, timestamp__lt=end, id__lte=last_id).delete()
+    return count, path
+
+
+def archive_expired_logs(months=None, archive_dir=None, delete=True, now=None):
+    """
+    Archive every partition older than the retention window; returns
+    [(year, month, rows, path)]. Without `delete` the rows stay live, so
+    months that already have an archive are skipped instead of written again.
+    """
+    archived = []
+    existing = archive_files(archive_dir) if not delete else {}
+    for year, month in expired_partitions(retention_cutoff(months, now)):
+        if (year, month) in existing:
+            continue
+        count, path = archive_partition(year, month, archive_dir, delete=delete)
+        archived.append((year, month, count, path))
+    return archived
+
+
+# ------------------------------
+# Search
+# ------------------------------
+
+def archive_files(archive_dir=None):
+    """{(year, month): [paths]} for every archive file on disk"""
+    directory = get_archive_dir(archive_dir)
+    files = {}
+    if not directory.is_dir():
+        return files
+    for path in directory.glob(f'{ARCHIVE_PREFIX}*{ARCHIVE_SUFFIX}'):
+        period = path.name[len(ARCHIVE_PREFIX):].split('.', 1)[0]
+        try:
+            year, month = (int(part) for part in period.split('-'))
+        except ValueError:
+            continue
+        files.setdefault((year, month), []).append(path)
+    return files
+
+
+def _may_match(path, user_id, action):
+    """False when the archive's index shows it has no row for the user or action"""
+    try:
+        with open(index_path(path), encoding='utf-8') as index:
+            contents = json.load(index)
+    except (OSError, ValueError):
+        return True
+    return (
+        (user_id is None or user_id in contents['user_ids'])
+        and (action is None or action in contents['actions'])
+    )
+
+
+def _matches(record, user_id, action, start, end):
+    return (
+        (user_id is None or record.user_id == user_id)
+        and (action is None or record.action == action)
+        and (start is None or record.timestamp >= start)
+        and (end is None or record.timestamp < end)
+    )
+
+
+def search_system_logs(user=None, action=None, start=None, end=None, limit=200, archive_dir=None):
+    """
+    Newest-first SystemLog records matching the filters, read from the live
+    table and, when it does not have `limit` matches, from the archives.
+    `user` may be a user or a user id; `start`/`end` bound the timestamp.
+    """
+    user_id = getattr(user, 'pk', user)
+    queryset = SystemLog.objects.all()
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    if action:
+        queryset = queryset.filter(action=action)
+    if start:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end:
+        queryset = queryset.filter(timestamp__lt=end)
+    records = list(_live_records(queryset.order_by('-timestamp', '-id'), limit))
+    # Rows archived with --keep-rows are both live and archived; ids are unique.
+    seen = {record.id for record in records}
+
+    for (year, month), paths in sorted(archive_files(archive_dir).items(), reverse=True):
+        month_from, month_to = partition_bounds(year, month)
+        if (start and month_to <= start) or (end and month_from >= end):
+            continue
+        # Archived months are older than the live table, so once we have enough
+        # newer records the remaining archives cannot contribute.
+        if len(records) >= limit and month_to <= records[limit - 1].timestamp:
+            break
+        for path in paths:
+            if not _may_match(path, user_id, action or None):
+                continue
+            with gzip.open(path, 'rt', encoding='utf-8') as archive:
+                for record in map(LogRecord.from_json, archive):
+                    if record.id not in seen and _matches(record, user_id, action or None, start, end):
+                        seen.add(record.id)
+                        records.append(record)
+        records.sort(key=lambda record: (record.timestamp, record.id), reverse=True)
+
+    return records[:limit]
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.log_archive import archive_expired_logs, get_archive_dir, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = "Move SystemLog partitions older than the retention window into compressed archive files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months', type=int, default=None,
+            help="Months to keep in the live table (default: SYSTEM_LOG_RETENTION_MONTHS)",
+        )
+        parser.add_argument('--archive-dir', default=None, help="Default: SYSTEM_LOG_ARCHIVE_DIR")
+        parser.add_argument(
+            '--keep-rows', action='store_true',
+            help="Write the archive files but leave the rows in the live table (months already archived are skipped)",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options['months'])
+        archived = archive_expired_logs(
+            months=options['months'], archive_dir=options['archive_dir'], delete=not options['keep_rows'],
+        )
+        for year, month, count, path in archived:
+            self.stdout.write(f"{year:04d}-{month:02d}: {count} rows -> {path}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {len(archived)} partitions older than {cutoff:%Y-%m} "
+            f"into {get_archive_dir(options['archive_dir'])}."
+        ))
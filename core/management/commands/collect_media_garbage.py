@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from core.storage import adopt_legacy_files, collect_garbage, recount_blob_references
+from core.uploads import expire_upload_sessions
+
+
+class Command(BaseCommand):
+    help = "Delete unreferenced upload blobs and idle upload sessions; optionally recount references or adopt pre-blob uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Keep unreferenced blobs this long (uploads still being saved)")
+        parser.add_argument('--recount', action='store_true', help="Recompute reference counts from the tables first")
+        parser.add_argument('--adopt', action='store_true',
+                            help="Move uploads from before the blob store into it, dropping duplicates")
+        parser.add_argument('--dry-run', action='store_true', help="Report without changing anything")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['adopt']:
+            adopted = adopt_legacy_files(dry_run=dry_run)
+            blobs = len(set(adopted.values()))
+            self.stdout.write(f"Adopted {len(adopted)} uploads into {blobs} blobs.")
+        if (options['recount'] or options['adopt']) and not dry_run:
+            referenced = recount_blob_references()
+            self.stdout.write(f"Recounted references: {referenced} blobs in use.")
+
+        if not dry_run:
+            expired = expire_upload_sessions()
+            self.stdout.write(f"Expired {expired} idle upload sessions.")
+
+        deleted, freed = collect_garbage(grace=timedelta(hours=options['grace_hours']), dry_run=dry_run)
+        verb = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} blobs ({filesizeformat(freed)})."))
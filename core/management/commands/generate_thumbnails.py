@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.images import PHOTO_FIELDS, process_photo, variants_field
+
+
+class Command(BaseCommand):
+    help = "Make thumbnails for photos that have none (all photos with --all)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild the variants of every photo")
+
+    def handle(self, *args, **options):
+        for model, field_name in PHOTO_FIELDS:
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            if not options['all']:
+                rows = rows.filter(**{variants_field(field_name): {}})
+            done = 0
+            for pk in rows.values_list('pk', flat=True).iterator():
+                if process_photo(model, pk, field_name):
+                    done += 1
+            self.stdout.write(self.style.SUCCESS(f"{model._meta.verbose_name_plural}: {done} photos processed."))
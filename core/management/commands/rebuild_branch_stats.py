@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.stats import rebuild_branch_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the BranchStats and BranchDailyStats tables from scratch"
+
+    def handle(self, *args, **options):
+        branches, days = rebuild_branch_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt statistics for {branches} branches ({days} daily rows)."
+        ))
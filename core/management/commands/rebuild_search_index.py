@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from scratch"
+
+    def handle(self, *args, **options):
+        counts = rebuild_search_index()
+        summary = ', '.join(f"{count} {kind}" for kind, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Indexed {summary}."))
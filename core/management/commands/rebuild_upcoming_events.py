@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.reminders import rebuild_upcoming_events
+
+
+class Command(BaseCommand):
+    help = "Rebuild the upcoming events the reminders are sent from"
+
+    def handle(self, *args, **options):
+        counts = rebuild_upcoming_events()
+        summary = ', '.join(f"{count} from {source}" for source, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Wrote {summary}."))
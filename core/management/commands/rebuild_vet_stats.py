@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.performance import rebuild_vet_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-veterinarian daily performance rollups from scratch"
+
+    def handle(self, *args, **options):
+        rows = rebuild_vet_stats()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} vet daily stats rows."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.counters import reconcile_unread_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the cached unread notification/message counters (run periodically, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        checked, drifted = reconcile_unread_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {checked} unread counters ({drifted} had drifted)."
+        ))
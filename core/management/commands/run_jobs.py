@@ -0,0 +1,56 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.jobs import load_tasks, run_pending, run_worker
+
+
+def _work(poll_interval, batch_size):
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    try:
+        run_worker(poll_interval=poll_interval, batch_size=batch_size, stop=lambda: bool(stopping))
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = "Run background job workers (core.jobs)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes to start")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--batch-size', type=int, default=10, help="Jobs claimed at a time per worker")
+        parser.add_argument('--once', action='store_true', help="Run the jobs due now in this process and exit")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            load_tasks()
+            total = 0
+            while ran := run_pending(limit=options['batch_size']):
+                total += ran
+            self.stdout.write(self.style.SUCCESS(f"Ran {total} jobs."))
+            return
+
+        if options['processes'] <= 1:
+            _work(options['poll_interval'], options['batch_size'])
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=_work, args=(options['poll_interval'], options['batch_size']), daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Started {len(workers)} job workers.")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+                worker.join()
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_message_branch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('animal_count', models.IntegerField(default=0)),
+                ('task_count', models.IntegerField(default=0)),
+                ('tasks_pending', models.IntegerField(default=0)),
+                ('tasks_in_progress', models.IntegerField(default=0)),
+                ('tasks_completed', models.IntegerField(default=0)),
+                ('tasks_cancelled', models.IntegerField(default=0)),
+                ('medical_record_count', models.IntegerField(default=0)),
+                ('tickets_open', models.IntegerField(default=0)),
+                ('tickets_in_progress', models.IntegerField(default=0)),
+                ('tickets_resolved', models.IntegerField(default=0)),
+                ('tickets_closed', models.IntegerField(default=0)),
+                ('report_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='core.branch')),
+            ],
+            options={
+                'verbose_name_plural': 'Branch stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='BranchDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('animals_added', models.IntegerField(default=0)),
+                ('tasks_created', models.IntegerField(default=0)),
+                ('medical_records_added', models.IntegerField(default=0)),
+                ('tickets_opened', models.IntegerField(default=0)),
+                ('report_count', models.IntegerField(default=0)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.branch')),
+            ],
+            options={
+                'verbose_name_plural': 'Branch daily stats',
+                'ordering': ['-date'],
+                'unique_together': {('branch', 'date')},
+            },
+        ),
+    ]
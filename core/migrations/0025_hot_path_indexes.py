@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_branchstats_branchdailystats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['animal', '-date_recorded'], name='medrec_animal_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['veterinarian', '-date_recorded'], name='medrec_vet_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['receiver', '-timestamp'], name='message_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['receiver', '-timestamp'], name='message_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', '-timestamp'], name='message_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at'], name='notif_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', '-created_at'], name='notif_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supportticket',
+            index=models.Index(fields=['branch', 'status', '-created_at'], name='ticket_branch_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['-timestamp'], name='systemlog_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vettask',
+            index=models.Index(fields=['branch', 'status', '-created_at'], name='vettask_branch_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vettask',
+            index=models.Index(fields=['assigned_to', '-date_assigned'], name='vettask_assignee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vettask',
+            index=models.Index(fields=['assigned_by', '-created_at'], name='vettask_assigner_idx'),
+        ),
+    ]
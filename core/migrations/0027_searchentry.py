@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The full-text side of the index lives outside the ORM: an external-content
+# FTS5 table kept in sync by triggers on SQLite, and a generated tsvector
+# column with a GIN index on PostgreSQL. Other backends fall back to LIKE.
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE core_searchentry_fts USING fts5("
+    "title, body, content='core_searchentry', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER core_searchentry_fts_ai AFTER INSERT ON core_searchentry BEGIN "
+    "INSERT INTO core_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER core_searchentry_fts_ad AFTER DELETE ON core_searchentry BEGIN "
+    "INSERT INTO core_searchentry_fts(core_searchentry_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); END",
+    "CREATE TRIGGER core_searchentry_fts_au AFTER UPDATE ON core_searchentry BEGIN "
+    "INSERT INTO core_searchentry_fts(core_searchentry_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO core_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS core_searchentry_fts_au",
+    "DROP TRIGGER IF EXISTS core_searchentry_fts_ad",
+    "DROP TRIGGER IF EXISTS core_searchentry_fts_ai",
+    "DROP TABLE IF EXISTS core_searchentry_fts",
+]
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE core_searchentry ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED",
+    "CREATE INDEX core_searchentry_vector_idx ON core_searchentry USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS core_searchentry_vector_idx",
+    "ALTER TABLE core_searchentry DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+def index_existing_rows(apps, schema_editor):
+    # Existing rows get their entries here, so search works right after the
+    # deploy; the documents come from core.search, built on historical models.
+    from core.search import SEARCH_SOURCES
+
+    SearchEntry = apps.get_model('core', 'SearchEntry')
+    for source in SEARCH_SOURCES:
+        model = apps.get_model('core', source.model.__name__)
+        entries = []
+        for row in model.objects.select_related(*source.related).iterator(chunk_size=1000):
+            document = source.document(row)
+            entries.append(SearchEntry(
+                kind=source.kind, object_id=row.pk, branch_id=document['branch_id'],
+                title=document['title'][:255], body=document['body'] or '', url=document['url'],
+            ))
+            if len(entries) >= 1000:
+                SearchEntry.objects.bulk_create(entries)
+                entries = []
+        SearchEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_alter_customuser_branch'),
+        ('core', '0026_systemlog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=30)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('url', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.branch')),
+            ],
+            options={
+                'verbose_name_plural': 'Search entries',
+                'indexes': [models.Index(fields=['branch', 'kind'], name='search_branch_kind_idx')],
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+        migrations.RunPython(index_existing_rows, migrations.RunPython.noop),
+    ]
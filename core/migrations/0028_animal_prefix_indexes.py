@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:50
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_trigram_index(apps, schema_editor):
+    # Infix matches ("17" in "D-17") use pg_trgm on PostgreSQL when available;
+    # other backends fall back to a branch-scoped LIKE.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS animal_lookup_trgm_idx ON core_animal "
+        "USING GIN (upper(force_number) gin_trgm_ops, lower(name) gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS animal_lookup_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_searchentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(models.F('branch'), django.db.models.functions.text.Upper('force_number'), name='animal_branch_fn_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(models.F('branch'), django.db.models.functions.text.Lower('name'), name='animal_branch_name_prefix_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:59
+
+import core.storage
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_photo_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='animal',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_content_addressed_storage, upload_to='animal_photos/'),
+        ),
+        migrations.AlterField(
+            model_name='animallog',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_content_addressed_storage, upload_to='activity_photos/'),
+        ),
+        migrations.AlterField(
+            model_name='emergencyincident',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_content_addressed_storage, upload_to='emergency_photos/'),
+        ),
+        migrations.AlterField(
+            model_name='medicalrecord',
+            name='document',
+            field=models.FileField(blank=True, null=True, storage=core.storage.get_content_addressed_storage, upload_to='medical_documents/'),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=core.storage.get_content_addressed_storage, upload_to='reports/'),
+        ),
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_seen_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'last_seen_at'], name='blob_gc_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('task_assigned', 'Task Assigned'), ('task_completed', 'Task Completed'), ('emergency_reported', 'Emergency Reported'), ('medical_record_added', 'Medical Record Added'), ('animal_assigned', 'Animal Assigned'), ('message_received', 'Message Received'), ('system_alert', 'System Alert'), ('reminder', 'Reminder')], max_length=30),
+        ),
+        migrations.CreateModel(
+            name='UpcomingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('vaccination', 'Vaccination due'), ('deworming', 'Deworming due'), ('delivery', 'Expected delivery'), ('task_due', 'Task due')], max_length=20)),
+                ('source', models.CharField(max_length=30)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('due_at', models.DateTimeField()),
+                ('remind_at', models.DateTimeField()),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('animal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upcoming_events', to='core.animal')),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.branch')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['due_at'],
+                'indexes': [models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['remind_at'], name='event_pending_idx'), models.Index(fields=['branch', 'due_at'], name='event_branch_due_idx')],
+                'unique_together': {('source', 'object_id', 'kind')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_upcomingevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='branchstats',
+            name='tasks_overdue',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='vettask',
+            name='overdue_since',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('task_assigned', 'Task Assigned'), ('task_completed', 'Task Completed'), ('emergency_reported', 'Emergency Reported'), ('medical_record_added', 'Medical Record Added'), ('animal_assigned', 'Animal Assigned'), ('message_received', 'Message Received'), ('system_alert', 'System Alert'), ('reminder', 'Reminder'), ('task_overdue', 'Task Overdue')], max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='vettask',
+            index=models.Index(condition=models.Q(('overdue_since__isnull', True), ('status__in', ['pending', 'in_progress'])), fields=['due_date'], name='vettask_overdue_scan_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vettask',
+            index=models.Index(condition=models.Q(('overdue_since__isnull', False), ('status__in', ['pending', 'in_progress'])), fields=['branch', 'due_date'], name='vettask_overdue_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    # Roll up the history that already exists, so reports don't read as zero
+    # until someone runs rebuild_vet_stats.
+    from core.performance import rebuild_vet_stats
+
+    rebuild_vet_stats(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_vettask_overdue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VetDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('tasks_completed', models.IntegerField(default=0)),
+                ('response_seconds', models.BigIntegerField(default=0)),
+                ('response_histogram', models.JSONField(default=list)),
+                ('medical_records', models.IntegerField(default=0)),
+                ('patient_ids', models.JSONField(default=list)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.branch')),
+            ],
+            options={
+                'verbose_name_plural': 'Vet daily stats',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='vettask',
+            index=models.Index(condition=models.Q(('status', 'completed')), fields=['assigned_to', 'completed_at'], name='vettask_completed_idx'),
+        ),
+        migrations.AddField(
+            model_name='vetdailystats',
+            name='vet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='vetdailystats',
+            unique_together={('vet', 'branch', 'date')},
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_activityevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='animallog',
+            index=models.Index(fields=['animal', '-date'], name='animallog_animal_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyincident',
+            index=models.Index(fields=['animal', '-date_reported'], name='incident_animal_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trainingrecord',
+            index=models.Index(fields=['animal', '-created_at'], name='training_animal_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vettask',
+            index=models.Index(fields=['animal', '-created_at'], name='vettask_animal_created_idx'),
+        ),
+    ]
@@ -1,5 +1,12 @@
+import uuid
+
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Lower, Upper
+from django.utils import timezone
 from accounts.models import CustomUser
+from .projections import ProjectionQuerySet
+from .storage import get_content_addressed_storage
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
@@ -29,18 +36,26 @@ class Animal(models.Model):
     age = models.DecimalField(max_digits=5, decimal_places=2)
     date_of_birth = models.DateField(null=True, blank=True)
     owner_name = models.CharField(max_length=255)
-    photo = models.ImageField(upload_to='animal_photos/', blank=True, null=True)
+    photo = models.ImageField(upload_to='animal_photos/', storage=get_content_addressed_storage, blank=True, null=True)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)  # see core.images
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE)
     assigned_users = models.ManyToManyField(CustomUser, related_name='assigned_animals', blank=True)
     assigned_vet = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='vet_animals')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProjectionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} ({self.force_number})"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Prefix lookups for autocomplete (see core.autocomplete)
+            models.Index(F('branch'), Upper('force_number'), name='animal_branch_fn_prefix_idx'),
+            models.Index(F('branch'), Lower('name'), name='animal_branch_name_prefix_idx'),
+        ]
 
 
 class VetTask(models.Model):
@@ -67,17 +82,40 @@ class VetTask(models.Model):
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='normal')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     due_date = models.DateTimeField()
+    # Set by core.overdue when an open task passes its due date.
+    overdue_since = models.DateTimeField(null=True, blank=True, editable=False)
     completed_at = models.DateTimeField(null=True, blank=True)
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     date_assigned = models.DateTimeField(auto_now_add=True)  # or just DateTimeField()
 
+    objects = ProjectionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.title} - {self.animal.name}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['branch', 'status', '-created_at'], name='vettask_branch_status_idx'),
+            models.Index(fields=['assigned_to', '-date_assigned'], name='vettask_assignee_idx'),
+            models.Index(fields=['assigned_by', '-created_at'], name='vettask_assigner_idx'),
+            models.Index(fields=['animal', '-created_at'], name='vettask_animal_created_idx'),
+            # The overdue sweep reads only open tasks not flagged yet.
+            models.Index(
+                fields=['due_date'], name='vettask_overdue_scan_idx',
+                condition=Q(overdue_since__isnull=True, status__in=['pending', 'in_progress']),
+            ),
+            models.Index(
+                fields=['branch', 'due_date'], name='vettask_overdue_idx',
+                condition=Q(overdue_since__isnull=False, status__in=['pending', 'in_progress']),
+            ),
+            models.Index(
+                fields=['assigned_to', 'completed_at'], name='vettask_completed_idx',
+                condition=Q(status='completed'),
+            ),
+        ]
 
 
 class MedicalRecord(models.Model):
@@ -100,7 +138,7 @@ class MedicalRecord(models.Model):
     report_type = models.CharField(max_length=50, choices=REPORT_TYPES)
     diagnosis = models.TextField()
     treatment = models.TextField()
-    document = models.FileField(upload_to='medical_documents/', blank=True, null=True)
+    document = models.FileField(upload_to='medical_documents/', storage=get_content_addressed_storage, blank=True, null=True)
     
     # General fields
     weight = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
@@ -148,11 +186,17 @@ class MedicalRecord(models.Model):
     date_recorded = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProjectionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.report_type.title()} - {self.animal.name} ({self.date_recorded.date()})"
 
     class Meta:
         ordering = ['-date_recorded']
+        indexes = [
+            models.Index(fields=['animal', '-date_recorded'], name='medrec_animal_date_idx'),
+            models.Index(fields=['veterinarian', '-date_recorded'], name='medrec_vet_date_idx'),
+        ]
 
 
 class AnimalLog(models.Model):
@@ -170,14 +214,20 @@ class AnimalLog(models.Model):
     animal = models.ForeignKey(Animal, on_delete=models.CASCADE, related_name='activity_logs')
     activity_type = models.CharField(max_length=20, choices=ACTIVITY_TYPES)
     notes = models.TextField()
-    photo = models.ImageField(upload_to='activity_photos/', blank=True, null=True)
+    photo = models.ImageField(upload_to='activity_photos/', storage=get_content_addressed_storage, blank=True, null=True)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)  # see core.images
     date = models.DateTimeField(auto_now_add=True)
 
+    objects = ProjectionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.animal.name} - {self.get_activity_type_display()} by {self.user.username}"
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['animal', '-date'], name='animallog_animal_date_idx'),
+        ]
 
 
 class EquipmentLog(models.Model):
@@ -205,6 +255,8 @@ class EquipmentLog(models.Model):
     notes = models.TextField(blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = ProjectionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.username} - {self.get_equipment_display()} - {self.get_action_display()}"
 
@@ -236,7 +288,8 @@ class EmergencyIncident(models.Model):
     incident_type = models.CharField(max_length=50, choices=INCIDENT_TYPES)
     severity = models.CharField(max_length=10, choices=SEVERITY_CHOICES, default='medium')
     description = models.TextField()
-    photo = models.ImageField(upload_to='emergency_photos/', blank=True, null=True)
+    photo = models.ImageField(upload_to='emergency_photos/', storage=get_content_addressed_storage, blank=True, null=True)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)  # see core.images
     location = models.CharField(max_length=255, blank=True, null=True)
     date_reported = models.DateTimeField(auto_now_add=True)
     resolved = models.BooleanField(default=False)
@@ -244,11 +297,16 @@ class EmergencyIncident(models.Model):
     resolved_at = models.DateTimeField(null=True, blank=True)
     resolution_notes = models.TextField(blank=True, null=True)
 
+    objects = ProjectionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.get_incident_type_display()} - {self.animal.name if self.animal else 'General'} ({self.date_reported.date()})"
 
     class Meta:
         ordering = ['-date_reported']
+        indexes = [
+            models.Index(fields=['animal', '-date_reported'], name='incident_animal_date_idx'),
+        ]
 
 
 class DailyActivityReport(models.Model):
@@ -278,6 +336,8 @@ class Notification(models.Model):
         ('animal_assigned', 'Animal Assigned'),
         ('message_received', 'Message Received'),
         ('system_alert', 'System Alert'),
+        ('reminder', 'Reminder'),
+        ('task_overdue', 'Task Overdue'),
     ]
 
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications')
@@ -293,6 +353,12 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='notif_user_created_idx'),
+            # Django renders is_read=False as `NOT is_read`, which SQLite can
+            # only match against a partial index, not a composite column.
+            models.Index(fields=['user', '-created_at'], condition=Q(is_read=False), name='notif_unread_idx'),
+        ]
 
 
 class Message(models.Model):
@@ -307,8 +373,15 @@ class Message(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     branch = models.ForeignKey('Branch', on_delete=models.CASCADE, null=True, blank=True)  # NEW
 
+    objects = ProjectionQuerySet.as_manager()
+
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['receiver', '-timestamp'], condition=Q(is_deleted=False), name='message_inbox_idx'),
+            models.Index(fields=['receiver', '-timestamp'], condition=Q(is_read=False), name='message_unread_idx'),
+            models.Index(fields=['sender', '-timestamp'], name='message_sent_idx'),
+        ]
 
 
 
@@ -337,11 +410,16 @@ class SupportTicket(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProjectionQuerySet.as_manager()
+
     def __str__(self):
         return f"#{self.id} - {self.subject}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['branch', 'status', '-created_at'], name='ticket_branch_status_idx'),
+        ]
 
 
 class TicketReply(models.Model):
@@ -379,13 +457,17 @@ class SystemLog(models.Model):
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
     message = models.TextField()
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the entry is queued, not when core.audit flushes it.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f"{self.user.username} - {self.get_action_display()} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp'], name='systemlog_timestamp_idx'),
+        ]
 
 
 class Report(models.Model):
@@ -456,7 +538,7 @@ class Report(models.Model):
     description = models.TextField()
     created_by = models.ForeignKey('accounts.CustomUser', on_delete=models.CASCADE, related_name='created_reports')
     branch = models.ForeignKey('core.Branch', on_delete=models.CASCADE, related_name='reports')
-    file = models.FileField(upload_to='reports/', blank=True, null=True)
+    file = models.FileField(upload_to='reports/', storage=get_content_addressed_storage, blank=True, null=True)
     date_created = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -502,6 +584,9 @@ class TrainingRecord(models.Model):
 
     class Meta:
         ordering = ['-date_recorded']
+        indexes = [
+            models.Index(fields=['animal', '-created_at'], name='training_animal_created_idx'),
+        ]
 
 
 class TrainingSession(models.Model):
@@ -526,4 +611,269 @@ class TrainingSession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Session for {self.training_record.animal.name} on {self.date}"
\ No newline at end of file
+        return f"Session for {self.training_record.animal.name} on {self.date}"
+
+class BranchStats(models.Model):
+    """
+    Materialized per-branch counters, kept current by core.signals and
+    rebuilt from scratch with `manage.py rebuild_branch_stats`.
+    """
+    branch = models.OneToOneField(Branch, on_delete=models.CASCADE, related_name='stats')
+    animal_count = models.IntegerField(default=0)
+    task_count = models.IntegerField(default=0)
+    tasks_pending = models.IntegerField(default=0)
+    tasks_in_progress = models.IntegerField(default=0)
+    tasks_completed = models.IntegerField(default=0)
+    tasks_cancelled = models.IntegerField(default=0)
+    tasks_overdue = models.IntegerField(default=0)
+    medical_record_count = models.IntegerField(default=0)
+    tickets_open = models.IntegerField(default=0)
+    tickets_in_progress = models.IntegerField(default=0)
+    tickets_resolved = models.IntegerField(default=0)
+    tickets_closed = models.IntegerField(default=0)
+    report_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.branch.name}"
+
+    class Meta:
+        verbose_name_plural = 'Branch stats'
+
+
+class BranchDailyStats(models.Model):
+    """
+    Per-day rollup of branch activity. Rows are keyed on the local date the
+    underlying record was created (or, for daily reports, the report date).
+    """
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    animals_added = models.IntegerField(default=0)
+    tasks_created = models.IntegerField(default=0)
+    medical_records_added = models.IntegerField(default=0)
+    tickets_opened = models.IntegerField(default=0)
+    report_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Stats for {self.branch.name} on {self.date}"
+
+    class Meta:
+        unique_together = ['branch', 'date']
+        ordering = ['-date']
+        verbose_name_plural = 'Branch daily stats'
+
+
+class VetDailyStats(models.Model):
+    """
+    Per-day performance rollup of one veterinarian in one branch (the branch
+    of the animals worked on), kept by core.performance. Tasks count on the
+    local date they were completed, medical records on the date they were
+    written.
+    """
+    vet = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='daily_stats')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    tasks_completed = models.IntegerField(default=0)
+    # Sum of completed_at - created_at over the completed tasks.
+    response_seconds = models.BigIntegerField(default=0)
+    # Completed tasks per core.performance.RESPONSE_BUCKETS entry.
+    response_histogram = models.JSONField(default=list)
+    medical_records = models.IntegerField(default=0)
+    # Animals with a completed task or a medical record that day.
+    patient_ids = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"Performance of {self.vet} on {self.date}"
+
+    class Meta:
+        unique_together = ['vet', 'branch', 'date']
+        ordering = ['-date']
+        verbose_name_plural = 'Vet daily stats'
+
+
+class ActivityEvent(models.Model):
+    """
+    Append-only feed entry for something that happened in a branch: a row
+    created or moved to another state. Written by core.signals (see
+    core.activity), read newest first with cursor paging.
+    """
+    VERB_CHOICES = [
+        ('created', 'Created'),
+        ('changed', 'Changed'),
+    ]
+
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, null=True, blank=True, related_name='activity')
+    actor = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='activity')
+    verb = models.CharField(max_length=10, choices=VERB_CHOICES)
+    kind = models.CharField(max_length=30)
+    object_id = models.PositiveBigIntegerField()
+    animal = models.ForeignKey(Animal, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    message = models.CharField(max_length=255)
+    link = models.CharField(max_length=255, blank=True)
+    ts = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.message
+
+    class Meta:
+        ordering = ['-ts']
+        indexes = [
+            models.Index(fields=['branch', '-ts'], name='activity_branch_ts_idx'),
+            models.Index(fields=['actor', '-ts'], name='activity_actor_ts_idx'),
+        ]
+
+
+class SearchEntry(models.Model):
+    """
+    One searchable document per indexed row, maintained by core.signals.
+    The title/body columns feed an FTS5 table on SQLite and a generated
+    tsvector column on PostgreSQL (see core.search).
+    """
+    kind = models.CharField(max_length=30)
+    object_id = models.PositiveBigIntegerField()
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    url = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}: {self.title}"
+
+    class Meta:
+        unique_together = ['kind', 'object_id']
+        indexes = [
+            models.Index(fields=['branch', 'kind'], name='search_branch_kind_idx'),
+        ]
+        verbose_name_plural = 'Search entries'
+
+
+class StoredBlob(models.Model):
+    """
+    One file in the content-addressed upload store (see core.storage) and
+    the number of model fields pointing at it. Blobs left at zero are
+    deleted by `manage.py collect_media_garbage`.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever the same content is uploaded again, so a blob that is
+    # about to be referenced is not collected in between.
+    last_seen_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'last_seen_at'], name='blob_gc_idx'),
+        ]
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload, received in chunks into a partial file and moved
+    into the blob store when complete (see core.uploads).
+    """
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('complete', 'Complete'),
+        ('aborted', 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='upload_sessions')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    purpose = models.CharField(max_length=30)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    blob_name = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes, {self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'status'], name='upload_branch_status_idx'),
+        ]
+
+
+class Job(models.Model):
+    """
+    A queued call of a background task (see core.jobs), picked up by
+    `manage.py run_jobs` workers.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    task = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    priority = models.SmallIntegerField(default=0, help_text="Lower runs first")
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    # Set for periodic runs so several workers cannot enqueue the same slot.
+    unique_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_at'], name='job_claim_idx'),
+        ]
+
+
+class UpcomingEvent(models.Model):
+    """
+    A dated event taken from a MedicalRecord or VetTask (next vaccination,
+    deworming, delivery, task due date), kept current by core.signals.
+    core.reminders notifies `user` once `remind_at` has passed.
+    """
+    KIND_CHOICES = [
+        ('vaccination', 'Vaccination due'),
+        ('deworming', 'Deworming due'),
+        ('delivery', 'Expected delivery'),
+        ('task_due', 'Task due'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    source = models.CharField(max_length=30)
+    object_id = models.PositiveBigIntegerField()
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='+')
+    animal = models.ForeignKey(Animal, on_delete=models.CASCADE, related_name='upcoming_events')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=255)
+    due_at = models.DateTimeField()
+    remind_at = models.DateTimeField()
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.title} ({self.due_at:%Y-%m-%d})"
+
+    class Meta:
+        unique_together = ['source', 'object_id', 'kind']
+        ordering = ['due_at']
+        indexes = [
+            # The reminder sweep only ever reads the not-yet-notified rows.
+            models.Index(fields=['remind_at'], condition=Q(notified_at__isnull=True), name='event_pending_idx'),
+            models.Index(fields=['branch', 'due_at'], name='event_branch_due_idx'),
+        ]
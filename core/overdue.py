@@ -0,0 +1,65 @@
+"""
+Overdue vet tasks.
+
+A pending or in-progress VetTask whose due date has passed is flagged by
+stamping `overdue_since`; the periodic core.tasks.flag_overdue_tasks job
+does it in bulk UPDATEs over a partial index of the open, unflagged tasks,
+notifies each assignee once and moves the BranchStats.tasks_overdue
+counters, so dashboards read the overdue count like any other counter.
+
+Completing or cancelling a flagged task takes it out of the count through
+the usual stats receivers; a flagged task whose due date is moved into the
+future is unflagged on the next sweep.
+"""
+from django.utils import timezone
+
+from .models import VetTask, Notification
+from .stats import apply_stat_deltas
+from .utils import deliver_notifications
+
+OPEN_STATUSES = ['pending', 'in_progress']
+
+
+def _overdue_notification(task):
+    due = timezone.localtime(task['due_date'])
+    return Notification(
+        user_id=task['assigned_to_id'], notification_type='task_overdue',
+        title=f"Task overdue: {task['title']}"[:255],
+        message=f"'{task['title']}' for {task['animal__name']} was due {due:%Y-%m-%d %H:%M}.",
+        link=f"/core/animals/{task['animal_id']}/",
+    )
+
+
+def flag_overdue_tasks(now=None, batch_size=500, max_batches=20):
+    """Flag open tasks past their due date, `batch_size` per UPDATE; returns how many"""
+    now = now or timezone.now()
+    flagged = 0
+    for _ in range(max_batches):
+        due = VetTask.objects.filter(status__in=OPEN_STATUSES, overdue_since__isnull=True, due_date__lte=now)
+        ids = list(due.order_by('due_date').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        stamp = timezone.now()
+        # Repeating the conditions keeps a concurrent sweep or a task closed
+        # meanwhile from being flagged (and notified) twice.
+        due.filter(pk__in=ids).update(overdue_since=stamp)
+        tasks = list(
+            VetTask.objects.filter(pk__in=ids, overdue_since=stamp)
+            .values('branch_id', 'assigned_to_id', 'title', 'due_date', 'animal_id', 'animal__name')
+        )
+        apply_stat_deltas(added=[(task['branch_id'], None, 'tasks_overdue') for task in tasks])
+        deliver_notifications([_overdue_notification(task) for task in tasks])
+        flagged += len(tasks)
+    return flagged
+
+
+def unflag_rescheduled_tasks(now=None):
+    """Clear the flag of open tasks whose due date was moved past `now`; returns how many"""
+    now = now or timezone.now()
+    moved = VetTask.objects.filter(status__in=OPEN_STATUSES, overdue_since__isnull=False, due_date__gt=now)
+    rows = list(moved.values_list('pk', 'branch_id'))
+    if not rows:
+        return 0
+    moved.filter(pk__in=[pk for pk, _ in rows]).update(overdue_since=None)
+    apply_stat_deltas(removed=[(branch_id, None, 'tasks_overdue') for _, branch_id in rows])
+    return len(rows)
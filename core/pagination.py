@@ -0,0 +1,194 @@
+"""
+Keyset (cursor) pagination.
+
+Paginator counts the whole result set and pages with OFFSET, so deep pages
+cost more than the first one. CursorPaginator instead remembers the ordering
+key of the last row shown, e.g. (timestamp, id), and asks for the rows after
+it, which an index on the ordering columns answers directly on any page.
+
+The ordering is taken from the queryset's order_by() or, failing that, the
+model's Meta.ordering; the primary key is always appended as a tie-breaker.
+Ordering fields must be non-nullable.
+
+    page = paginate(request, Message.objects.filter(receiver=user), per_page=15)
+    {% include "partials/cursor_pagination.html" %}
+"""
+import base64
+import binascii
+import datetime
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+CURSOR_PARAM = 'cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds datetimes to milliseconds; keys must round-trip exactly.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CursorPage:
+    """One page of results; iterable like a Paginator page"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def links(self):
+        return {'next': self.next_cursor, 'previous': self.previous_cursor}
+
+
+class CursorPaginator:
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.model = queryset.model
+        self.ordering = self._resolve_ordering(ordering)
+
+    def _resolve_ordering(self, ordering):
+        names = list(ordering or self.queryset.query.order_by or self.model._meta.ordering or [])
+        keys = []
+        for name in names:
+            if not isinstance(name, str) or name == '?':
+                raise ValueError(f"Cursor pagination needs plain field names, got {name!r}")
+            descending = name.startswith('-')
+            name = name.lstrip('-+')
+            if name in ('pk', self.model._meta.pk.name):
+                break
+            keys.append((name, descending))
+        # The primary key makes the key unique; it follows the first field's direction.
+        keys.append(('pk', keys[0][1] if keys else True))
+        return keys
+
+    def _field(self, name):
+        model = self.model
+        field = None
+        for part in name.split('__'):
+            field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+            model = field.related_model or model
+        return field
+
+    def _key_values(self, obj):
+        values = []
+        for name, _ in self.ordering:
+            *path, last = name.split('__')
+            value = obj
+            for part in path:
+                value = getattr(value, part)
+            field = value._meta.pk if last == 'pk' else value._meta.get_field(last)
+            values.append(getattr(value, field.attname))
+        return values
+
+    # ------------------------------
+    # Cursor encoding
+    # ------------------------------
+
+    def encode_cursor(self, obj, previous=False):
+        payload = {'k': self._key_values(obj), 'p': previous}
+        raw = json.dumps(payload, cls=CursorEncoder, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            values = payload['k']
+            if len(values) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            values = [
+                self._field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+            return values, bool(payload.get('p'))
+        except (ValueError, KeyError, TypeError, binascii.Error, FieldDoesNotExist, ValidationError):
+            raise InvalidCursor(cursor)
+
+    # ------------------------------
+    # Paging
+    # ------------------------------
+
+    def _after(self, values, backwards):
+        """Rows strictly after `values` in the page direction"""
+        conditions = []
+        for index, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != backwards else 'gt'
+            equal = {prefix: value for (prefix, _), value in zip(self.ordering[:index], values)}
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': values[index]}))
+        # Redundant range on the leading column so the index can seek to it.
+        name, descending = self.ordering[0]
+        leading = Q(**{f"{name}__{'lte' if descending != backwards else 'gte'}": values[0]})
+        return leading & reduce(or_, conditions)
+
+    def _order_by(self, backwards):
+        return [
+            ('-' if descending != backwards else '') + name
+            for name, descending in self.ordering
+        ]
+
+    def page(self, cursor=None):
+        """Return the page after (or before) the given cursor; raises InvalidCursor"""
+        queryset = self.queryset
+        backwards = False
+        if cursor:
+            values, backwards = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._after(values, backwards))
+
+        rows = list(queryset.order_by(*self._order_by(backwards))[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], previous=True) if rows and has_previous else None,
+        )
+
+    def get_page(self, cursor=None):
+        """Like page(), but an invalid or stale cursor shows the first page"""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+
+def paginate(request, queryset, per_page=20, ordering=None):
+    """Cursor-paginate a queryset using the request's ?cursor= parameter"""
+    return CursorPaginator(queryset, per_page, ordering).get_page(request.GET.get(CURSOR_PARAM))
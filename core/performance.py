@@ -0,0 +1,190 @@
+"""
+Veterinarian performance metrics.
+
+VetDailyStats holds one row per vet, branch and day with the tasks
+completed, the summed and bucketed response times (completed_at -
+created_at), the medical records written and the animals handled. Work
+counts in the branch of the animal it was done on. Rows are computed with
+SQL aggregates: the receivers in core.signals recompute the vet's day when a
+task is completed (or un-completed) and when a record is written, the
+nightly core.tasks.rollup_vet_stats job recomputes yesterday for everyone to
+pick up bulk updates, and `manage.py rebuild_vet_stats` rebuilds history
+(migration 0035 runs the same rebuild once).
+
+Reports over any date range sum the daily rows (get_vet_performance)
+instead of reading the tasks. Percentiles come from the summed histogram,
+so they are reported as the upper bound of the bucket they fall in.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, DurationField, ExpressionWrapper, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import VetTask, MedicalRecord, VetDailyStats
+
+# Upper bounds of the response time buckets; None collects the rest.
+RESPONSE_BUCKETS = [
+    timedelta(hours=1), timedelta(hours=4), timedelta(hours=12), timedelta(days=1), timedelta(days=2),
+    timedelta(days=3), timedelta(days=7), timedelta(days=14), timedelta(days=30), None,
+]
+
+
+def _empty_day():
+    return {
+        'tasks_completed': 0, 'response_seconds': 0, 'response_histogram': [0] * len(RESPONSE_BUCKETS),
+        'medical_records': 0, 'patient_ids': set(),
+    }
+
+
+def _bucket_expression():
+    return Case(
+        *[When(response__lte=bound, then=Value(index)) for index, bound in enumerate(RESPONSE_BUCKETS) if bound],
+        default=Value(len(RESPONSE_BUCKETS) - 1),
+        output_field=IntegerField(),
+    )
+
+
+def _models(apps):
+    """VetTask, MedicalRecord and VetDailyStats, historical ones if `apps` is given (migrations)"""
+    if apps is None:
+        return VetTask, MedicalRecord, VetDailyStats
+    return tuple(apps.get_model('core', name) for name in ('VetTask', 'MedicalRecord', 'VetDailyStats'))
+
+
+def compute_vet_daily_stats(day=None, vet_ids=None, apps=None):
+    """
+    Aggregate completed tasks and medical records by vet, animal branch and
+    local date. Returns {(vet_id, branch_id, date): counters}, limited to
+    `day` and `vet_ids` if given.
+    """
+    task_model, record_model, _ = _models(apps)
+    daily = defaultdict(_empty_day)
+
+    tasks = task_model.objects.filter(status='completed', completed_at__isnull=False).annotate(
+        stat_day=TruncDate('completed_at'),
+        response=ExpressionWrapper(F('completed_at') - F('created_at'), output_field=DurationField()),
+    )
+    records = record_model.objects.annotate(stat_day=TruncDate('date_recorded'))
+    if day is not None:
+        tasks = tasks.filter(stat_day=day)
+        records = records.filter(stat_day=day)
+    if vet_ids is not None:
+        tasks = tasks.filter(assigned_to_id__in=vet_ids)
+        records = records.filter(veterinarian_id__in=vet_ids)
+
+    buckets = tasks.annotate(bucket=_bucket_expression()).values(
+        'assigned_to_id', 'animal__branch_id', 'stat_day', 'bucket',
+    )
+    for row in buckets.annotate(n=Count('id'), total=Sum('response')).order_by():
+        counters = daily[(row['assigned_to_id'], row['animal__branch_id'], row['stat_day'])]
+        counters['tasks_completed'] += row['n']
+        counters['response_seconds'] += max(0, int(row['total'].total_seconds())) if row['total'] else 0
+        counters['response_histogram'][row['bucket']] += row['n']
+
+    for row in records.values('veterinarian_id', 'animal__branch_id', 'stat_day').annotate(n=Count('id')).order_by():
+        daily[(row['veterinarian_id'], row['animal__branch_id'], row['stat_day'])]['medical_records'] += row['n']
+
+    for source, vet_field in ((tasks, 'assigned_to_id'), (records, 'veterinarian_id')):
+        rows = source.values_list(vet_field, 'animal__branch_id', 'stat_day', 'animal_id').distinct()
+        for vet_id, branch_id, stat_day, animal_id in rows:
+            daily[(vet_id, branch_id, stat_day)]['patient_ids'].add(animal_id)
+
+    return daily
+
+
+def _row(model, key, counters):
+    vet_id, branch_id, day = key
+    return model(
+        vet_id=vet_id, branch_id=branch_id, date=day,
+        **{**counters, 'patient_ids': sorted(counters['patient_ids'])},
+    )
+
+
+def rollup_vet_stats(day, vet_ids=None):
+    """Recompute the rows of `day` (for `vet_ids`, or every vet); returns rows written"""
+    daily = compute_vet_daily_stats(day=day, vet_ids=vet_ids)
+    with transaction.atomic():
+        stale = VetDailyStats.objects.filter(date=day)
+        if vet_ids is not None:
+            stale = stale.filter(vet_id__in=vet_ids)
+        kept = {(vet_id, branch_id) for vet_id, branch_id, _ in daily}
+        VetDailyStats.objects.filter(pk__in=[
+            pk for pk, vet_id, branch_id in stale.values_list('pk', 'vet_id', 'branch_id')
+            if (vet_id, branch_id) not in kept
+        ]).delete()
+        VetDailyStats.objects.bulk_create(
+            [_row(VetDailyStats, key, counters) for key, counters in daily.items()],
+            update_conflicts=True,
+            unique_fields=['vet', 'branch', 'date'],
+            update_fields=['tasks_completed', 'response_seconds', 'response_histogram', 'medical_records', 'patient_ids'],
+        )
+    return len(daily)
+
+
+def rebuild_vet_stats(apps=None):
+    """Drop and recompute every VetDailyStats row; returns rows written"""
+    stats_model = _models(apps)[2]
+    daily = compute_vet_daily_stats(apps=apps)
+    with transaction.atomic():
+        stats_model.objects.all().delete()
+        stats_model.objects.bulk_create(
+            [_row(stats_model, key, counters) for key, counters in daily.items()],
+            batch_size=1000,
+        )
+    return len(daily)
+
+
+# ------------------------------
+# Reports
+# ------------------------------
+
+def percentile_bound(histogram, fraction):
+    """Upper bound of the bucket holding the `fraction` quantile; None past the last bound"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = max(1, math.ceil(total * fraction))
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return RESPONSE_BUCKETS[index]
+    return None
+
+
+def get_vet_performance(vet, start, end, branch=None):
+    """Sum the daily rows of `vet` from `start` to `end` (inclusive dates), in `branch` if given"""
+    rows = VetDailyStats.objects.filter(vet=vet, date__range=(start, end))
+    if branch is not None:
+        rows = rows.filter(branch=branch)
+    totals = rows.aggregate(
+        tasks_completed=Sum('tasks_completed'), response_seconds=Sum('response_seconds'),
+        medical_records=Sum('medical_records'),
+    )
+    histogram = [0] * len(RESPONSE_BUCKETS)
+    patients = set()
+    for row_histogram, patient_ids in rows.values_list('response_histogram', 'patient_ids'):
+        for index, count in enumerate(row_histogram):
+            histogram[index] += count
+        patients.update(patient_ids)
+
+    completed = totals['tasks_completed'] or 0
+    return {
+        'start': start,
+        'end': end,
+        'tasks_completed': completed,
+        'medical_records': totals['medical_records'] or 0,
+        'patients_handled': len(patients),
+        'average_response_time': timedelta(seconds=(totals['response_seconds'] or 0) / completed) if completed else None,
+        'median_response_bound': percentile_bound(histogram, 0.5),
+        'p90_response_bound': percentile_bound(histogram, 0.9),
+        'response_histogram': histogram,
+    }
+
+
+def local_day(value):
+    return timezone.localdate(value) if value else None
@@ -0,0 +1,77 @@
+"""
+List projections: the joins and columns each list page needs.
+
+List templates follow foreign keys in their loops ({{ task.assigned_to.
+get_full_name }}, {{ record.animal.name }}), which costs one query per row
+unless the view remembered to select_related() them. Instead, every model
+with a list page uses ProjectionQuerySet as its manager and views ask for a
+named projection:
+
+    tasks = VetTask.objects.filter(...).for_list()
+
+The projection supplies select_related(), prefetch_related() and, where the
+list never shows the bulky columns, only(). Ordering and filtering stay with
+the view. core.tests.ListQueryCountTests renders the list pages with small
+and large data sets and checks that their query counts do not grow.
+"""
+from collections import namedtuple
+
+from django.db import models
+
+Projection = namedtuple('Projection', ['select', 'prefetch', 'only'])
+
+# Columns list templates show for a user (name, username, role badge).
+USER_COLUMNS = ('username', 'first_name', 'last_name', 'role')
+
+LIST_PROJECTIONS = {}
+
+
+def register_projection(model_label, name='list', select=(), prefetch=(), only=()):
+    """Declare a projection for 'app_label.ModelName'; `only` may name related columns"""
+    LIST_PROJECTIONS.setdefault(model_label, {})[name] = Projection(list(select), list(prefetch), list(only))
+
+
+def get_projection(model, name='list'):
+    try:
+        return LIST_PROJECTIONS[model._meta.label][name]
+    except KeyError:
+        raise LookupError(f"No '{name}' projection registered for {model._meta.label}")
+
+
+class ProjectionQuerySet(models.QuerySet):
+
+    def for_list(self, name='list'):
+        """Apply the named projection's joins, prefetches and column list"""
+        projection = get_projection(self.model, name)
+        queryset = self
+        if projection.select:
+            queryset = queryset.select_related(*projection.select)
+        if projection.prefetch:
+            queryset = queryset.prefetch_related(*projection.prefetch)
+        if projection.only:
+            queryset = queryset.only(*projection.only)
+        return queryset
+
+
+def _user_columns(*relations):
+    return [f'{relation}__{column}' for relation in relations for column in USER_COLUMNS]
+
+
+register_projection('core.Animal', select=['branch'])
+# animal_list also shows each animal's handlers.
+register_projection('core.Animal', 'roster', select=['branch'], prefetch=['assigned_users'])
+register_projection('core.MedicalRecord', select=['animal', 'veterinarian'])
+register_projection('core.VetTask', select=['animal', 'assigned_to', 'assigned_by'])
+register_projection('core.AnimalLog', select=['animal', 'user'])
+register_projection('core.EquipmentLog', select=['user'])
+register_projection('core.EmergencyIncident', select=['animal', 'reporter'])
+register_projection('core.SupportTicket', select=['created_by', 'assigned_to', 'branch'])
+# Message lists never show the body.
+register_projection(
+    'core.Message',
+    select=['sender', 'receiver'],
+    only=[
+        'subject', 'timestamp', 'is_read', 'is_archived', 'is_deleted', 'branch', 'parent',
+        *_user_columns('sender', 'receiver'),
+    ],
+)
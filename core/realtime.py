@@ -0,0 +1,188 @@
+"""
+Server-push channel for unread notification and message counts.
+
+Counts are published when a Notification or Message actually changes (see
+core.signals and core.utils.notify_users) and streamed to browsers over
+Server-Sent Events by core.views.unread_counts_stream when the site runs
+under ASGI; under WSGI messages.js polls the count endpoints instead.
+
+With REALTIME_BROKER_URL pointing at a Redis server (and the `redis` package
+installed) events fan out across worker processes; otherwise an in-process
+pub/sub is used, which reaches every tab connected to the same process.
+"""
+import json
+import logging
+import queue
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_QUEUE_SIZE = 50
+
+
+class Subscription:
+    """A single browser connection waiting for events for one user"""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+
+    def put(self, payload):
+        # Only the latest counts matter, so a slow consumer just loses old ones.
+        try:
+            self.queue.put_nowait(payload)
+        except queue.Full:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(payload)
+
+    def get(self, timeout=None):
+        """Wait for the next payload; returns None on timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fan-out to subscribers living in the current process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def has_subscribers(self, user_id):
+        return bool(self._subscribers.get(user_id))
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.put(payload)
+
+
+class RedisSubscription:
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.pubsub = broker.client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(broker.channel(user_id))
+
+    def get(self, timeout=None):
+        message = self.pubsub.get_message(timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message['data'])
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisBroker:
+    """Fan-out through Redis pub/sub so every worker process sees each event"""
+
+    def __init__(self, url, prefix='tpf:unread'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def channel(self, user_id):
+        return f'{self.prefix}:{user_id}'
+
+    def has_subscribers(self, user_id):
+        try:
+            return any(count for _, count in self.client.pubsub_numsub(self.channel(user_id)))
+        except Exception:
+            logger.exception("Realtime broker unavailable")
+            return False
+
+    def subscribe(self, user_id):
+        return RedisSubscription(self, user_id)
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+
+    def publish(self, user_id, payload):
+        try:
+            self.client.publish(self.channel(user_id), json.dumps(payload))
+        except Exception:
+            logger.exception("Realtime broker unavailable")
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Return the process-wide broker, choosing Redis when it is configured and
+    importable and the in-process pub/sub otherwise.
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                url = getattr(settings, 'REALTIME_BROKER_URL', None)
+                broker = None
+                if url:
+                    try:
+                        broker = RedisBroker(url)
+                    except ImportError:
+                        logger.warning("REALTIME_BROKER_URL is set but redis is not installed; using in-process pub/sub")
+                _broker = broker or InProcessBroker()
+    return _broker
+
+
+def get_unread_counts(user_id):
+    from .counters import get_unread_notification_count, get_unread_message_count
+
+    return {
+        'notifications': get_unread_notification_count(user_id),
+        'messages': get_unread_message_count(user_id),
+    }
+
+
+def publish_unread_counts(user_ids):
+    """
+    Push fresh unread counts to every listening tab of the given users once
+    the current transaction commits. Users with no open stream are skipped
+    without touching the database.
+    """
+    user_ids = set(user_ids)
+
+    def send():
+        broker = get_broker()
+        for user_id in user_ids:
+            if broker.has_subscribers(user_id):
+                broker.publish(user_id, get_unread_counts(user_id))
+
+    transaction.on_commit(send)
+
+
+def format_sse(payload, event='unread'):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
@@ -0,0 +1,211 @@
+"""
+Reminders for vaccinations, dewormings, deliveries and task due dates.
+
+The dates live on MedicalRecord (next_due_date, next_deworming_date,
+expected_delivery_date) and VetTask (due_date). Instead of scanning those
+tables, every date that needs a reminder has one UpcomingEvent row, written
+by the receivers in core.signals when the record is saved (and resynced with
+`manage.py rebuild_upcoming_events`). The periodic core.tasks.send_reminders
+job then reads only the partial index of events not yet notified whose
+`remind_at` has passed:
+
+    send_due_reminders()  # -> number of notifications sent
+
+An event is claimed by stamping `notified_at` before its notification is
+written, so overlapping sweeps never notify twice; moving a date clears the
+stamp and the new date is reminded again. Dates already in the past when
+they are recorded are stored as notified.
+"""
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import MedicalRecord, VetTask, UpcomingEvent, Notification
+from .utils import deliver_notifications
+
+DEFAULT_LEAD_TIMES = {
+    'vaccination': timedelta(days=3),
+    'deworming': timedelta(days=3),
+    'delivery': timedelta(days=7),
+    'task_due': timedelta(days=1),
+}
+
+# (kind, user_id, title, due_at) tuples an instance should have events for.
+Event = namedtuple('Event', ['kind', 'user_id', 'title', 'due_at'])
+
+
+def _start_of_day(date):
+    return timezone.make_aware(datetime.combine(date, time.min)) if date else None
+
+
+def _medical_record_events(record):
+    animal = record.animal
+    dates = [
+        ('vaccination', record.next_due_date, record.vaccine_name or 'Vaccination'),
+        ('deworming', record.next_deworming_date, record.dewormer_name or 'Deworming'),
+        ('delivery', record.expected_delivery_date, 'Expected delivery'),
+    ]
+    return [
+        Event(kind, record.veterinarian_id, f"{label} - {animal.name} ({animal.force_number})", _start_of_day(date))
+        for kind, date, label in dates if date
+    ]
+
+
+def _vet_task_events(task):
+    if task.status in ('completed', 'cancelled') or not task.due_date:
+        return []
+    return [Event('task_due', task.assigned_to_id, task.title, task.due_date)]
+
+
+# `branch` is the lookup of the row's branch id; `related` the select_related()
+# paths `events` needs.
+ReminderSource = namedtuple('ReminderSource', ['source', 'model', 'events', 'branch', 'related', 'dated'])
+
+REMINDER_SOURCES = [
+    ReminderSource(
+        'medical_record', MedicalRecord, _medical_record_events, 'animal.branch_id', ['animal'],
+        ['next_due_date', 'next_deworming_date', 'expected_delivery_date'],
+    ),
+    ReminderSource('vet_task', VetTask, _vet_task_events, 'branch_id', [], ['due_date']),
+]
+
+
+def get_reminder_source(model):
+    for source in REMINDER_SOURCES:
+        if source.model is model:
+            return source
+    return None
+
+
+def lead_time(kind):
+    return getattr(settings, 'REMINDER_LEAD_TIMES', {}).get(kind, DEFAULT_LEAD_TIMES[kind])
+
+
+def _branch_id(source, instance):
+    value = instance
+    for part in source.branch.split('.'):
+        value = getattr(value, part)
+    return value
+
+
+# ------------------------------
+# Keeping events current
+# ------------------------------
+
+def sync_events(model, instances, now=None):
+    """Bring the UpcomingEvents of some rows in line with their dates; returns rows written"""
+    source = get_reminder_source(model)
+    instances = [instance for instance in instances if instance.pk]
+    if not instances:
+        return 0
+    now = now or timezone.now()
+    existing = {
+        (event.object_id, event.kind): event
+        for event in UpcomingEvent.objects.filter(source=source.source, object_id__in=[i.pk for i in instances])
+    }
+
+    wanted, keep = [], set()
+    for instance in instances:
+        for event in source.events(instance):
+            key = (instance.pk, event.kind)
+            keep.add(key)
+            current = existing.get(key)
+            if current and (current.due_at, current.user_id, current.title) == (event.due_at, event.user_id, event.title):
+                continue
+            if current and current.due_at == event.due_at:
+                notified_at = current.notified_at
+            else:
+                # A new or moved date is reminded (again), unless it is already past.
+                notified_at = now if event.due_at <= now else None
+            wanted.append(UpcomingEvent(
+                kind=event.kind, source=source.source, object_id=instance.pk,
+                branch_id=_branch_id(source, instance), animal_id=instance.animal_id, user_id=event.user_id,
+                title=event.title[:255], due_at=event.due_at, remind_at=event.due_at - lead_time(event.kind),
+                notified_at=notified_at,
+            ))
+
+    stale = [event.pk for key, event in existing.items() if key not in keep]
+    if stale:
+        UpcomingEvent.objects.filter(pk__in=stale).delete()
+    if wanted:
+        UpcomingEvent.objects.bulk_create(
+            wanted,
+            update_conflicts=True,
+            unique_fields=['source', 'object_id', 'kind'],
+            update_fields=['branch', 'animal', 'user', 'title', 'due_at', 'remind_at', 'notified_at'],
+        )
+    return len(wanted)
+
+
+def remove_events(model, pk):
+    UpcomingEvent.objects.filter(source=get_reminder_source(model).source, object_id=pk).delete()
+
+
+def rebuild_upcoming_events(chunk_size=1000, now=None):
+    """
+    Bring every UpcomingEvent in line with the source tables in place;
+    returns {source: events written}. Events whose date is unchanged keep
+    their `notified_at`, so reminders already sent are not sent again.
+    """
+    counts = {}
+    UpcomingEvent.objects.exclude(source__in=[source.source for source in REMINDER_SOURCES]).delete()
+    for source in REMINDER_SOURCES:
+        # Only rows with at least one date can have events.
+        dated = source.model.objects.none()
+        for field in source.dated:
+            dated = dated | source.model.objects.filter(**{f'{field}__isnull': False})
+        UpcomingEvent.objects.filter(source=source.source).exclude(object_id__in=dated.values('pk')).delete()
+        rows = dated.select_related(*source.related).order_by('pk').iterator(chunk_size=chunk_size)
+        counts[source.source] = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                counts[source.source] += sync_events(source.model, batch, now=now)
+                batch = []
+        counts[source.source] += sync_events(source.model, batch, now=now)
+    return counts
+
+
+# ------------------------------
+# Sending reminders
+# ------------------------------
+
+def _notification(event):
+    when = timezone.localtime(event.due_at)
+    if event.kind == 'task_due':
+        message = f"Task '{event.title}' for {event.animal.name} is due {when:%Y-%m-%d %H:%M}."
+    else:
+        message = f"{event.title} is due on {when:%Y-%m-%d}."
+    return Notification(
+        user_id=event.user_id, notification_type='reminder',
+        title=f"{event.get_kind_display()}: {event.animal.name}", message=message,
+        link=f'/core/animals/{event.animal_id}/',
+    )
+
+
+def send_due_reminders(now=None, batch_size=None, max_batches=None):
+    """
+    Notify the events whose remind_at has passed, `batch_size` at a time and
+    at most `max_batches` batches per call; returns notifications sent.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or getattr(settings, 'REMINDER_BATCH_SIZE', 500)
+    max_batches = max_batches or getattr(settings, 'REMINDER_MAX_BATCHES', 20)
+    sent = 0
+    for _ in range(max_batches):
+        ids = list(
+            UpcomingEvent.objects.filter(notified_at__isnull=True, remind_at__lte=now)
+            .order_by('remind_at').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        claimed_at = timezone.now()
+        UpcomingEvent.objects.filter(pk__in=ids, notified_at__isnull=True).update(notified_at=claimed_at)
+        events = UpcomingEvent.objects.filter(pk__in=ids, notified_at=claimed_at).select_related('animal')
+        notifications = [_notification(event) for event in events if event.user_id]
+        deliver_notifications(notifications)
+        sent += len(notifications)
+    return sent
@@ -0,0 +1,310 @@
+"""
+Full-text search over animals, medical records, animal logs and incidents.
+
+Every indexed row has one SearchEntry (title, body, branch), written by the
+receivers in core.signals and rebuilt with `manage.py rebuild_search_index`.
+The text itself is indexed by the database:
+
+* SQLite: an FTS5 table over SearchEntry, ranked with bm25() and
+  highlighted with snippet()/highlight();
+* PostgreSQL: a weighted tsvector column with a GIN index, ranked with
+  ts_rank() and highlighted with ts_headline();
+* anything else: LIKE on the SearchEntry columns, unranked.
+
+Every term is matched as a prefix and all terms must match; search_filter()
+also matches force numbers anywhere inside.
+
+    hits = search('rex diarr', branch_ids=[user.branch_id])
+    records = search_filter(MedicalRecord.objects.filter(...), request.GET['q'])
+"""
+import re
+from collections import namedtuple
+from functools import reduce
+from operator import and_
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Animal, MedicalRecord, AnimalLog, EmergencyIncident, SearchEntry
+
+MAX_TERMS = 10
+SNIPPET_WORDS = 16
+# Control characters mark highlighted terms until the text has been escaped.
+MARK_START, MARK_END = '\x02', '\x03'
+
+SearchHit = namedtuple('SearchHit', ['kind', 'label', 'object_id', 'title', 'snippet', 'url', 'rank', 'branch_id'])
+
+
+# ------------------------------
+# Indexed sources
+# ------------------------------
+
+def _join(*parts):
+    return '\n'.join(str(part) for part in parts if part)
+
+
+def _animal_url(animal_id):
+    return f'/core/animals/{animal_id}/' if animal_id else ''
+
+
+def _animal_document(animal):
+    return {
+        'branch_id': animal.branch_id,
+        'title': f"{animal.name} ({animal.force_number})",
+        'body': _join(animal.force_number, animal.name, animal.breed, animal.owner_name, animal.get_species_display()),
+        'url': _animal_url(animal.pk),
+    }
+
+
+def _medical_record_document(record):
+    animal = record.animal
+    return {
+        'branch_id': animal.branch_id,
+        'title': f"{animal.name} ({animal.force_number}) - {record.get_report_type_display()}",
+        'body': _join(record.diagnosis, record.treatment, record.lab_test_name, record.test_result, record.sample_type),
+        'url': _animal_url(animal.pk),
+    }
+
+
+def _animal_log_document(log):
+    animal = log.animal
+    return {
+        'branch_id': animal.branch_id,
+        'title': f"{animal.name} ({animal.force_number}) - {log.get_activity_type_display()}",
+        'body': log.notes,
+        'url': _animal_url(animal.pk),
+    }
+
+
+def _incident_document(incident):
+    animal = incident.animal
+    subject = f"{animal.name} ({animal.force_number})" if animal else 'General'
+    return {
+        'branch_id': animal.branch_id if animal else incident.reporter.branch_id,
+        'title': f"{subject} - {incident.get_incident_type_display()}",
+        'body': _join(incident.description, incident.location, incident.resolution_notes),
+        'url': _animal_url(incident.animal_id),
+    }
+
+
+# `related` are select_related() paths needed by `document`; `animal_field`
+# names the FK whose title changes must be copied into this source's entries.
+SearchSource = namedtuple('SearchSource', ['kind', 'label', 'model', 'document', 'related', 'animal_field'])
+
+SEARCH_SOURCES = [
+    SearchSource('animal', 'Animals', Animal, _animal_document, [], None),
+    SearchSource('medical_record', 'Medical records', MedicalRecord, _medical_record_document, ['animal'], 'animal'),
+    SearchSource('animal_log', 'Animal logs', AnimalLog, _animal_log_document, ['animal'], 'animal'),
+    SearchSource('incident', 'Incidents', EmergencyIncident, _incident_document, ['animal', 'reporter'], 'animal'),
+]
+SOURCES_BY_KIND = {source.kind: source for source in SEARCH_SOURCES}
+
+
+def get_search_source(model):
+    for source in SEARCH_SOURCES:
+        if source.model is model:
+            return source
+    return None
+
+
+# ------------------------------
+# Index maintenance
+# ------------------------------
+
+def _entry(source, instance):
+    document = source.document(instance)
+    return SearchEntry(
+        kind=source.kind,
+        object_id=instance.pk,
+        branch_id=document['branch_id'],
+        title=document['title'][:255],
+        body=document['body'] or '',
+        url=document['url'],
+    )
+
+
+def index_objects(model, instances):
+    """(Re)index rows of a searchable model; also used after bulk_create()"""
+    source = get_search_source(model)
+    entries = [_entry(source, instance) for instance in instances]
+    if not entries:
+        return 0
+    SearchEntry.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=['kind', 'object_id'],
+        update_fields=['branch', 'title', 'body', 'url', 'updated_at'],
+    )
+    return len(entries)
+
+
+def unindex_object(model, pk):
+    SearchEntry.objects.filter(kind=get_search_source(model).kind, object_id=pk).delete()
+
+
+def reindex_animal_dependents(animal):
+    """Refresh the entries whose title repeats the animal's name and force number"""
+    for source in SEARCH_SOURCES:
+        if source.animal_field:
+            rows = source.model.objects.filter(**{source.animal_field: animal}).select_related(*source.related)
+            index_objects(source.model, rows)
+
+
+def rebuild_search_index(chunk_size=1000):
+    """Drop and rebuild every SearchEntry; returns {kind: rows indexed}"""
+    counts = {}
+    with transaction.atomic():
+        SearchEntry.objects.all().delete()
+        for source in SEARCH_SOURCES:
+            rows = source.model.objects.select_related(*source.related).iterator(chunk_size=chunk_size)
+            counts[source.kind] = 0
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= chunk_size:
+                    counts[source.kind] += index_objects(source.model, batch)
+                    batch = []
+            counts[source.kind] += index_objects(source.model, batch)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO core_searchentry_fts(core_searchentry_fts) VALUES ('optimize')")
+    return counts
+
+
+# ------------------------------
+# Query backends
+# ------------------------------
+
+def search_terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def _scope_sql(kinds, branch_ids):
+    clauses, params = [], []
+    if kinds:
+        clauses.append(f"e.kind IN ({', '.join(['%s'] * len(kinds))})")
+        params += list(kinds)
+    if branch_ids is not None:
+        if not branch_ids:
+            clauses.append('1 = 0')
+        else:
+            clauses.append(f"e.branch_id IN ({', '.join(['%s'] * len(branch_ids))})")
+            params += list(branch_ids)
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+
+def _sqlite_match(terms):
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _postgres_match(terms):
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def _sqlite_search(terms, kinds, branch_ids, limit):
+    scope, params = _scope_sql(kinds, branch_ids)
+    sql = (
+        "SELECT e.kind, e.object_id, e.branch_id, e.url, "
+        f"highlight(core_searchentry_fts, 0, '{MARK_START}', '{MARK_END}'), "
+        f"snippet(core_searchentry_fts, 1, '{MARK_START}', '{MARK_END}', '…', {SNIPPET_WORDS}), "
+        "bm25(core_searchentry_fts, 4.0, 1.0) AS score "
+        "FROM core_searchentry_fts JOIN core_searchentry e ON e.id = core_searchentry_fts.rowid "
+        f"WHERE core_searchentry_fts MATCH %s{scope} ORDER BY score LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_sqlite_match(terms), *params, limit])
+        # bm25() is lower-is-better; flip it so larger ranks are better everywhere.
+        return [(*row[:6], -row[6]) for row in cursor.fetchall()]
+
+
+def _postgres_search(terms, kinds, branch_ids, limit):
+    scope, params = _scope_sql(kinds, branch_ids)
+    options = f'StartSel="{MARK_START}", StopSel="{MARK_END}", MaxWords={SNIPPET_WORDS}, MinWords=5'
+    sql = (
+        "SELECT e.kind, e.object_id, e.branch_id, e.url, "
+        "ts_headline('simple', e.title, q, %s), ts_headline('simple', e.body, q, %s), "
+        "ts_rank(e.search_vector, q) AS score "
+        "FROM core_searchentry e, to_tsquery('simple', %s) q "
+        f"WHERE e.search_vector @@ q{scope} ORDER BY score DESC LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [options, options, _postgres_match(terms), *params, limit])
+        return cursor.fetchall()
+
+
+def _fallback_conditions(terms):
+    return reduce(and_, (Q(title__icontains=term) | Q(body__icontains=term) for term in terms))
+
+
+def _fallback_search(terms, kinds, branch_ids, limit):
+    entries = SearchEntry.objects.filter(_fallback_conditions(terms))
+    if kinds:
+        entries = entries.filter(kind__in=kinds)
+    if branch_ids is not None:
+        entries = entries.filter(branch_id__in=branch_ids)
+    return [
+        (entry.kind, entry.object_id, entry.branch_id, entry.url, entry.title, entry.body[:200], 0.0)
+        for entry in entries.order_by('-updated_at')[:limit]
+    ]
+
+
+def _highlight(text):
+    return mark_safe(escape(text or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+# ------------------------------
+# Public API
+# ------------------------------
+
+def search(query, branch_ids=None, kinds=None, limit=20):
+    """
+    Best-ranked SearchHits for `query`. `branch_ids` limits the results to
+    those branches (None means every branch); `kinds` to some sources.
+    Titles and snippets are HTML-escaped with the matches in <mark>.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    backend = {'sqlite': _sqlite_search, 'postgresql': _postgres_search}.get(connection.vendor, _fallback_search)
+    return [
+        SearchHit(
+            kind=kind, label=SOURCES_BY_KIND[kind].label, object_id=object_id,
+            title=_highlight(title), snippet=_highlight(snippet),
+            url=url, rank=rank, branch_id=branch_id,
+        )
+        for kind, object_id, branch_id, url, title, snippet, rank in backend(terms, kinds, branch_ids, limit)
+    ]
+
+
+def search_filter(queryset, query):
+    """
+    Narrow a queryset of a searchable model to the rows matching `query`,
+    keeping its own ordering; replaces chains of `__icontains` filters.
+    Force numbers also match anywhere inside ("123" finds K9-0123).
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset if not (query or '').strip() else queryset.none()
+    source = get_search_source(queryset.model)
+    kind = source.kind
+    force_number = f'{source.animal_field}__force_number' if source.animal_field else 'force_number'
+
+    if connection.vendor == 'sqlite':
+        matches = RawSQL(
+            "SELECT e.object_id FROM core_searchentry_fts "
+            "JOIN core_searchentry e ON e.id = core_searchentry_fts.rowid "
+            "WHERE core_searchentry_fts MATCH %s AND e.kind = %s",
+            (_sqlite_match(terms), kind),
+        )
+    elif connection.vendor == 'postgresql':
+        matches = RawSQL(
+            "SELECT e.object_id FROM core_searchentry e "
+            "WHERE e.search_vector @@ to_tsquery('simple', %s) AND e.kind = %s",
+            (_postgres_match(terms), kind),
+        )
+    else:
+        matches = SearchEntry.objects.filter(_fallback_conditions(terms), kind=kind).values('object_id')
+    return queryset.filter(Q(pk__in=matches) | Q(**{f'{force_number}__icontains': query.strip()}))
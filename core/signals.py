@@ -0,0 +1,448 @@
+from django.contrib.auth.models import Group
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.utils import timezone
+
+from accounts.models import CustomUser
+
+from .activity import ACTIVITY_SOURCES, get_activity_source, record_activity
+from .branches import invalidate_branch_registry
+from .counters import adjust_counters, notification_counter_keys, message_counter_keys
+from .fragments import FRAGMENT_SOURCES, get_fragment_source, bump_fragment_versions
+from .identity import invalidate_user_snapshot, invalidate_all_user_snapshots
+from .images import PHOTO_FIELDS, schedule_photo_processing, strip_metadata
+from .models import Notification, Message, Animal, Branch, VetTask, MedicalRecord
+from .performance import local_day, rollup_vet_stats
+from .realtime import publish_unread_counts
+from .reminders import REMINDER_SOURCES, sync_events, remove_events
+from .search import SEARCH_SOURCES, index_objects, unindex_object, reindex_animal_dependents
+from .storage import blob_models, content_addressed_fields, adjust_blob_refcounts
+from .stats import STAT_SOURCES, get_stat_source, stat_contributions, apply_stat_deltas, recompute_branch_stats
+
+STAT_MODELS = [source.model for source in STAT_SOURCES]
+
+
+def _tracked_fields(source):
+    flags = [lookup for lookup, _ in (source.flag_fields or {}).values()]
+    return [source.branch, source.day] + (['status'] if source.status_fields else []) + flags
+
+
+def _lookup_value(instance, lookup):
+    """Follow a value lookup (e.g. 'animal__branch_id') on a model instance"""
+    value = instance
+    for part in lookup.split('__'):
+        value = getattr(value, part, None) if value is not None else None
+    return value
+
+
+def _instance_values(source, instance):
+    """
+    Read the tracked lookups (e.g. 'animal__branch_id') off a model instance.
+    """
+    return {lookup: _lookup_value(instance, lookup) for lookup in _tracked_fields(source)}
+
+
+# ------------------------------
+# Branch statistics
+# ------------------------------
+
+def remember_previous_stat_values(sender, instance, raw=False, **kwargs):
+    """Capture the row as stored before an update so deltas can be computed"""
+    if raw:
+        return
+    instance._stats_previous = None
+    if instance.pk and not instance._state.adding:
+        source = get_stat_source(sender)
+        instance._stats_previous = (
+            sender.objects.filter(pk=instance.pk).values(*_tracked_fields(source)).first()
+        )
+
+
+def update_stats_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    source = get_stat_source(sender)
+    previous = getattr(instance, '_stats_previous', None)
+    if sender is Animal and previous and previous['branch_id'] != instance.branch_id:
+        # The animal's medical records are counted through animal__branch_id, so both branches are recounted
+        recompute_branch_stats([previous['branch_id'], instance.branch_id])
+        return
+    apply_stat_deltas(
+        added=stat_contributions(source, _instance_values(source, instance)),
+        removed=stat_contributions(source, previous) if previous else (),
+    )
+
+
+def update_stats_on_delete(sender, instance, **kwargs):
+    source = get_stat_source(sender)
+    apply_stat_deltas(removed=stat_contributions(source, _instance_values(source, instance)))
+
+
+for model in STAT_MODELS:
+    pre_save.connect(remember_previous_stat_values, sender=model, dispatch_uid=f'stats_pre_save_{model.__name__}')
+    post_save.connect(update_stats_on_save, sender=model, dispatch_uid=f'stats_post_save_{model.__name__}')
+    post_delete.connect(update_stats_on_delete, sender=model, dispatch_uid=f'stats_post_delete_{model.__name__}')
+
+
+# ------------------------------
+# Unread counters cache
+# ------------------------------
+# Connected before the push receivers below so the cached counters are
+# adjusted before the on-commit push reads them.
+
+UNREAD_COUNTER_FIELDS = {
+    Notification: (['user_id', 'is_read'], notification_counter_keys),
+    Message: (['receiver_id', 'branch_id', 'is_read', 'is_deleted'], message_counter_keys),
+}
+
+
+def remember_previous_unread_state(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._unread_previous = None
+    if instance.pk and not instance._state.adding:
+        fields, _ = UNREAD_COUNTER_FIELDS[sender]
+        instance._unread_previous = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+def update_unread_counters_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    fields, counter_keys = UNREAD_COUNTER_FIELDS[sender]
+    adjust_counters(
+        added=counter_keys({field: getattr(instance, field) for field in fields}),
+        removed=counter_keys(getattr(instance, '_unread_previous', None)),
+    )
+
+
+def update_unread_counters_on_delete(sender, instance, **kwargs):
+    fields, counter_keys = UNREAD_COUNTER_FIELDS[sender]
+    adjust_counters(removed=counter_keys({field: getattr(instance, field) for field in fields}))
+
+
+for model in UNREAD_COUNTER_FIELDS:
+    pre_save.connect(remember_previous_unread_state, sender=model, dispatch_uid=f'unread_pre_save_{model.__name__}')
+    post_save.connect(update_unread_counters_on_save, sender=model, dispatch_uid=f'unread_post_save_{model.__name__}')
+    post_delete.connect(update_unread_counters_on_delete, sender=model, dispatch_uid=f'unread_post_delete_{model.__name__}')
+
+
+# ------------------------------
+# Unread counters push
+# ------------------------------
+
+def push_notification_counts(sender, instance, raw=False, **kwargs):
+    if not raw:
+        publish_unread_counts([instance.user_id])
+
+
+def push_message_counts(sender, instance, raw=False, **kwargs):
+    if not raw:
+        publish_unread_counts([instance.receiver_id])
+
+
+for signal in (post_save, post_delete):
+    signal.connect(push_notification_counts, sender=Notification, dispatch_uid=f'push_notification_{signal is post_save}')
+    signal.connect(push_message_counts, sender=Message, dispatch_uid=f'push_message_{signal is post_save}')
+
+
+# ------------------------------
+# Search index
+# ------------------------------
+
+# Animal values copied into its dependents' entries (title and branch).
+ANIMAL_DEPENDENT_FIELDS = ('name', 'force_number', 'branch_id')
+
+
+def remember_previous_animal_title(sender, instance, raw=False, **kwargs):
+    instance._search_previous = None
+    if not raw and instance.pk and not instance._state.adding:
+        instance._search_previous = sender.objects.filter(pk=instance.pk).values(*ANIMAL_DEPENDENT_FIELDS).first()
+
+
+def update_search_index_on_save(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    index_objects(sender, [instance])
+    previous = getattr(instance, '_search_previous', None)
+    if sender is Animal and previous and previous != {field: getattr(instance, field) for field in ANIMAL_DEPENDENT_FIELDS}:
+        reindex_animal_dependents(instance)
+
+
+def update_search_index_on_delete(sender, instance, **kwargs):
+    unindex_object(sender, instance.pk)
+
+
+pre_save.connect(remember_previous_animal_title, sender=Animal, dispatch_uid='search_pre_save_Animal')
+for source in SEARCH_SOURCES:
+    post_save.connect(update_search_index_on_save, sender=source.model, dispatch_uid=f'search_post_save_{source.model.__name__}')
+    post_delete.connect(update_search_index_on_delete, sender=source.model, dispatch_uid=f'search_post_delete_{source.model.__name__}')
+
+
+# ------------------------------
+# Photo thumbnails
+# ------------------------------
+# Derivatives are made after commit so the worker sees the new file name.
+# New uploads lose their metadata before the field stores them.
+
+def _photo_field_name(sender):
+    return dict(PHOTO_FIELDS)[sender]
+
+
+def remember_previous_photo(sender, instance, raw=False, update_fields=None, **kwargs):
+    field_name = _photo_field_name(sender)
+    instance._photo_previous = None
+    if raw or instance._state.adding or not instance.pk:
+        return
+    if update_fields is not None and field_name not in update_fields:
+        instance._photo_previous = getattr(instance, field_name).name or ''
+        return
+    instance._photo_previous = sender.objects.filter(pk=instance.pk).values_list(field_name, flat=True).first() or ''
+
+
+def strip_photo_metadata(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    field_file = getattr(instance, _photo_field_name(sender))
+    if not field_file or field_file._committed:
+        return
+    content = strip_metadata(field_file.file)
+    if content is not None:
+        field_file.file = ContentFile(content, name=field_file.name)
+
+
+def schedule_thumbnails_on_save(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    field_name = _photo_field_name(sender)
+    current = getattr(instance, field_name).name or ''
+    previous = '' if created else getattr(instance, '_photo_previous', None)
+    if previous is None or current == previous:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: schedule_photo_processing(sender, pk, field_name))
+
+
+for model, _ in PHOTO_FIELDS:
+    pre_save.connect(remember_previous_photo, sender=model, dispatch_uid=f'photo_pre_save_{model.__name__}')
+    pre_save.connect(strip_photo_metadata, sender=model, dispatch_uid=f'photo_strip_metadata_{model.__name__}')
+    post_save.connect(schedule_thumbnails_on_save, sender=model, dispatch_uid=f'photo_post_save_{model.__name__}')
+
+
+# ------------------------------
+# Content-addressed blob references
+# ------------------------------
+
+BLOB_FIELDS = {model: content_addressed_fields(model) for model in blob_models()}
+
+
+def _blob_names(instance, fields):
+    return [getattr(instance, field).name or '' for field in fields]
+
+
+def remember_previous_blobs(sender, instance, raw=False, **kwargs):
+    instance._blobs_previous = []
+    if not raw and instance.pk and not instance._state.adding:
+        row = sender.objects.filter(pk=instance.pk).values_list(*BLOB_FIELDS[sender]).first()
+        instance._blobs_previous = [name or '' for name in row or []]
+
+
+def update_blob_refcounts_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = _blob_names(instance, BLOB_FIELDS[sender])
+    previous = getattr(instance, '_blobs_previous', [])
+    if current != previous:
+        adjust_blob_refcounts(added=current, removed=previous)
+
+
+def update_blob_refcounts_on_delete(sender, instance, **kwargs):
+    adjust_blob_refcounts(removed=_blob_names(instance, BLOB_FIELDS[sender]))
+
+
+for model in BLOB_FIELDS:
+    pre_save.connect(remember_previous_blobs, sender=model, dispatch_uid=f'blobs_pre_save_{model.__name__}')
+    post_save.connect(update_blob_refcounts_on_save, sender=model, dispatch_uid=f'blobs_post_save_{model.__name__}')
+    post_delete.connect(update_blob_refcounts_on_delete, sender=model, dispatch_uid=f'blobs_post_delete_{model.__name__}')
+
+
+# ------------------------------
+# Reminders
+# ------------------------------
+
+def sync_reminders_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    sync_events(sender, [instance])
+
+
+def remove_reminders_on_delete(sender, instance, **kwargs):
+    remove_events(sender, instance.pk)
+
+
+for source in REMINDER_SOURCES:
+    post_save.connect(sync_reminders_on_save, sender=source.model, dispatch_uid=f'reminders_post_save_{source.model.__name__}')
+    post_delete.connect(remove_reminders_on_delete, sender=source.model, dispatch_uid=f'reminders_post_delete_{source.model.__name__}')
+
+
+# ------------------------------
+# Vet performance rollup
+# ------------------------------
+
+def _completed_day(values):
+    if values and values['status'] == 'completed' and values['completed_at']:
+        return (values['assigned_to_id'], local_day(values['completed_at']))
+    return None
+
+
+def _performance_values(instance):
+    return {'status': instance.status, 'completed_at': instance.completed_at, 'assigned_to_id': instance.assigned_to_id}
+
+
+def stamp_task_completion(sender, instance, raw=False, **kwargs):
+    """Fill completed_at when a task is saved as completed and remember the stored row"""
+    instance._performance_previous = None
+    if raw:
+        return
+    if instance.status == 'completed' and not instance.completed_at:
+        instance.completed_at = timezone.now()
+    if instance.pk and not instance._state.adding:
+        instance._performance_previous = (
+            sender.objects.filter(pk=instance.pk).values('status', 'completed_at', 'assigned_to_id').first()
+        )
+
+
+def update_performance_on_task_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_performance_previous', None)
+    current = _performance_values(instance)
+    if previous == current:
+        return
+    for day in {_completed_day(previous), _completed_day(current)} - {None}:
+        rollup_vet_stats(day[1], vet_ids=[day[0]])
+
+
+def update_performance_on_task_delete(sender, instance, **kwargs):
+    day = _completed_day(_performance_values(instance))
+    if day:
+        rollup_vet_stats(day[1], vet_ids=[day[0]])
+
+
+def update_performance_on_record_change(sender, instance, raw=False, created=True, **kwargs):
+    if raw or not created:
+        return
+    rollup_vet_stats(local_day(instance.date_recorded), vet_ids=[instance.veterinarian_id])
+
+
+pre_save.connect(stamp_task_completion, sender=VetTask, dispatch_uid='performance_pre_save_VetTask')
+post_save.connect(update_performance_on_task_save, sender=VetTask, dispatch_uid='performance_post_save_VetTask')
+post_delete.connect(update_performance_on_task_delete, sender=VetTask, dispatch_uid='performance_post_delete_VetTask')
+post_save.connect(update_performance_on_record_change, sender=MedicalRecord, dispatch_uid='performance_post_save_MedicalRecord')
+post_delete.connect(update_performance_on_record_change, sender=MedicalRecord, dispatch_uid='performance_post_delete_MedicalRecord')
+
+
+# ------------------------------
+# Activity feed
+# ------------------------------
+
+def remember_previous_activity_state(sender, instance, raw=False, **kwargs):
+    state = get_activity_source(sender).state
+    instance._activity_previous = None
+    if not raw and instance.pk and not instance._state.adding:
+        instance._activity_previous = sender.objects.filter(pk=instance.pk).values_list(state, flat=True).first()
+
+
+def record_activity_on_save(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    state = get_activity_source(sender).state
+    if created:
+        record_activity(sender, instance, 'created')
+    elif state and getattr(instance, '_activity_previous', None) != getattr(instance, state):
+        record_activity(sender, instance, 'changed')
+
+
+for source in ACTIVITY_SOURCES:
+    if source.state:
+        pre_save.connect(remember_previous_activity_state, sender=source.model, dispatch_uid=f'activity_pre_save_{source.model.__name__}')
+    post_save.connect(record_activity_on_save, sender=source.model, dispatch_uid=f'activity_post_save_{source.model.__name__}')
+
+
+# ------------------------------
+# Branch registry
+# ------------------------------
+
+def invalidate_branch_registry_on_change(sender, instance, raw=False, **kwargs):
+    invalidate_branch_registry()
+
+
+post_save.connect(invalidate_branch_registry_on_change, sender=Branch, dispatch_uid='branches_post_save')
+post_delete.connect(invalidate_branch_registry_on_change, sender=Branch, dispatch_uid='branches_post_delete')
+
+
+# ------------------------------
+# User snapshots
+# ------------------------------
+
+def invalidate_user_snapshot_on_change(sender, instance, raw=False, **kwargs):
+    invalidate_user_snapshot(instance.pk)
+
+
+def invalidate_user_snapshot_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_user_snapshot(instance.pk)
+    elif pk_set is None:
+        # group.user_set.clear(): the affected users are no longer known
+        invalidate_all_user_snapshots()
+    else:
+        for user_id in pk_set:
+            invalidate_user_snapshot(user_id)
+
+
+def invalidate_all_user_snapshots_on_change(sender, **kwargs):
+    invalidate_all_user_snapshots()
+
+
+post_save.connect(invalidate_user_snapshot_on_change, sender=CustomUser, dispatch_uid='user_snapshot_post_save')
+post_delete.connect(invalidate_user_snapshot_on_change, sender=CustomUser, dispatch_uid='user_snapshot_post_delete')
+m2m_changed.connect(invalidate_user_snapshot_on_m2m, sender=CustomUser.groups.through, dispatch_uid='user_snapshot_groups')
+m2m_changed.connect(
+    invalidate_user_snapshot_on_m2m, sender=CustomUser.user_permissions.through, dispatch_uid='user_snapshot_permissions',
+)
+m2m_changed.connect(
+    invalidate_all_user_snapshots_on_change, sender=Group.permissions.through, dispatch_uid='user_snapshot_group_permissions',
+)
+post_delete.connect(invalidate_all_user_snapshots_on_change, sender=Group, dispatch_uid='user_snapshot_group_delete')
+
+
+# ------------------------------
+# Dashboard fragment versions
+# ------------------------------
+
+def _fragment_branch_ids(source, instance):
+    branch_ids = {_lookup_value(instance, source.branch)}
+    # The stats receivers above remember the stored row, which tells where a moved row came from.
+    previous = getattr(instance, '_stats_previous', None)
+    if previous and source.branch in previous:
+        branch_ids.add(previous[source.branch])
+    return branch_ids
+
+
+def bump_fragments_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    source = get_fragment_source(sender)
+    bump_fragment_versions([source.topic], _fragment_branch_ids(source, instance))
+
+
+def bump_fragments_on_delete(sender, instance, **kwargs):
+    source = get_fragment_source(sender)
+    bump_fragment_versions([source.topic], _fragment_branch_ids(source, instance))
+
+
+for source in FRAGMENT_SOURCES:
+    post_save.connect(bump_fragments_on_save, sender=source.model, dispatch_uid=f'fragments_post_save_{source.topic}')
+    post_delete.connect(bump_fragments_on_delete, sender=source.model, dispatch_uid=f'fragments_post_delete_{source.topic}')
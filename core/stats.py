@@ -0,0 +1,314 @@
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .fragments import bump_fragment_versions
+from .models import (
+    Branch, BranchStats, BranchDailyStats, Animal, VetTask,
+    MedicalRecord, SupportTicket, DailyActivityReport
+)
+
+TASK_STATUS_FIELDS = {
+    'pending': 'tasks_pending',
+    'in_progress': 'tasks_in_progress',
+    'completed': 'tasks_completed',
+    'cancelled': 'tasks_cancelled',
+}
+
+TICKET_STATUS_FIELDS = {
+    'open': 'tickets_open',
+    'in_progress': 'tickets_in_progress',
+    'resolved': 'tickets_resolved',
+    'closed': 'tickets_closed',
+}
+
+# Rows with the field set and one of the statuses count towards the column.
+TASK_FLAG_FIELDS = {
+    'tasks_overdue': ('overdue_since', ('pending', 'in_progress')),
+}
+
+# How each source model feeds the BranchStats / BranchDailyStats counters.
+# `branch` and `day` are value lookups on the source model; `total` and
+# `daily` name the counter columns that every row contributes 1 to.
+StatSource = namedtuple('StatSource', ['model', 'branch', 'day', 'total', 'daily', 'status_fields', 'flag_fields'])
+
+STAT_SOURCES = [
+    StatSource(Animal, 'branch_id', 'created_at', 'animal_count', 'animals_added', None, None),
+    StatSource(VetTask, 'branch_id', 'created_at', 'task_count', 'tasks_created', TASK_STATUS_FIELDS, TASK_FLAG_FIELDS),
+    StatSource(MedicalRecord, 'animal__branch_id', 'date_recorded', 'medical_record_count', 'medical_records_added', None, None),
+    StatSource(SupportTicket, 'branch_id', 'created_at', None, 'tickets_opened', TICKET_STATUS_FIELDS, None),
+    StatSource(DailyActivityReport, 'branch_id', 'date', 'report_count', 'report_count', None, None),
+]
+
+TOTAL_FIELDS = [
+    field.name for field in BranchStats._meta.concrete_fields
+    if field.name not in ('id', 'branch', 'updated_at')
+]
+DAILY_FIELDS = [
+    field.name for field in BranchDailyStats._meta.concrete_fields
+    if field.name not in ('id', 'branch', 'date')
+]
+
+
+def get_stat_source(model):
+    for source in STAT_SOURCES:
+        if source.model is model:
+            return source
+    return None
+
+
+def _to_day(value):
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _day_expression(source):
+    field = source.model._meta.get_field(source.day)
+    if field.get_internal_type() == 'DateTimeField':
+        return TruncDate(source.day)
+    return F(source.day)
+
+
+# ------------------------------
+# Full recomputation
+# ------------------------------
+
+def compute_branch_totals(branch_ids=None):
+    """
+    Count every tracked source grouped by branch.
+    Returns {branch_id: {counter_field: value}} with one query per source.
+    """
+    totals = defaultdict(lambda: dict.fromkeys(TOTAL_FIELDS, 0))
+
+    for source in STAT_SOURCES:
+        queryset = source.model.objects.all()
+        if branch_ids is not None:
+            queryset = queryset.filter(**{f'{source.branch}__in': branch_ids})
+
+        group_by = [source.branch] + (['status'] if source.status_fields else [])
+        flags = {
+            field: Count('id', filter=Q(**{f'{lookup}__isnull': False, 'status__in': statuses}))
+            for field, (lookup, statuses) in (source.flag_fields or {}).items()
+        }
+        for row in queryset.values(*group_by).annotate(n=Count('id'), **flags).order_by():
+            branch_id = row[source.branch]
+            if branch_id is None:
+                continue
+            if source.total:
+                totals[branch_id][source.total] += row['n']
+            if source.status_fields and row['status'] in source.status_fields:
+                totals[branch_id][source.status_fields[row['status']]] += row['n']
+            for field in flags:
+                totals[branch_id][field] += row[field]
+
+    return totals
+
+
+def compute_daily_stats(day=None, branch_ids=None):
+    """
+    Count every tracked source grouped by branch and local date.
+    Returns {(branch_id, date): {counter_field: value}}.
+    """
+    daily = defaultdict(lambda: dict.fromkeys(DAILY_FIELDS, 0))
+
+    for source in STAT_SOURCES:
+        queryset = source.model.objects.annotate(stat_day=_day_expression(source))
+        if day is not None:
+            queryset = queryset.filter(stat_day=day)
+        if branch_ids is not None:
+            queryset = queryset.filter(**{f'{source.branch}__in': branch_ids})
+
+        for row in queryset.values(source.branch, 'stat_day').annotate(n=Count('id')).order_by():
+            if row[source.branch] is None or row['stat_day'] is None:
+                continue
+            daily[(row[source.branch], row['stat_day'])][source.daily] += row['n']
+
+    return daily
+
+
+def rebuild_branch_stats():
+    """
+    Drop and recompute every BranchStats and BranchDailyStats row.
+    Returns (branch rows, daily rows) written.
+    """
+    branch_ids = list(Branch.objects.values_list('id', flat=True))
+
+    with transaction.atomic():
+        BranchStats.objects.all().delete()
+        BranchDailyStats.objects.all().delete()
+
+        totals = compute_branch_totals()
+        BranchStats.objects.bulk_create([
+            BranchStats(branch_id=branch_id, **totals[branch_id])
+            for branch_id in branch_ids
+        ])
+
+        daily = compute_daily_stats()
+        BranchDailyStats.objects.bulk_create([
+            BranchDailyStats(branch_id=branch_id, date=day, **counters)
+            for (branch_id, day), counters in daily.items()
+        ])
+
+    return len(branch_ids), len(daily)
+
+
+# ------------------------------
+# Incremental updates (called from core.signals)
+# ------------------------------
+
+def stat_contributions(source, values):
+    """
+    List the (branch_id, day, field) counters a single row contributes 1 to.
+    `day` is None for BranchStats columns.
+    """
+    branch_id = values.get(source.branch)
+    if branch_id is None:
+        return []
+
+    keys = []
+    if source.total:
+        keys.append((branch_id, None, source.total))
+    if source.status_fields and values.get('status') in source.status_fields:
+        keys.append((branch_id, None, source.status_fields[values['status']]))
+    for field, (lookup, statuses) in (source.flag_fields or {}).items():
+        if values.get(lookup) is not None and values.get('status') in statuses:
+            keys.append((branch_id, None, field))
+    if values.get(source.day) is not None:
+        keys.append((branch_id, _to_day(values[source.day]), source.daily))
+    return keys
+
+
+def apply_stat_deltas(added=(), removed=()):
+    """
+    Apply +1 for every key in `added` and -1 for every key in `removed`.
+
+    Only existing rows are updated; missing rows are computed from scratch
+    the first time they are read, so they never miss a write. Dashboard
+    fragments depending on 'stats' are invalidated for the branches touched.
+    """
+    deltas = Counter(added)
+    deltas.subtract(Counter(removed))
+
+    grouped = defaultdict(dict)
+    for (branch_id, day, field), amount in deltas.items():
+        if amount:
+            grouped[(branch_id, day)][field] = F(field) + amount
+
+    if grouped:
+        bump_fragment_versions(['stats'], {branch_id for branch_id, _ in grouped})
+    for (branch_id, day), updates in grouped.items():
+        if day is None:
+            BranchStats.objects.filter(branch_id=branch_id).update(updated_at=timezone.now(), **updates)
+        else:
+            BranchDailyStats.objects.filter(branch_id=branch_id, date=day).update(**updates)
+
+
+def recompute_branch_stats(branch_ids):
+    """
+    Recount the existing BranchStats and BranchDailyStats rows of `branch_ids`
+    from the source tables, for changes that move rows the deltas can't see
+    (an animal changing branch takes its medical records along).
+    """
+    branch_ids = [branch_id for branch_id in branch_ids if branch_id is not None]
+    if not branch_ids:
+        return
+    totals = compute_branch_totals(branch_ids)
+    rows = list(BranchStats.objects.filter(branch_id__in=branch_ids))
+    for row in rows:
+        for field, value in totals[row.branch_id].items():
+            setattr(row, field, value)
+        row.updated_at = timezone.now()
+    BranchStats.objects.bulk_update(rows, TOTAL_FIELDS + ['updated_at'])
+
+    daily = compute_daily_stats(branch_ids=branch_ids)
+    daily_rows = list(BranchDailyStats.objects.filter(branch_id__in=branch_ids))
+    for row in daily_rows:
+        for field, value in daily[(row.branch_id, row.date)].items():
+            setattr(row, field, value)
+    BranchDailyStats.objects.bulk_update(daily_rows, DAILY_FIELDS)
+    bump_fragment_versions(['stats'], branch_ids)
+
+
+def apply_created_stats(model, instances):
+    """Count rows inserted with bulk_create(), which skips the post_save signal"""
+    source = get_stat_source(model)
+    added = []
+    for instance in instances:
+        values = {}
+        for lookup in (source.branch, source.day):
+            value = instance
+            for part in lookup.split('__'):
+                value = getattr(value, part)
+            values[lookup] = value
+        added.extend(stat_contributions(source, values))
+    apply_stat_deltas(added=added)
+
+
+# ------------------------------
+# Readers
+# ------------------------------
+
+def _create_branch_stats(branch_ids):
+    totals = compute_branch_totals(branch_ids)
+    BranchStats.objects.bulk_create(
+        [BranchStats(branch_id=branch_id, **totals[branch_id]) for branch_id in branch_ids],
+        ignore_conflicts=True,
+    )
+
+
+def _create_daily_stats(branch_ids, day):
+    daily = compute_daily_stats(day=day, branch_ids=branch_ids)
+    BranchDailyStats.objects.bulk_create(
+        [BranchDailyStats(branch_id=branch_id, date=day, **daily[(branch_id, day)]) for branch_id in branch_ids],
+        ignore_conflicts=True,
+    )
+
+
+def get_branch_stats(branch):
+    """
+    Return the BranchStats row for a branch, building it on first access.
+    """
+    stats = BranchStats.objects.filter(branch=branch).first()
+    if stats is None:
+        _create_branch_stats([branch.id])
+        stats = BranchStats.objects.get(branch=branch)
+    return stats
+
+
+def get_daily_stats(branch, day=None):
+    """
+    Return the BranchDailyStats row for a branch and day (default today).
+    """
+    day = day or timezone.localdate()
+    stats = BranchDailyStats.objects.filter(branch=branch, date=day).first()
+    if stats is None:
+        _create_daily_stats([branch.id], day)
+        stats = BranchDailyStats.objects.get(branch=branch, date=day)
+    return stats
+
+
+def get_stats_totals(day=None):
+    """
+    Sum the BranchStats rows of all branches, plus the daily rollup for
+    `day` (default today) under the `today` key.
+    """
+    day = day or timezone.localdate()
+
+    missing = list(Branch.objects.filter(stats__isnull=True).values_list('id', flat=True))
+    if missing:
+        _create_branch_stats(missing)
+    missing_daily = list(Branch.objects.exclude(daily_stats__date=day).values_list('id', flat=True))
+    if missing_daily:
+        _create_daily_stats(missing_daily, day)
+
+    totals = BranchStats.objects.aggregate(**{field: Sum(field) for field in TOTAL_FIELDS})
+    today = BranchDailyStats.objects.filter(date=day).aggregate(**{field: Sum(field) for field in DAILY_FIELDS})
+
+    totals = {field: value or 0 for field, value in totals.items()}
+    totals['today'] = {field: value or 0 for field, value in today.items()}
+    return totals
@@ -0,0 +1,264 @@
+"""
+Content-addressed storage for uploaded files.
+
+Every upload is streamed to a temporary file while its SHA-256 is computed
+and then stored as `blobs/<hash[:2]>/<hash><ext>`, so the same picture
+uploaded seven times occupies the disk once and every row points at the same
+name. The StoredBlob table keeps one row per blob with the number of model
+fields referencing it; the receivers in core.signals adjust the counts when
+rows are saved or deleted, and `manage.py collect_media_garbage` deletes
+blobs nobody references any more (and can recount from the tables).
+
+File fields opt in with `storage=get_content_addressed_storage`; the default
+storage (thumbnails, exports) is unchanged.
+"""
+import hashlib
+import os
+import logging
+import tempfile
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+logger = logging.getLogger(__name__)
+
+BLOB_ROOT = 'blobs'
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def blob_name(digest, ext=''):
+    return f'{BLOB_ROOT}/{digest[:2]}/{digest}{ext.lower()}'
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(f'{BLOB_ROOT}/')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # The stored name comes from the content (see _save), never from the
+        # upload's file name, so there is nothing to make unique.
+        return name
+
+    def _save(self, name, content):
+        """Stream `content` to disk while hashing it; returns the blob's name"""
+        from .models import StoredBlob
+
+        tmp_dir = self.path(os.path.join(BLOB_ROOT, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks(HASH_CHUNK_SIZE):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            name = blob_name(digest.hexdigest(), os.path.splitext(name)[1])
+            # Record the blob before the file is (re)placed: the collector
+            # unlinks a file only while holding its still-stale row, so this
+            # waits for it and then writes the file again.
+            StoredBlob.objects.update_or_create(name=name, defaults={'size': size, 'last_seen_at': timezone.now()})
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            # Atomic, and rewriting an existing blob leaves the same bytes.
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return name
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def get_content_addressed_storage():
+    return content_addressed_storage
+
+
+# ------------------------------
+# Reference counts
+# ------------------------------
+
+def content_addressed_fields(model):
+    """Names of the model's file fields stored in blobs"""
+    return [
+        field.name for field in model._meta.get_fields()
+        if getattr(field, 'storage', None) is content_addressed_storage
+    ]
+
+
+def blob_models():
+    """The core models with at least one content-addressed file field"""
+    return [model for model in apps.get_app_config('core').get_models() if content_addressed_fields(model)]
+
+
+def adjust_blob_refcounts(added=(), removed=()):
+    """Add one reference per name in `added` and drop one per name in `removed`"""
+    from .models import StoredBlob
+
+    deltas = {}
+    for name in added:
+        if is_blob_name(name):
+            deltas[name] = deltas.get(name, 0) + 1
+    for name in removed:
+        if is_blob_name(name):
+            deltas[name] = deltas.get(name, 0) - 1
+    for name, delta in deltas.items():
+        if delta:
+            StoredBlob.objects.filter(name=name).update(refcount=F('refcount') + delta)
+
+
+def recount_blob_references(models=None):
+    """
+    Recompute every StoredBlob.refcount from the file columns of `models`,
+    adding rows for referenced blobs the table does not know; returns the
+    number of referenced blobs.
+    """
+    from .models import StoredBlob
+
+    with transaction.atomic():
+        counts = {}
+        for model in models or blob_models():
+            for field_name in content_addressed_fields(model):
+                names = model.objects.filter(**{f'{field_name}__startswith': f'{BLOB_ROOT}/'})
+                for name in names.values_list(field_name, flat=True).iterator():
+                    counts[name] = counts.get(name, 0) + 1
+
+        StoredBlob.objects.exclude(refcount=0).update(refcount=0)
+        known = set(StoredBlob.objects.filter(name__in=list(counts)).values_list('name', flat=True))
+        StoredBlob.objects.bulk_create([
+            StoredBlob(name=name, size=_size_or_zero(name)) for name in counts if name not in known
+        ])
+        for name, count in counts.items():
+            StoredBlob.objects.filter(name=name).update(refcount=count)
+    return len(counts)
+
+
+def _size_or_zero(name):
+    try:
+        return content_addressed_storage.size(name)
+    except OSError:
+        return 0
+
+
+# ------------------------------
+# Garbage collection
+# ------------------------------
+
+def _delete_blob(pk, cutoff):
+    """
+    Unlink a stale blob's file, then drop its row, while holding the row: an
+    upload of the same content meanwhile waits in _save's update_or_create()
+    and writes the file again once the row is gone. Returns False when the
+    blob was used again before the lock was taken.
+    """
+    from .models import StoredBlob
+
+    with transaction.atomic():
+        still_stale = StoredBlob.objects.filter(pk=pk, refcount__lte=0, last_seen_at__lt=cutoff)
+        if connection.features.has_select_for_update:
+            name = still_stale.select_for_update().values_list('name', flat=True).first()
+        elif still_stale.update(refcount=F('refcount')):
+            # SQLite: the no-op UPDATE takes the database write lock instead.
+            name = StoredBlob.objects.filter(pk=pk).values_list('name', flat=True).first()
+        else:
+            name = None
+        if name is None:
+            return False
+        content_addressed_storage.delete(name)
+        StoredBlob.objects.filter(pk=pk).delete()
+    return True
+
+
+def collect_garbage(grace=timedelta(hours=24), dry_run=False, now=None):
+    """
+    Delete blobs that have had no references for `grace`, and files under
+    blobs/ the table does not know (uploads whose transaction rolled back).
+    Returns (files deleted, bytes freed).
+    """
+    from .models import StoredBlob
+
+    cutoff = (now or timezone.now()) - grace
+    storage = content_addressed_storage
+    deleted, freed = 0, 0
+
+    stale = StoredBlob.objects.filter(refcount__lte=0, last_seen_at__lt=cutoff)
+    for blob in stale.iterator():
+        if not dry_run and not _delete_blob(blob.pk, cutoff):
+            continue
+        deleted += 1
+        freed += blob.size
+
+    root = storage.path(BLOB_ROOT)
+    known = None
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime >= cutoff.timestamp():
+                continue
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if known is None:
+                known = set(StoredBlob.objects.values_list('name', flat=True))
+            if name in known:
+                continue
+            if not dry_run:
+                os.unlink(path)
+            deleted += 1
+            freed += stat.st_size
+    return deleted, freed
+
+
+def _file_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def adopt_legacy_files(models=None, dry_run=False):
+    """
+    Move files uploaded before the blob store into it, pointing every row
+    at the shared blob and deleting the old copy. Returns
+    {legacy name: blob name}; call recount_blob_references() afterwards.
+    """
+    storage = content_addressed_storage
+    columns = [(model, field) for model in models or blob_models() for field in content_addressed_fields(model)]
+    legacy = set()
+    for model, field in columns:
+        names = model.objects.exclude(**{f'{field}__startswith': f'{BLOB_ROOT}/'}).exclude(**{field: ''})
+        legacy.update(names.exclude(**{f'{field}__isnull': True}).values_list(field, flat=True).distinct())
+
+    adopted = {}
+    for name in sorted(legacy):
+        try:
+            with storage.open(name, 'rb') as original:
+                if dry_run:
+                    new_name = blob_name(_file_hash(original), os.path.splitext(name)[1])
+                else:
+                    new_name = storage.save(name, original)
+        except OSError:
+            logger.warning("Skipping missing upload %s", name)
+            continue
+        adopted[name] = new_name
+        if dry_run:
+            continue
+        for model, field in columns:
+            model.objects.filter(**{field: name}).update(**{field: new_name})
+        storage.delete(name)
+    return adopted
@@ -0,0 +1,59 @@
+"""
+Background tasks of the core app (see core.jobs).
+"""
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from .jobs import background_task
+from .models import Job
+from .utils import notify_users
+
+
+@background_task(max_attempts=3)
+def notify_branch_admins(branch_id, notification_type, title, message, link=None):
+    """Notify the admins and superadmins of a branch"""
+    admins = CustomUser.objects.filter(branch_id=branch_id, role__in=['admin', 'superadmin'])
+    notify_users(users=admins, notification_type=notification_type, title=title, message=message, link=link)
+
+
+@background_task(priority=5)
+def make_thumbnails(model_label, pk, field_name='photo'):
+    from .images import process_photo
+
+    process_photo(apps.get_model(model_label), pk, field_name)
+
+
+@background_task(every=timedelta(days=1), priority=10)
+def purge_finished_jobs():
+    """Delete done and cancelled jobs older than JOB_RETENTION (failed ones stay for inspection)"""
+    cutoff = timezone.now() - getattr(settings, 'JOB_RETENTION', timedelta(days=7))
+    Job.objects.filter(status__in=['done', 'cancelled'], finished_at__lt=cutoff).delete()
+
+
+@background_task(every=timedelta(minutes=15), max_attempts=1)
+def send_reminders():
+    """Notify vets of vaccinations, dewormings, deliveries and tasks coming due (see core.reminders)"""
+    from .reminders import send_due_reminders
+
+    send_due_reminders()
+
+
+@background_task(every=timedelta(minutes=5), max_attempts=1)
+def mark_overdue_tasks():
+    """Flag and notify open vet tasks past their due date (see core.overdue)"""
+    from .overdue import flag_overdue_tasks, unflag_rescheduled_tasks
+
+    unflag_rescheduled_tasks()
+    flag_overdue_tasks()
+
+
+@background_task(every=timedelta(days=1), priority=10)
+def rollup_daily_vet_stats():
+    """Recompute yesterday's VetDailyStats for every vet (see core.performance)"""
+    from .performance import rollup_vet_stats
+
+    rollup_vet_stats(timezone.localdate() - timedelta(days=1))
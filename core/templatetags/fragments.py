@@ -0,0 +1,57 @@
+from django import template
+
+from core.fragments import render_fragment
+
+register = template.Library()
+
+FRAGMENT_OPTIONS = ('branch', 'depends')
+
+
+class CacheFragmentNode(template.Node):
+
+    def __init__(self, nodelist, name, vary_on, options):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+        self.options = options
+
+    def render(self, context):
+        request = context.get('request')
+        branch = self.options['branch'].resolve(context) if 'branch' in self.options else None
+        depends = self.options['depends'].resolve(context).split() if 'depends' in self.options else ()
+        return render_fragment(
+            self.name.resolve(context),
+            lambda: self.nodelist.render(context),
+            role=getattr(getattr(request, 'user', None), 'role', ''),
+            branch=branch,
+            depends=depends,
+            vary_on=[str(var.resolve(context)) for var in self.vary_on],
+        )
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    Cache the enclosed template by role, branch and data version (core.fragments):
+
+        {% cachefragment "admin_sidebar" current_url branch=branch %}...{% endcachefragment %}
+        {% cachefragment "vet_stats" branch=branch depends="stats" %}...{% endcachefragment %}
+
+    Positional arguments after the name are extra vary-on values; `depends`
+    is a space-separated list of FRAGMENT_SOURCES topics (or 'stats').
+    """
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError("'cachefragment' tag requires a fragment name")
+    vary_on, options = [], {}
+    for bit in bits[2:]:
+        option, sep, value = bit.partition('=')
+        if not sep:
+            vary_on.append(parser.compile_filter(bit))
+        elif option in FRAGMENT_OPTIONS:
+            options[option] = parser.compile_filter(value)
+        else:
+            raise template.TemplateSyntaxError(f"'cachefragment' got an unknown option '{option}'")
+    return CacheFragmentNode(nodelist, parser.compile_filter(bits[1]), vary_on, options)
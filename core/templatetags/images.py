@@ -0,0 +1,48 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from core.images import THUMBNAIL_FORMATS, derivative_name, variants_field
+
+register = template.Library()
+
+
+def _srcset(variants, ext):
+    return ', '.join(
+        f"{default_storage.url(derivative_name(variants['hash'], width, ext))} {width}w"
+        for width in variants['sizes']
+    )
+
+
+@register.simple_tag
+def responsive_image(field_file, alt='', sizes='100vw', css_class='', loading='lazy'):
+    """
+    <picture> for an uploaded photo with WebP and JPEG srcsets from core.images:
+
+        {% responsive_image animal.photo alt=animal.name sizes="48px" css_class="w-12 h-12" %}
+
+    `sizes` is the rendered width, from which the browser picks the smallest
+    sufficient thumbnail. Photos without derivatives yet fall back to the original.
+    """
+    if not field_file:
+        return ''
+    variants = getattr(field_file.instance, variants_field(field_file.field.name), None) or {}
+    if not variants.get('sizes'):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            field_file.url, alt, css_class, loading,
+        )
+    # Intrinsic size of the largest thumbnail, so the layout is reserved before it loads.
+    width = variants['sizes'][-1]
+    height = max(1, round(variants['height'] * width / variants['width']))
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((ext, _srcset(variants, ext), sizes) for ext in THUMBNAIL_FORMATS if ext != 'jpeg'),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" '
+        'loading="{}" decoding="async"></picture>',
+        sources,
+        default_storage.url(derivative_name(variants['hash'], width, 'jpeg')),
+        _srcset(variants, 'jpeg'), sizes, width, height, alt, css_class, loading,
+    )
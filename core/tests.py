@@ -1,3 +1,1719 @@
-from django.test import TestCase
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template, TemplateSyntaxError
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from accounts.models import CustomUser
+from horse.middleware.instrumentation import RECENT_VIOLATIONS, registry
+from .models import (
+    Branch, BranchStats, BranchDailyStats, Animal, VetTask,
+    MedicalRecord, SupportTicket, DailyActivityReport, Message, SystemLog,
+    Notification, TrainingRecord, AnimalLog, SearchEntry, EmergencyIncident, EquipmentLog, StoredBlob,
+    UploadSession, Report, Job, UpcomingEvent, VetDailyStats, ActivityEvent
+)
+from .animal_io import AnimalFileError, import_animals
+from .search import search, search_filter
+from .images import derivative_name
+from .storage import collect_garbage, content_addressed_storage
+from .uploads import UploadError, append_chunk
+from . import jobs
+from . import branches
+from .branches import get_branch, get_branch_by_id
+from . import identity
+from .identity import CachedUserBackend
+from .fragments import render_fragment
+from .timeline import animal_timeline
+from .activity import actor_feed, branch_feed
+from .performance import RESPONSE_BUCKETS, get_vet_performance, rebuild_vet_stats, rollup_vet_stats
+from .overdue import flag_overdue_tasks, unflag_rescheduled_tasks
+from .reminders import rebuild_upcoming_events, send_due_reminders
+from .jobs import background_task, claim_jobs, enqueue_periodic_tasks, requeue_stale_jobs, run_pending
+from .forms import VetTaskForm
+from .audit import AuditLogWriter, write_system_log
+from .pagination import CursorPaginator
+from .log_archive import archive_expired_logs, search_system_logs
+from .counters import get_unread_notification_count, get_unread_message_count, reconcile_unread_counters
+from .realtime import get_broker
+from .utils import create_notification, notify_users, mark_notification_read, log_action
+from .stats import get_branch_stats, get_daily_stats, get_stats_totals, compute_branch_totals
+
+
+class BranchStatsTests(TestCase):
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.dog = Animal.objects.create(
+            name='Rex', species='dog', force_number='D-1', age=3,
+            owner_name='TPF', branch=self.branch,
+        )
+
+    def _assert_matches_source(self):
+        stats = BranchStats.objects.get(branch=self.branch)
+        expected = compute_branch_totals([self.branch.id])[self.branch.id]
+        for field, value in expected.items():
+            self.assertEqual(getattr(stats, field), value, field)
+
+    def test_signals_keep_counters_in_sync(self):
+        self.assertEqual(get_branch_stats(self.branch).animal_count, 1)
+        get_daily_stats(self.branch)
+
+        task = VetTask.objects.create(
+            title='Checkup', description='Routine', animal=self.dog,
+            assigned_by=self.vet, assigned_to=self.vet, branch=self.branch,
+            due_date=timezone.now() + timedelta(days=1),
+        )
+        MedicalRecord.objects.create(
+            animal=self.dog, veterinarian=self.vet, report_type='checkup',
+            diagnosis='Healthy', treatment='None',
+        )
+        ticket = SupportTicket.objects.create(
+            subject='Kennel', description='Broken gate', created_by=self.vet, branch=self.branch,
+        )
+        DailyActivityReport.objects.create(
+            user=self.vet, branch=self.branch, date=timezone.localdate(),
+            summary='Rounds', hours_worked=8,
+        )
+        self._assert_matches_source()
+
+        task.status = 'completed'
+        task.save()
+        ticket.status = 'closed'
+        ticket.save()
+        stats = BranchStats.objects.get(branch=self.branch)
+        self.assertEqual((stats.tasks_pending, stats.tasks_completed), (0, 1))
+        self.assertEqual((stats.tickets_open, stats.tickets_closed), (0, 1))
+        self._assert_matches_source()
+
+        daily = BranchDailyStats.objects.get(branch=self.branch, date=timezone.localdate())
+        self.assertEqual(daily.tasks_created, 1)
+        self.assertEqual(daily.report_count, 1)
+
+        self.dog.delete()
+        self._assert_matches_source()
+        self.assertEqual(BranchStats.objects.get(branch=self.branch).animal_count, 0)
+
+    def test_moving_an_animal_moves_its_records(self):
+        other = Branch.objects.create(name='MBEYA')
+        MedicalRecord.objects.create(
+            animal=self.dog, veterinarian=self.vet, report_type='checkup', diagnosis='Fine', treatment='None',
+        )
+        get_branch_stats(self.branch)
+        get_branch_stats(other)
+        get_daily_stats(self.branch)
+
+        self.dog.branch = other
+        self.dog.save()
+
+        for branch in (self.branch, other):
+            stats = BranchStats.objects.get(branch=branch)
+            expected = compute_branch_totals([branch.id])[branch.id]
+            self.assertEqual(
+                (stats.animal_count, stats.medical_record_count),
+                (expected['animal_count'], expected['medical_record_count']),
+            )
+        self.assertEqual(BranchStats.objects.get(branch=self.branch).medical_record_count, 0)
+        self.assertEqual(BranchStats.objects.get(branch=other).medical_record_count, 1)
+        self.assertEqual(BranchDailyStats.objects.get(branch=self.branch, date=timezone.localdate()).medical_records_added, 0)
+
+    def test_rebuild_command_repairs_drift(self):
+        get_branch_stats(self.branch)
+        BranchStats.objects.filter(branch=self.branch).update(animal_count=42)
+
+        call_command('rebuild_branch_stats', stdout=StringIO())
+
+        self._assert_matches_source()
+        self.assertEqual(get_stats_totals()['animal_count'], 1)
+
+    def test_dashboard_reads_are_single_row(self):
+        get_branch_stats(self.branch)
+        with self.assertNumQueries(1):
+            get_branch_stats(self.branch)
+
+
+class UnreadPushTests(TestCase):
+
+    def setUp(self):
+        caches['counters'].clear()
+        self.user = CustomUser.objects.create_user(
+            username='handler', email='handler@example.com', role='user',
+        )
+        self.broker = get_broker()
+        self.subscription = self.broker.subscribe(self.user.id)
+        self.addCleanup(self.subscription.close)
+
+    def test_notification_create_and_read_push_counts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = create_notification(self.user, 'system_alert', 'Hello', 'World')
+        self.assertEqual(self.subscription.get(timeout=0), {'notifications': 1, 'messages': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_notification_read(notification.id, self.user)
+        self.assertEqual(self.subscription.get(timeout=0), {'notifications': 0, 'messages': 0})
+
+    def test_bulk_notify_and_messages_push_counts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_users([self.user], 'system_alert', 'Hello', 'World')
+        self.assertEqual(self.subscription.get(timeout=0)['notifications'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(sender=self.user, receiver=self.user, subject='Hi', content='...')
+        self.assertEqual(self.subscription.get(timeout=0)['messages'], 1)
+
+    def test_stream_is_refused_under_wsgi(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/core/api/events/').status_code, 204)
+
+    async def test_stream_sends_the_counts_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/core/api/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        first = await anext(events)
+        await events.aclose()
+        self.assertIn(b'"notifications": 0', first)
+
+    def test_users_without_streams_are_skipped(self):
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', role='user')
+        with self.captureOnCommitCallbacks(execute=True):
+            create_notification(other, 'system_alert', 'Hello', 'World')
+        self.assertIsNone(self.subscription.get(timeout=0))
+
+
+class UnreadCounterCacheTests(TestCase):
+
+    def setUp(self):
+        caches['counters'].clear()
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.user = CustomUser.objects.create_user(
+            username='handler', email='handler@example.com', role='user', branch=self.branch,
+        )
+
+    def test_counters_follow_writes_without_queries(self):
+        self.assertEqual(get_unread_notification_count(self.user.id), 0)
+        self.assertEqual(get_unread_message_count(self.user.id), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = create_notification(self.user, 'system_alert', 'Hello', 'World')
+            notify_users([self.user], 'system_alert', 'Hello', 'Again')
+            message = Message.objects.create(
+                sender=self.user, receiver=self.user, branch=self.branch, subject='Hi', content='...',
+            )
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_notification_count(self.user.id), 2)
+            self.assertEqual(get_unread_message_count(self.user.id), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_notification_read(notification.id, self.user)
+            message.is_deleted = True
+            message.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_notification_count(self.user.id), 1)
+            self.assertEqual(get_unread_message_count(self.user.id), 0)
+
+    def test_rolled_back_writes_leave_counters_alone(self):
+        self.assertEqual(get_unread_notification_count(self.user.id), 0)
+        with self.captureOnCommitCallbacks(execute=False):
+            create_notification(self.user, 'system_alert', 'Hello', 'World')
+        self.assertEqual(get_unread_notification_count(self.user.id), 0)
+
+    def test_count_endpoints_and_reconciliation(self):
+        Message.objects.create(
+            sender=self.user, receiver=self.user, branch=self.branch, subject='Hi', content='...',
+        )
+        caches['counters'].set(f'unread:messages:{self.user.id}', 7)
+
+        out = StringIO()
+        call_command('reconcile_unread_counters', stdout=out)
+        self.assertIn('had drifted', out.getvalue())
+
+        self.client.force_login(self.user)
+        response = self.client.get('/core/api/messages/unread/')
+        self.assertEqual(response.json(), {'count': 1})
+        self.assertEqual(get_unread_message_count(self.user.id, self.branch.id), 1)
+
+    @override_settings(UNREAD_COUNTER_CACHE=None)
+    def test_without_an_atomic_cache_counts_come_from_the_database(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_notification(self.user, 'system_alert', 'Hello', 'World')
+        self.assertEqual(get_unread_notification_count(self.user.id), 1)
+        self.assertIsNone(caches['counters'].get(f'unread:notifications:{self.user.id}'))
+        self.assertEqual(reconcile_unread_counters(), (0, 0))
+
+
+class AuditLogWriterTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='auditor', email='auditor@example.com', role='admin')
+
+    def _entry(self, message):
+        return SystemLog(user=self.user, role=self.user.role, branch='', action='other', message=message)
+
+    def test_sync_mode_writes_immediately(self):
+        log_action(self.user, 'other', 'Viewed animal #D-1')
+        self.assertTrue(SystemLog.objects.filter(message='Viewed animal #D-1').exists())
+
+    def test_flush_writes_in_batches_and_keeps_queue_time(self):
+        writer = AuditLogWriter(batch_size=2, max_queue_size=10)
+        entries = [self._entry(f'entry {i}') for i in range(5)]
+        for entry in entries:
+            writer.enqueue(entry)
+        self.assertEqual(writer.metrics()['queue_depth'], 5)
+
+        with self.assertNumQueries(3):
+            self.assertEqual(writer.flush(), 5)
+
+        metrics = writer.metrics()
+        self.assertEqual((metrics['queue_depth'], metrics['written'], metrics['flushes']), (0, 5, 3))
+        self.assertEqual(SystemLog.objects.get(message='entry 0').timestamp, entries[0].timestamp)
+
+    def test_full_queue_drops_and_counts(self):
+        writer = AuditLogWriter(batch_size=10, max_queue_size=2)
+        with self.assertLogs('core.audit', 'WARNING'):
+            results = [writer.enqueue(self._entry(f'entry {i}')) for i in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(writer.metrics()['dropped'], 1)
+
+    @override_settings(SYSTEM_LOG_ASYNC=True)
+    def test_async_mode_defers_to_writer(self):
+        writer = AuditLogWriter()
+        with mock.patch('core.audit.get_audit_writer', return_value=writer), \
+                mock.patch.object(writer, 'start'):
+            write_system_log(self._entry('queued'))
+        self.assertFalse(SystemLog.objects.filter(message='queued').exists())
+        writer.flush()
+        self.assertTrue(SystemLog.objects.filter(message='queued').exists())
+
+
+class SystemLogArchiveTests(TestCase):
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.user = CustomUser.objects.create_user(
+            username='auditor', email='auditor@example.com', role='admin', branch=self.branch,
+        )
+        self.now = datetime(2026, 10, 15, 12, 0, tzinfo=dt_timezone.utc)
+        for months_ago, action in [(0, 'login'), (2, 'create'), (7, 'login'), (9, 'delete')]:
+            SystemLog.objects.create(
+                user=self.user, role='admin', branch='', branch_fk=self.branch, action=action,
+                message=f'{months_ago} months ago', timestamp=self.now - timedelta(days=30 * months_ago),
+            )
+
+    def test_expired_partitions_move_to_archive(self):
+        archived = archive_expired_logs(months=6, archive_dir=self.archive_dir, now=self.now)
+
+        self.assertEqual([(year, month, count) for year, month, count, _ in archived], [(2026, 1, 1), (2026, 3, 1)])
+        self.assertEqual(
+            sorted(SystemLog.objects.values_list('message', flat=True)),
+            ['0 months ago', '2 months ago'],
+        )
+
+    def test_search_spans_live_table_and_archives(self):
+        archive_expired_logs(months=6, archive_dir=self.archive_dir, now=self.now)
+
+        records = search_system_logs(user=self.user, archive_dir=self.archive_dir)
+        self.assertEqual(
+            [record.message for record in records],
+            ['0 months ago', '2 months ago', '7 months ago', '9 months ago'],
+        )
+        self.assertEqual(records[-1].branch, 'ARUSHA')
+
+        logins = search_system_logs(action='login', end=self.now - timedelta(days=30), archive_dir=self.archive_dir)
+        self.assertEqual([record.message for record in logins], ['7 months ago'])
+
+        newest = search_system_logs(limit=1, archive_dir=self.archive_dir)
+        self.assertEqual([record.get_action_display() for record in newest], ['Login'])
+
+    def test_archives_without_possible_matches_are_not_read(self):
+        archive_expired_logs(months=6, archive_dir=self.archive_dir, now=self.now)
+
+        with mock.patch('gzip.open', wraps=gzip.open) as opened:
+            deletes = search_system_logs(action='delete', archive_dir=self.archive_dir)
+            self.assertEqual([record.message for record in deletes], ['9 months ago'])
+            self.assertEqual(opened.call_count, 1)
+            self.assertEqual(search_system_logs(user=self.user.pk + 1, archive_dir=self.archive_dir), [])
+            self.assertEqual(opened.call_count, 1)
+
+    def test_kept_rows_are_archived_once_and_found_once(self):
+        archive_expired_logs(months=6, archive_dir=self.archive_dir, delete=False, now=self.now)
+        again = archive_expired_logs(months=6, archive_dir=self.archive_dir, delete=False, now=self.now)
+
+        self.assertEqual(again, [])
+        self.assertEqual(len([name for name in os.listdir(self.archive_dir) if name.endswith('.jsonl.gz')]), 2)
+        records = search_system_logs(archive_dir=self.archive_dir)
+        self.assertEqual(
+            [record.message for record in records],
+            ['0 months ago', '2 months ago', '7 months ago', '9 months ago'],
+        )
+
+
+class CursorPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='handler', email='handler@example.com', role='user')
+        Message.objects.bulk_create([
+            Message(sender=self.user, receiver=self.user, subject=f'Message {i}', content='...')
+            for i in range(25)
+        ])
+        # Ties on the timestamp must be broken by id.
+        Message.objects.filter(id__lte=Message.objects.order_by('id')[9].id).update(
+            timestamp=timezone.now() - timedelta(days=1),
+        )
+        self.queryset = Message.objects.filter(receiver=self.user)
+        self.expected = list(self.queryset.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+    def test_walks_forward_and_back_over_meta_ordering(self):
+        paginator = CursorPaginator(self.queryset, per_page=10)
+        self.assertEqual(paginator.ordering, [('timestamp', True), ('pk', True)])
+
+        seen, pages, cursor = [], [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = paginator.page(cursor)
+            pages.append(page)
+            seen.extend(message.id for message in page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertFalse(pages[0].has_previous())
+
+        previous = paginator.page(pages[2].previous_cursor)
+        self.assertEqual([message.id for message in previous], self.expected[10:20])
+        first = paginator.page(previous.previous_cursor)
+        self.assertEqual([message.id for message in first], self.expected[:10])
+        self.assertFalse(first.has_previous())
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        page = CursorPaginator(self.queryset, per_page=10).get_page('not-a-cursor')
+        self.assertEqual([message.id for message in page], self.expected[:10])
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.admin = CustomUser.objects.create_user(
+            username='chief', email='chief@example.com', role='superadmin', branch=self.branch,
+        )
+        self.client.force_login(self.admin)
+
+    def _metrics(self, view):
+        return next(row for row in registry.snapshot()['views'] if row['view'] == view)
+
+    def test_records_queries_templates_and_size_per_view_and_role(self):
+        response = self.client.get('/core/animals/')
+
+        metrics = self._metrics('animal_list')
+        self.assertEqual(metrics['role'], 'superadmin')
+        self.assertEqual(metrics['requests'], 1)
+        self.assertGreater(metrics['queries'], 0)
+        self.assertGreater(metrics['template_seconds'], 0)
+        self.assertEqual(metrics['response_bytes'], len(response.content))
+
+    def test_query_budgets_record_violations(self):
+        with self.settings(QUERY_BUDGETS={'animal_list': 1}), self.assertLogs('horse.middleware.instrumentation', 'WARNING'):
+            self.client.get('/core/animals/')
+        self.client.get('/core/api/messages/unread/')
+
+        violations = registry.snapshot()['budget_violations']
+        self.assertEqual([violation['view'] for violation in violations], ['animal_list'])
+
+    def test_violation_history_is_bounded(self):
+        for number in range(RECENT_VIOLATIONS + 5):
+            registry.record_violation('animal_list', f'/core/animals/?page={number}', 5, 1)
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['budget_violation_counts'], {'animal_list': RECENT_VIOLATIONS + 5})
+        self.assertEqual(len(snapshot['budget_violations']), RECENT_VIOLATIONS)
+        self.assertEqual(snapshot['budget_violations'][0]['path'], '/core/animals/?page=5')
+
+    def test_prometheus_dump_is_staff_only(self):
+        self.client.get('/core/api/notifications/count/')
+        response = self.client.get('/core/metrics/')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('tpf_http_requests_total{view="notification_count_api",role="superadmin"} 1', body)
+        self.assertIn('tpf_systemlog_queue_depth 0', body)
+
+        handler = CustomUser.objects.create_user(username='handler', email='handler@example.com', role='user')
+        self.client.force_login(handler)
+        self.assertEqual(self.client.get('/core/metrics/').status_code, 403)
+        with self.settings(METRICS_TOKEN='scrape'):
+            self.client.logout()
+            self.assertEqual(self.client.get('/core/metrics/', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+            self.assertEqual(self.client.get('/core/metrics/', HTTP_AUTHORIZATION='Bearer scrap').status_code, 403)
+            self.assertEqual(self.client.get('/core/metrics/').status_code, 403)
+
+
+class AnimalImportExportTests(TestCase):
+
+    HEADER = 'force_number,name,species,breed,age,date_of_birth,owner_name,training_sniffer,training_place,training_duration,training_time,training_handler\n'
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.admin = CustomUser.objects.create_user(
+            username='chief', email='chief@example.com', role='admin', branch=self.branch,
+        )
+        Animal.objects.create(
+            name='Rex', species='dog', force_number='D-1', age=3,
+            owner_name='TPF', branch=self.branch,
+        )
+        get_branch_stats(self.branch)
+
+    def _import(self, rows, chunk_size=500):
+        upload = BytesIO((self.HEADER + rows).encode())
+        return import_animals(upload, 'animals.csv', self.branch, self.admin, chunk_size=chunk_size)
+
+    def test_import_creates_animals_training_records_and_one_notification(self):
+        result = self._import(
+            'D-2,Max,dog,Alsatian,2,2023-01-05,TPF,yes,Moshi,2 weeks,Morning,Juma\n'
+            'D-2,Max,dog,Alsatian,2,2023-01-05,TPF,x,Arusha,1 week,Evening,Juma\n'
+            'H-1,Storm,horse,,5,,TPF,,,,,\n'
+            'D-3,Bella,dog,,1.5,,TPF,y,Moshi,3 days,Morning,Asha\n',
+            chunk_size=2,
+        )
+
+        self.assertEqual((result.animals, result.training_records, result.errors), (3, 3, []))
+        max_dog = Animal.objects.get(force_number='D-2')
+        self.assertEqual(max_dog.training_records.count(), 2)
+        self.assertTrue(max_dog.training_records.filter(training_place='Moshi', training_sniffer=True).exists())
+        self.assertEqual(list(max_dog.assigned_users.all()), [self.admin])
+        self.assertEqual(get_branch_stats(self.branch).animal_count, 4)
+        self.assertEqual(Notification.objects.filter(user=self.admin).count(), 1)
+
+    def test_invalid_rows_roll_back_the_whole_import(self):
+        result = self._import(
+            'D-2,Max,dog,,2,,TPF,yes,Moshi,2 weeks,Morning,Juma\n'
+            'D-1,Copy,dog,,2,,TPF,,,,,\n'
+            'D-4,Nala,lion,,2,,TPF,,,,,\n'
+            'D-5,Zuri,dog,,abc,,TPF,,,,,\n',
+            chunk_size=1,
+        )
+
+        self.assertEqual([line for line, _ in result.errors], [3, 4, 5])
+        self.assertIn('already exists', result.errors[0][1])
+        self.assertEqual(Animal.objects.count(), 1)
+        self.assertEqual(TrainingRecord.objects.count(), 0)
+        self.assertEqual(get_branch_stats(self.branch).animal_count, 1)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_non_utf8_csv_is_reported_as_unreadable(self):
+        for content in [b'\xff\xfe\x00force_number', (self.HEADER + 'D-2,M\xe4x,dog,,2,,TPF,,,,,\n').encode('latin-1')]:
+            with self.subTest(content=content[:12]), self.assertRaisesMessage(AnimalFileError, 'UTF-8'):
+                import_animals(BytesIO(content), 'animals.csv', self.branch, self.admin)
+
+        self.assertEqual(Animal.objects.count(), 1)
+
+    def test_upload_view_and_streaming_export(self):
+        self.client.force_login(self.admin)
+        upload = BytesIO((self.HEADER + 'D-2,Max,dog,,2,,TPF,yes,Moshi,2 weeks,Morning,Juma\n').encode())
+        upload.name = 'animals.csv'
+        response = self.client.post('/core/animals/import/', {'file': upload})
+        self.assertRedirects(response, '/core/animals/', fetch_redirect_response=False)
+
+        response = self.client.get('/core/animals/export/', {'species': 'dog'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['force_number', 'name', 'species'])
+        self.assertEqual(len(lines), 3)
+        self.assertIn('D-2,Max,dog,,2.00,,TPF,,yes,,,,,Moshi,2 weeks,Morning,Juma', lines)
+
+
+class SearchIndexTests(TestCase):
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.other_branch = Branch.objects.create(name='MOSHI')
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.rex = Animal.objects.create(
+            name='Rex', species='dog', force_number='D-17', age=3, breed='Alsatian',
+            owner_name='TPF', branch=self.branch,
+        )
+        self.record = MedicalRecord.objects.create(
+            animal=self.rex, veterinarian=self.vet, report_type='checkup',
+            diagnosis='Mild <b>dermatitis</b> on the left flank', treatment='Topical antiseptic',
+        )
+
+    def test_ranked_highlighted_results_follow_saves_and_deletes(self):
+        hits = search('dermat')
+        self.assertEqual([(hit.kind, hit.object_id) for hit in hits], [('medical_record', self.record.pk)])
+        self.assertIn('<mark>dermatitis</mark>', hits[0].snippet)
+        self.assertIn('&lt;b&gt;', hits[0].snippet)
+
+        self.assertEqual([hit.kind for hit in search('rex', kinds=['animal'])], ['animal'])
+        self.assertEqual([hit.kind for hit in search('d 17 alsat')], ['animal'])
+
+        self.rex.name = 'Simba'
+        self.rex.save()
+        self.assertEqual(len(search('simba')), 2)
+        self.assertEqual(search('rex'), [])
+
+        self.record.delete()
+        self.assertEqual(search('dermatitis'), [])
+        self.assertFalse(SearchEntry.objects.filter(kind='medical_record').exists())
+
+    def test_branch_scoping_and_queryset_filter(self):
+        rexa = Animal.objects.create(
+            name='Rexa', species='dog', force_number='D-18', age=2,
+            owner_name='TPF', branch=self.other_branch,
+        )
+        hits = search('rex', branch_ids=[self.other_branch.pk])
+        self.assertEqual([(hit.object_id, str(hit.title)) for hit in hits], [(rexa.pk, '<mark>Rexa</mark> (D-18)')])
+        self.assertEqual(len(search('rex', kinds=['animal'])), 2)
+
+        animals = search_filter(Animal.objects.filter(branch=self.branch), 'rex')
+        self.assertEqual(list(animals), [self.rex])
+        self.assertFalse(search_filter(Animal.objects.all(), '%%').exists())
+
+    def test_queryset_filter_matches_force_numbers_anywhere(self):
+        k9 = Animal.objects.create(
+            name='Bolt', species='dog', force_number='K9-0123', age=2, owner_name='TPF', branch=self.branch,
+        )
+        record = MedicalRecord.objects.create(animal=k9, veterinarian=self.vet, report_type='checkup', diagnosis='Fit')
+
+        self.assertEqual(list(search_filter(Animal.objects.all(), '123')), [k9])
+        self.assertEqual(list(search_filter(MedicalRecord.objects.all(), '123')), [record])
+
+    def test_moving_an_animal_moves_its_dependent_entries(self):
+        self.rex.branch = self.other_branch
+        self.rex.save()
+
+        hits = search('dermatitis', branch_ids=[self.other_branch.pk])
+        self.assertEqual([(hit.kind, hit.object_id) for hit in hits], [('medical_record', self.record.pk)])
+        self.assertEqual(search('dermatitis', branch_ids=[self.branch.pk]), [])
+
+    def test_rebuild_command_restores_the_index(self):
+        AnimalLog.objects.create(user=self.vet, animal=self.rex, activity_type='training', notes='Scent tracking drill')
+        SearchEntry.objects.all().delete()
+        self.assertEqual(search('scent'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+
+        self.assertEqual([hit.kind for hit in search('scent tracking')], ['animal_log'])
+        self.assertEqual(SearchEntry.objects.count(), 3)
+
+
+class AnimalAutocompleteTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.branch = Branch.objects.create(name='ARUSHA')
+        other_branch = Branch.objects.create(name='MOSHI')
+        self.handler = CustomUser.objects.create_user(
+            username='handler', email='handler@example.com', role='veterinarian', branch=self.branch,
+        )
+        for force_number, name, branch in [
+            ('D-170', 'Simba', self.branch), ('D-17', 'Rex', self.branch), ('H-2', 'D-Day', self.branch),
+            ('K-917', 'Bolt', self.branch), ('D-171', 'Rexa', other_branch),
+        ]:
+            Animal.objects.create(
+                name=name, species='dog', force_number=force_number, age=3,
+                owner_name='TPF', branch=branch,
+            )
+        self.client.force_login(self.handler)
+
+    def _lookup(self, term, **params):
+        response = self.client.get('/core/api/animals/autocomplete/', {'q': term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['force_number'] for row in response.json()['results']]
+
+    def test_prefix_then_name_then_infix_matches_within_the_branch(self):
+        self.assertEqual(self._lookup('d-17'), ['D-17', 'D-170'])
+        self.assertEqual(self._lookup('917'), ['K-917'])
+        self.assertEqual(self._lookup('d'), ['D-17', 'D-170', 'H-2'])
+        self.assertEqual(self._lookup('rex'), ['D-17'])
+        self.assertEqual(self._lookup('d', limit=1), ['D-17'])
+        self.assertEqual(self._lookup(''), [])
+        self.assertEqual(registry.snapshot()['budget_violations'], [])
+
+    def test_lookup_field_renders_a_text_box_and_resolves_force_numbers(self):
+        form = VetTaskForm(user=self.handler)
+        html = str(form['animal'])
+        self.assertIn('data-animal-lookup="/core/api/animals/autocomplete/"', html)
+        self.assertNotIn('<option', html)
+
+        form = VetTaskForm(data={'animal': 'D-17'}, user=self.handler)
+        form.is_valid()
+        self.assertNotIn('animal', form.errors)
+        self.assertEqual(form.cleaned_data['animal'].name, 'Rex')
+
+        form = VetTaskForm(data={'animal': 'D-171'}, user=self.handler)
+        self.assertIn('animal', form.errors)
+
+
+class ListQueryCountTests(TestCase):
+    """Every list page must run the same number of queries however many rows it shows"""
+
+    LIST_PAGES = [
+        ('vet', '/dashboard/vet/ARUSHA/records/'),
+        ('vet', '/dashboard/vet/ARUSHA/search-medical-records/?q=colic'),
+        ('vet', '/dashboard/vet/ARUSHA/tasks/'),
+        ('vet', '/dashboard/vet/ARUSHA/tasks/pending/'),
+        ('vet', '/dashboard/vet/ARUSHA/tasks/completed/'),
+        ('vet', '/dashboard/vet/ARUSHA/patients/'),
+        ('vet', '/dashboard/vet/ARUSHA/messages/'),
+        ('vet', '/dashboard/vet/ARUSHA/messages/sent/'),
+        ('vet', '/dashboard/vet/ARUSHA/animal-logs/search/?q=walk'),
+        ('admin', '/dashboard/admin/ARUSHA/admin_incident_logs/'),
+        ('admin', '/dashboard/admin/ARUSHA/admin_care_logs/'),
+        ('admin', '/core/ARUSHA/tickets/'),
+        ('chief', '/core/animals/'),
+        ('chief', '/dashboard/tickets/'),
+        # The core inbox (/core/messages/) is left out: its core/inbox.html
+        # template does not exist, so the page cannot render at all.
+        ('keeper', '/dashboard/user/ARUSHA/'),
+        ('keeper', '/dashboard/user/ARUSHA/tasks/'),
+        ('keeper', '/dashboard/user/ARUSHA/animal-logs/'),
+        ('keeper', '/dashboard/user/ARUSHA/report-activity/'),
+        ('keeper', '/dashboard/user/ARUSHA/messages/'),
+        ('keeper', '/dashboard/user/ARUSHA/notifications/'),
+        ('keeper', '/dashboard/user/ARUSHA/assigned-animals/'),
+        ('keeper', '/dashboard/user/ARUSHA/report-emergency/'),
+        ('keeper', '/dashboard/user/ARUSHA/equipment-log/'),
+        ('keeper', '/dashboard/user/ARUSHA/support-request/'),
+    ]
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.users = {
+            'vet': CustomUser.objects.create_user(username='vet', email='vet@example.com', role='veterinarian', branch=self.branch),
+            'admin': CustomUser.objects.create_user(username='admin', email='admin@example.com', role='admin', branch=self.branch),
+            'chief': CustomUser.objects.create_user(username='chief', email='chief@example.com', role='superadmin', branch=self.branch),
+            'keeper': CustomUser.objects.create_user(username='keeper', email='keeper@example.com', role='user', branch=self.branch),
+        }
+        self.seeded = 0
+
+    def _seed(self, count):
+        """Rows whose related objects are all distinct, so an unjoined FK costs one query per row"""
+        vet = self.users['vet']
+        for _ in range(count):
+            self.seeded += 1
+            n = self.seeded
+            handler = CustomUser.objects.create_user(
+                username=f'handler{n}', email=f'handler{n}@example.com', role='user',
+                branch=self.branch, first_name='Handler', last_name=str(n),
+            )
+            animal = Animal.objects.create(
+                name=f'Dog {n}', species='dog', force_number=f'D-{n}', age=2,
+                owner_name='TPF', branch=self.branch,
+            )
+            MedicalRecord.objects.create(
+                animal=animal, veterinarian=vet, report_type='checkup',
+                diagnosis='Colic', treatment='Rest',
+            )
+            for status in ('pending', 'completed'):
+                VetTask.objects.create(
+                    title=f'Task {n}', description='Check', animal=animal, assigned_by=vet,
+                    assigned_to=handler, branch=self.branch, status=status,
+                    due_date=timezone.now(),
+                )
+            Message.objects.create(sender=handler, receiver=vet, subject='Hi', content='Body', branch=self.branch)
+            Message.objects.create(sender=vet, receiver=handler, subject='Re', content='Body', branch=self.branch)
+            AnimalLog.objects.create(user=handler, animal=animal, activity_type='exercise', notes='Evening walk')
+            EmergencyIncident.objects.create(reporter=handler, animal=animal, incident_type='injury', description='Limping')
+            SupportTicket.objects.create(created_by=handler, branch=self.branch, subject='Kennel', description='Broken door')
+            # The same kinds of rows for the keeper's own user dashboard pages.
+            keeper = self.users['keeper']
+            animal.assigned_users.add(keeper)
+            VetTask.objects.create(
+                title=f'Feed {n}', description='Feed', animal=animal, assigned_by=vet,
+                assigned_to=keeper, branch=self.branch, due_date=timezone.now(),
+            )
+            Message.objects.create(sender=handler, receiver=keeper, subject='Hi', content='Body', branch=self.branch)
+            Notification.objects.create(user=keeper, notification_type='task_assigned', title='Task', message='Feed')
+            AnimalLog.objects.create(user=keeper, animal=animal, activity_type='exercise', notes='Morning walk')
+            EmergencyIncident.objects.create(reporter=keeper, animal=animal, incident_type='injury', description='Limping')
+            EquipmentLog.objects.create(user=keeper, equipment='leash', action='check_out')
+            report = DailyActivityReport.objects.create(
+                user=keeper, branch=self.branch, date=timezone.localdate() - timedelta(days=n), summary='Walks', hours_worked=8,
+            )
+            report.animals_cared_for.add(animal)
+            SupportTicket.objects.create(
+                created_by=keeper, assigned_to=handler, branch=self.branch, subject='Kennel', description='Broken door',
+            )
+
+    def _count_queries(self, role, url):
+        self.client.force_login(self.users[role])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def test_list_pages_run_a_constant_number_of_queries(self):
+        self._seed(2)
+        get_branch('ARUSHA')  # the branch registry loads once per process, not per page
+        baseline = {page: self._count_queries(*page) for page in self.LIST_PAGES}
+        self._seed(4)
+        for page in self.LIST_PAGES:
+            with self.subTest(page=page[1]):
+                self.assertEqual(self._count_queries(*page), baseline[page])
+
+
+class PhotoThumbnailTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.branch = Branch.objects.create(name='ARUSHA')
+
+    def _upload(self, size=(1600, 1200), name='rex.jpg'):
+        image = Image.new('RGB', size, 'brown')
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'  # Make
+        exif[0x0112] = 6  # Orientation: rotate 90° clockwise to display
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', exif=exif)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def _animal(self, force_number, photo):
+        with self.captureOnCommitCallbacks(execute=True):
+            animal = Animal.objects.create(
+                name='Rex', species='dog', force_number=force_number, age=3,
+                owner_name='TPF', branch=self.branch, photo=photo,
+            )
+        animal.refresh_from_db()
+        return animal
+
+    def test_upload_gets_rotated_exif_free_thumbnails(self):
+        animal = self._animal('D-1', self._upload())
+        variants = animal.photo_variants
+
+        self.assertEqual(variants['sizes'], [96, 320, 960])
+        self.assertEqual((variants['width'], variants['height']), (1200, 1600))
+        for width in variants['sizes']:
+            for ext in ('webp', 'jpeg'):
+                with default_storage.open(derivative_name(variants['hash'], width, ext)) as thumb:
+                    image = Image.open(thumb)
+                    self.assertEqual(image.width, width)
+                    self.assertGreater(image.height, image.width)
+                    self.assertEqual(dict(image.getexif()), {})
+
+    def test_stored_original_is_upright_and_exif_free(self):
+        animal = self._animal('D-1', self._upload())
+
+        with animal.photo.open('rb'):
+            image = Image.open(animal.photo)
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (1200, 1600))
+            self.assertEqual(dict(image.getexif()), {})
+
+    def test_same_content_reuses_cached_derivatives(self):
+        first = self._animal('D-1', self._upload())
+        with mock.patch.object(default_storage, 'save', wraps=default_storage.save) as save:
+            second = self._animal('D-2', self._upload(name='copy.jpg'))
+
+        self.assertEqual(second.photo_variants['hash'], first.photo_variants['hash'])
+        self.assertEqual(save.call_count, 0)  # originals live in the blob store
+
+    def test_small_photo_and_removed_photo(self):
+        animal = self._animal('D-1', self._upload(size=(80, 60)))
+        self.assertEqual(animal.photo_variants['sizes'], [60])
+
+        animal.photo = None
+        with self.captureOnCommitCallbacks(execute=True):
+            animal.save()
+        animal.refresh_from_db()
+        self.assertEqual(animal.photo_variants, {})
+
+    def test_responsive_image_tag(self):
+        template = Template('{% load images %}{% responsive_image animal.photo alt=animal.name sizes="48px" %}')
+        animal = self._animal('D-1', self._upload())
+        html = template.render(Context({'animal': animal}))
+
+        digest = animal.photo_variants['hash']
+        self.assertIn(f'<source type="image/webp" srcset="/media/thumbs/{digest[:2]}/{digest}/96.webp 96w, ', html)
+        self.assertIn(f'/media/thumbs/{digest[:2]}/{digest}/960.jpeg 960w" sizes="48px"', html)
+        self.assertIn('width="960" height="1280" alt="Rex"', html)
+
+        Animal.objects.filter(pk=animal.pk).update(photo_variants={})
+        animal.refresh_from_db()
+        html = template.render(Context({'animal': animal}))
+        self.assertNotIn('<picture>', html)
+        self.assertIn(f'src="{animal.photo.url}"', html)
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.branch = Branch.objects.create(name='ARUSHA')
+
+    def _animal(self, force_number, photo=None):
+        return Animal.objects.create(
+            name='Rex', species='dog', force_number=force_number, age=3,
+            owner_name='TPF', branch=self.branch, photo=photo,
+        )
+
+    def _upload(self, name, content):
+        return SimpleUploadedFile(name, content, content_type='image/png')
+
+    def _refcount(self, name):
+        return StoredBlob.objects.get(name=name).refcount
+
+    def test_duplicate_uploads_share_one_blob(self):
+        first = self._animal('D-1', self._upload('download_1.png', b'same bytes'))
+        second = self._animal('D-2', self._upload('download_1.png', b'same bytes'))
+
+        self.assertEqual(first.photo.name, second.photo.name)
+        self.assertRegex(first.photo.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertTrue(content_addressed_storage.exists(first.photo.name))
+        self.assertEqual(self._refcount(first.photo.name), 2)
+        self.assertEqual(StoredBlob.objects.get().size, len(b'same bytes'))
+
+    def test_replaced_and_deleted_rows_release_their_blobs(self):
+        first = self._animal('D-1', self._upload('a.png', b'old picture'))
+        second = self._animal('D-2', self._upload('b.png', b'old picture'))
+        old_name = first.photo.name
+
+        first.photo = self._upload('c.png', b'new picture')
+        first.save()
+        self.assertEqual(self._refcount(old_name), 1)
+        self.assertEqual(self._refcount(first.photo.name), 1)
+
+        second.delete()
+        self.assertEqual(self._refcount(old_name), 0)
+
+        # Within the grace period nothing is collected.
+        self.assertEqual(collect_garbage()[0], 0)
+        deleted, freed = collect_garbage(now=timezone.now() + timedelta(days=2))
+        self.assertEqual((deleted, freed), (1, len(b'old picture')))
+        self.assertFalse(content_addressed_storage.exists(old_name))
+        self.assertTrue(content_addressed_storage.exists(first.photo.name))
+        self.assertFalse(StoredBlob.objects.filter(name=old_name).exists())
+
+    def test_blob_row_outlives_a_failed_unlink(self):
+        animal = self._animal('D-1', self._upload('a.png', b'old picture'))
+        name = animal.photo.name
+        animal.delete()
+
+        with mock.patch.object(content_addressed_storage, 'delete', side_effect=PermissionError):
+            with self.assertRaises(PermissionError):
+                collect_garbage(now=timezone.now() + timedelta(days=2))
+        self.assertTrue(StoredBlob.objects.filter(name=name).exists())
+
+        self.assertEqual(collect_garbage(now=timezone.now() + timedelta(days=2))[0], 1)
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+
+    def test_collect_media_garbage_adopts_legacy_duplicates(self):
+        legacy = [
+            FileSystemStorage().save('animal_photos/download_1.png', ContentFile(b'shepherd')),
+            FileSystemStorage().save('animal_photos/download_1_RPwKm3F.png', ContentFile(b'shepherd')),
+        ]
+        for number, name in enumerate(legacy):
+            animal = self._animal(f'D-{number}')
+            Animal.objects.filter(pk=animal.pk).update(photo=name)
+
+        call_command('collect_media_garbage', adopt=True, grace_hours=0, stdout=StringIO())
+
+        names = set(Animal.objects.values_list('photo', flat=True))
+        self.assertEqual(len(names), 1)
+        blob = names.pop()
+        self.assertTrue(blob.startswith('blobs/'))
+        self.assertEqual(self._refcount(blob), 2)
+        for name in legacy:
+            self.assertFalse(content_addressed_storage.exists(name))
+
+
+class ChunkedUploadTests(TestCase):
+
+    PDF = b'%PDF-1.4\n' + bytes(range(256)) * 1000
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.branch = Branch.objects.create(name='NAMANGA')
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.client.force_login(self.vet)
+
+    def _start(self, filename='lab.pdf', size=None, purpose='report_file'):
+        return self.client.post(
+            '/core/api/uploads/',
+            {'purpose': purpose, 'filename': filename, 'size': len(self.PDF) if size is None else size},
+            content_type='application/json',
+        )
+
+    def _put(self, url, offset, data):
+        return self.client.put(url, data, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_interrupted_upload_resumes_and_attaches_to_report(self):
+        started = self._start()
+        self.assertEqual(started.status_code, 201)
+        url = started.json()['url']
+
+        self.assertEqual(self._put(url, 0, self.PDF[:100000]).json()['offset'], 100000)
+        # A retried chunk the server already has is answered with the real offset.
+        conflict = self._put(url, 0, self.PDF[:100000])
+        self.assertEqual((conflict.status_code, conflict.json()['offset']), (409, 100000))
+        self.assertEqual(self.client.get(url).json()['offset'], 100000)
+
+        done = self._put(url, 100000, self.PDF[100000:]).json()
+        self.assertEqual((done['offset'], done['status']), (len(self.PDF), 'complete'))
+
+        response = self.client.post('/core/reports/create/', {
+            'title': 'Lab results', 'report_type': 'medical', 'specific_report_type': 'lab_results',
+            'description': 'Blood panel', 'file_upload': done['id'],
+        })
+        self.assertEqual(response.status_code, 302)
+        report = Report.objects.get()
+        self.assertTrue(report.file.name.startswith('blobs/'))
+        with report.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.PDF)
+        self.assertEqual(StoredBlob.objects.get(name=report.file.name).refcount, 1)
+
+    def test_connection_dropped_mid_chunk_keeps_received_bytes(self):
+        session = UploadSession.objects.get(pk=self._start().json()['id'])
+        with self.assertRaises(UploadError) as raised:
+            append_chunk(session, 0, BytesIO(self.PDF[:5000]), 65536)
+        self.assertEqual(raised.exception.offset, 5000)
+        self.assertEqual(UploadSession.objects.get(pk=session.pk).received, 5000)
+
+    def test_quota_is_rechecked_before_each_chunk(self):
+        first = self._start().json()['url']
+        second = self._start().json()['url']
+
+        with self.settings(BRANCH_UPLOAD_QUOTAS={'NAMANGA': len(self.PDF) + 5}):
+            # Both were admitted before the quota shrank; the upload opened first keeps its place.
+            self.assertEqual(self._put(second, 0, self.PDF[:1000]).status_code, 413)
+            self.assertEqual(self.client.get(second).json()['status'], 'aborted')
+            self.assertEqual(self._put(first, 0, self.PDF[:1000]).json()['offset'], 1000)
+
+    def test_start_rejects_json_that_is_not_an_object(self):
+        for body in ['[1]', 'null', '"lab.pdf"', '{"size": "big"}', 'not json']:
+            with self.subTest(body=body):
+                response = self.client.post('/core/api/uploads/', body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_type_size_and_quota_are_enforced(self):
+        self.assertEqual(self._start(filename='lab.exe').status_code, 415)
+
+        url = self._start().json()['url']
+        mismatch = self._put(url, 0, b'\x89PNG\r\n\x1a\n' + b'0' * 100)
+        self.assertEqual(mismatch.status_code, 415)
+        self.assertEqual(self.client.get(url).json()['status'], 'aborted')
+
+        url = self._start(size=10).json()['url']
+        self.assertEqual(self._put(url, 0, self.PDF[:20]).status_code, 413)
+
+        with self.settings(BRANCH_UPLOAD_QUOTAS={'NAMANGA': len(self.PDF) + 5}):
+            self.assertEqual(self._start().status_code, 413)  # the 10-byte session still reserves its size
+
+        other = CustomUser.objects.create_user(
+            username='other', email='other@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+CALLS = []
+
+
+@background_task(retry_delay=60, max_attempts=2)
+def _record_call(value):
+    CALLS.append(value)
+
+
+@background_task(max_attempts=2)
+def _always_fails():
+    raise RuntimeError("boom")
+
+
+@background_task(every=timedelta(hours=1))
+def _hourly():
+    CALLS.append('hourly')
+
+
+@override_settings(JOB_QUEUE_ASYNC=True)
+class BackgroundJobTests(TestCase):
+
+    def setUp(self):
+        CALLS.clear()
+        jobs._queued_slots.clear()
+        self.addCleanup(jobs._queued_slots.clear)
+
+    def test_delay_queues_after_commit_and_worker_runs_it(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _record_call.delay('first')
+            self.assertFalse(Job.objects.exists())
+        job = Job.objects.get()
+        self.assertEqual((job.task, job.args, job.status), ('core.tests._record_call', ['first'], 'queued'))
+
+        self.assertGreaterEqual(run_pending('worker-1'), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertIn('first', CALLS)
+
+    def test_failures_back_off_then_fail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _always_fails.delay()
+        run_pending('worker-1')
+        job = Job.objects.get(task='core.tests._always_fails')
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=20))
+
+        # Not due yet, so nothing is claimed; once it is, the last attempt fails for good.
+        self.assertEqual(claim_jobs('worker-1'), [])
+        later = claim_jobs('worker-1', now=job.run_at + timedelta(seconds=1))
+        jobs.run_job(later[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_a_job_is_claimed_by_one_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _record_call.delay('once')
+        self.assertEqual(len(claim_jobs('worker-1')), 1)
+        self.assertEqual(claim_jobs('worker-2'), [])
+
+    def test_periodic_tasks_are_queued_once_per_period(self):
+        now = timezone.now()
+        enqueue_periodic_tasks(now)
+        jobs._queued_slots.clear()  # as if a second worker process
+        enqueue_periodic_tasks(now)
+        self.assertEqual(Job.objects.filter(task='core.tests._hourly').count(), 1)
+
+    def test_jobs_of_dead_workers_are_requeued(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _record_call.delay('lost')
+        claim_jobs('worker-1')
+        self.assertEqual(requeue_stale_jobs(), 0)
+        self.assertEqual(requeue_stale_jobs(now=timezone.now() + timedelta(hours=1)), 1)
+        self.assertEqual(claim_jobs('worker-2')[0].attempts, 2)
+
+    def test_stale_jobs_fail_after_their_last_attempt(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _record_call.delay('lost')
+        later = timezone.now() + timedelta(hours=1)
+        claim_jobs('worker-1')
+        requeue_stale_jobs(now=later)
+        claim_jobs('worker-2')
+
+        self.assertEqual(requeue_stale_jobs(now=later + timedelta(hours=1)), 1)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('failed', 2, ''))
+        self.assertEqual(claim_jobs('worker-3'), [])
+
+    def test_a_requeued_job_is_not_completed_by_its_old_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _record_call.delay('slow')
+        stale = claim_jobs('worker-1')[0]
+        requeue_stale_jobs(now=timezone.now() + timedelta(hours=1))
+        claim_jobs('worker-2')
+
+        with self.assertLogs('core.jobs', 'WARNING'):
+            jobs.run_job(stale)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.locked_by), ('running', 'worker-2'))
+
+    def test_ticket_notifications_move_off_the_request(self):
+        branch = Branch.objects.create(name='ARUSHA')
+        admin = CustomUser.objects.create_user(username='boss', email='boss@example.com', role='admin', branch=branch)
+        handler = CustomUser.objects.create_user(username='h', email='h@example.com', role='trainer', branch=branch)
+        self.client.force_login(handler)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/core/ARUSHA/tickets/create/', {
+                'subject': 'Kennel', 'description': 'Broken door', 'priority': 'normal',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Notification.objects.filter(user=admin).exists())
+
+        run_pending('worker-1')
+        self.assertEqual(Notification.objects.get(user=admin).title, 'New Support Ticket')
+
+
+class ReminderTests(TestCase):
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.rex = Animal.objects.create(
+            name='Rex', species='dog', force_number='D-1', age=3, owner_name='TPF', branch=self.branch,
+        )
+        self.today = timezone.localdate()
+
+    def _record(self, **dates):
+        return MedicalRecord.objects.create(
+            animal=self.rex, veterinarian=self.vet, report_type='vaccination',
+            diagnosis='Healthy', treatment='Vaccine', vaccine_name='Rabies', **dates,
+        )
+
+    def test_saves_keep_events_current(self):
+        record = self._record(next_due_date=self.today + timedelta(days=10), next_deworming_date=self.today + timedelta(days=20))
+        self.assertEqual(
+            sorted(UpcomingEvent.objects.filter(source='medical_record', object_id=record.pk).values_list('kind', flat=True)),
+            ['deworming', 'vaccination'],
+        )
+        event = UpcomingEvent.objects.get(kind='vaccination')
+        self.assertEqual(event.due_at - event.remind_at, timedelta(days=3))
+
+        record.next_deworming_date = None
+        record.save()
+        self.assertEqual(list(UpcomingEvent.objects.values_list('kind', flat=True)), ['vaccination'])
+
+        task = VetTask.objects.create(
+            title='Checkup', description='Routine', animal=self.rex, assigned_by=self.vet,
+            assigned_to=self.vet, branch=self.branch, due_date=timezone.now() + timedelta(days=2),
+        )
+        self.assertTrue(UpcomingEvent.objects.filter(kind='task_due', object_id=task.pk).exists())
+        task.status = 'completed'
+        task.save()
+        self.assertFalse(UpcomingEvent.objects.filter(kind='task_due').exists())
+        record.delete()
+        self.assertFalse(UpcomingEvent.objects.exists())
+
+    def test_each_event_is_reminded_once_until_its_date_moves(self):
+        record = self._record(next_due_date=self.today + timedelta(days=2))
+        self.assertEqual(send_due_reminders(), 1)
+        self.assertEqual(send_due_reminders(), 0)
+        notification = Notification.objects.get(user=self.vet)
+        self.assertEqual((notification.notification_type, notification.link), ('reminder', f'/core/animals/{self.rex.pk}/'))
+
+        # Saving without touching the date keeps it reminded; moving it re-arms it.
+        record.save()
+        self.assertEqual(send_due_reminders(), 0)
+        record.next_due_date = self.today + timedelta(days=1)
+        record.save()
+        self.assertEqual(send_due_reminders(), 1)
+
+        # Not within the lead time yet, or already past when recorded: nothing to send.
+        self._record(next_due_date=self.today + timedelta(days=30))
+        self._record(next_due_date=self.today - timedelta(days=5))
+        self.assertEqual(send_due_reminders(), 0)
+        self.assertEqual(send_due_reminders(now=timezone.now() + timedelta(days=28)), 1)
+
+    def test_sweep_works_in_bounded_batches_off_the_index(self):
+        for _ in range(5):
+            self._record(next_due_date=self.today + timedelta(days=1))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(send_due_reminders(batch_size=2, max_batches=2), 4)
+        self.assertFalse(any('core_medicalrecord' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(send_due_reminders(batch_size=2), 1)
+
+    def test_rebuild_matches_incremental_events(self):
+        self._record(next_due_date=self.today + timedelta(days=4), expected_delivery_date=self.today + timedelta(days=40))
+        expected = list(UpcomingEvent.objects.order_by('kind').values_list('kind', 'object_id', 'due_at', 'remind_at'))
+        UpcomingEvent.objects.all().delete()
+        self.assertEqual(rebuild_upcoming_events(), {'medical_record': 2, 'vet_task': 0})
+        self.assertEqual(list(UpcomingEvent.objects.order_by('kind').values_list('kind', 'object_id', 'due_at', 'remind_at')), expected)
+
+    def test_rebuild_keeps_sent_reminders_and_drops_orphans(self):
+        self._record(next_due_date=self.today + timedelta(days=2))
+        self.assertEqual(send_due_reminders(), 1)
+        UpcomingEvent.objects.create(
+            kind='vaccination', source='medical_record', object_id=10 ** 9, branch=self.branch, animal=self.rex,
+            user=self.vet, title='Gone', due_at=timezone.now(), remind_at=timezone.now(),
+        )
+
+        self.assertEqual(rebuild_upcoming_events(), {'medical_record': 0, 'vet_task': 0})
+        self.assertEqual(UpcomingEvent.objects.count(), 1)
+        self.assertEqual(send_due_reminders(), 0)
+
+
+class OverdueTaskTests(TestCase):
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.rex = Animal.objects.create(
+            name='Rex', species='dog', force_number='D-1', age=3, owner_name='TPF', branch=self.branch,
+        )
+        get_branch_stats(self.branch)
+
+    def _task(self, due_in, **fields):
+        return VetTask.objects.create(
+            title='Checkup', description='Routine', animal=self.rex, assigned_by=self.vet,
+            assigned_to=self.vet, branch=self.branch, due_date=timezone.now() + due_in, **fields,
+        )
+
+    def _overdue_count(self):
+        return BranchStats.objects.get(branch=self.branch).tasks_overdue
+
+    def test_sweep_flags_counts_and_notifies_once(self):
+        late = self._task(timedelta(hours=-2))
+        self._task(timedelta(hours=-1), status='completed')
+        self._task(timedelta(days=1))
+
+        self.assertEqual(flag_overdue_tasks(), 1)
+        self.assertEqual(flag_overdue_tasks(), 0)
+        late.refresh_from_db()
+        self.assertIsNotNone(late.overdue_since)
+        self.assertEqual(self._overdue_count(), 1)
+        self.assertEqual(Notification.objects.filter(user=self.vet, notification_type='task_overdue').count(), 1)
+        self.assertEqual(compute_branch_totals([self.branch.id])[self.branch.id]['tasks_overdue'], 1)
+
+        # Closing the task takes it out of the count through the stats receivers.
+        late.status = 'completed'
+        late.save()
+        self.assertEqual(self._overdue_count(), 0)
+
+    def test_rescheduled_tasks_are_unflagged(self):
+        task = self._task(timedelta(hours=-2))
+        flag_overdue_tasks()
+        VetTask.objects.filter(pk=task.pk).update(due_date=timezone.now() + timedelta(days=2))
+        self.assertEqual(unflag_rescheduled_tasks(), 1)
+        self.assertEqual(self._overdue_count(), 0)
+
+    def test_sweep_updates_in_batches(self):
+        for _ in range(5):
+            self._task(timedelta(hours=-1))
+        self.assertEqual(flag_overdue_tasks(batch_size=2, max_batches=2), 4)
+        self.assertEqual(flag_overdue_tasks(batch_size=2), 1)
+        self.assertEqual(self._overdue_count(), 5)
+
+    def test_superadmin_dashboard_reads_the_counter(self):
+        self._task(timedelta(hours=-1))
+        flag_overdue_tasks()
+        admin = CustomUser.objects.create_user(username='root', email='root@example.com', role='superadmin')
+        self.client.force_login(admin)
+        response = self.client.get('/dashboard/')
+        self.assertEqual(response.context['overview']['task_status_data'][3], 1)
+
+
+class VetPerformanceTests(TestCase):
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.rex = Animal.objects.create(
+            name='Rex', species='dog', force_number='D-1', age=3, owner_name='TPF', branch=self.branch,
+        )
+        self.today = timezone.localdate()
+
+    def _completed_task(self, response, completed_days_ago=0):
+        task = VetTask.objects.create(
+            title='Checkup', description='Routine', animal=self.rex, assigned_by=self.vet,
+            assigned_to=self.vet, branch=self.branch, due_date=timezone.now(),
+        )
+        completed_at = timezone.now() - timedelta(days=completed_days_ago)
+        VetTask.objects.filter(pk=task.pk).update(created_at=completed_at - response)
+        task.refresh_from_db()
+        task.status = 'completed'
+        task.completed_at = completed_at
+        task.save()
+        return task
+
+    def test_completion_updates_the_rollup(self):
+        task = VetTask.objects.create(
+            title='Checkup', description='Routine', animal=self.rex, assigned_by=self.vet,
+            assigned_to=self.vet, branch=self.branch, due_date=timezone.now(),
+        )
+        self.assertFalse(VetDailyStats.objects.exists())
+        task.status = 'completed'
+        task.save()
+        self.assertIsNotNone(task.completed_at)
+        stats = VetDailyStats.objects.get(vet=self.vet, date=self.today)
+        self.assertEqual((stats.tasks_completed, stats.patient_ids), (1, [self.rex.pk]))
+
+        task.status = 'in_progress'
+        task.save()
+        self.assertFalse(VetDailyStats.objects.exists())
+
+    def test_reports_sum_rollups_over_a_range(self):
+        self._completed_task(timedelta(minutes=30))
+        self._completed_task(timedelta(hours=3))
+        self._completed_task(timedelta(days=5), completed_days_ago=10)
+        MedicalRecord.objects.create(
+            animal=self.rex, veterinarian=self.vet, report_type='checkup', diagnosis='Healthy', treatment='None',
+        )
+
+        with self.assertNumQueries(2):
+            report = get_vet_performance(self.vet, self.today - timedelta(days=6), self.today)
+        self.assertEqual((report['tasks_completed'], report['medical_records'], report['patients_handled']), (2, 1, 1))
+        self.assertAlmostEqual(report['average_response_time'].total_seconds(), 105 * 60, delta=2)
+        self.assertEqual(report['median_response_bound'], RESPONSE_BUCKETS[0])
+        self.assertEqual(report['p90_response_bound'], RESPONSE_BUCKETS[1])
+
+        whole = get_vet_performance(self.vet, self.today - timedelta(days=30), self.today)
+        self.assertEqual((whole['tasks_completed'], whole['p90_response_bound']), (3, RESPONSE_BUCKETS[6]))
+
+    def test_rebuild_and_nightly_rollup_match_incremental_rows(self):
+        self._completed_task(timedelta(hours=2))
+        self._completed_task(timedelta(days=2), completed_days_ago=1)
+        expected = list(VetDailyStats.objects.order_by('date').values(
+            'date', 'tasks_completed', 'response_seconds', 'response_histogram', 'patient_ids',
+        ))
+        VetDailyStats.objects.all().delete()
+        self.assertEqual(rollup_vet_stats(self.today - timedelta(days=1)), 1)
+        self.assertEqual(rebuild_vet_stats(), 2)
+        self.assertEqual(list(VetDailyStats.objects.order_by('date').values(
+            'date', 'tasks_completed', 'response_seconds', 'response_histogram', 'patient_ids',
+        )), expected)
+
+    def test_report_page_renders_the_range(self):
+        self._completed_task(timedelta(hours=2))
+        self.client.force_login(self.vet)
+        response = self.client.get('/dashboard/vet/arusha/performance-reports/', {'start': str(self.today)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['reports']['tasks_completed'], 1)
+
+    def test_report_page_counts_only_the_branch_in_the_url(self):
+        self._completed_task(timedelta(hours=2))
+        moshi = Branch.objects.create(name='MOSHI')
+        simba = Animal.objects.create(
+            name='Simba', species='dog', force_number='D-2', age=2, owner_name='TPF', branch=moshi,
+        )
+        MedicalRecord.objects.create(animal=simba, veterinarian=self.vet, report_type='checkup', diagnosis='Fit')
+        VetTask.objects.create(
+            title='Checkup', description='Routine', animal=simba, assigned_by=self.vet,
+            assigned_to=self.vet, branch=moshi, due_date=timezone.now(),
+        )
+        self.client.force_login(self.vet)
+
+        reports = self.client.get('/dashboard/vet/arusha/performance-reports/').context['reports']
+        self.assertEqual((reports['tasks_completed'], reports['medical_records'], reports['tasks_pending']), (1, 0, 0))
+        reports = self.client.get('/dashboard/vet/moshi/performance-reports/').context['reports']
+        self.assertEqual((reports['tasks_completed'], reports['medical_records'], reports['tasks_pending']), (0, 1, 1))
+
+
+class ActivityFeedTests(TestCase):
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.other = Branch.objects.create(name='DODOMA')
+        self.admin = CustomUser.objects.create_user(
+            username='boss', email='boss@example.com', role='admin', branch=self.branch,
+        )
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.rex = Animal.objects.create(
+            name='Rex', species='dog', force_number='D-1', age=3, owner_name='TPF', branch=self.branch,
+        )
+
+    def test_domain_writes_append_events(self):
+        task = VetTask.objects.create(
+            title='Checkup', description='Routine', animal=self.rex, assigned_by=self.admin,
+            assigned_to=self.vet, branch=self.branch, due_date=timezone.now(),
+        )
+        task.notes = 'Bring the muzzle'
+        task.save()
+        task.status = 'completed'
+        task.save()
+        MedicalRecord.objects.create(
+            animal=self.rex, veterinarian=self.vet, report_type='checkup', diagnosis='Healthy', treatment='None',
+        )
+        SupportTicket.objects.create(subject='Kennel', description='Broken gate', created_by=self.vet, branch=self.other)
+
+        events = list(branch_feed(self.branch))
+        self.assertEqual(
+            [(event.kind, event.verb, event.actor_id) for event in events],
+            [('medical_record', 'created', self.vet.pk), ('vet_task', 'changed', self.vet.pk),
+             ('vet_task', 'created', self.admin.pk)],
+        )
+        self.assertEqual(events[1].message, "marked task 'Checkup' completed")
+        self.assertEqual(actor_feed(self.admin).count(), 1)
+        self.assertEqual(branch_feed(self.other).get().message, f"opened ticket #{SupportTicket.objects.get().pk}: Kennel")
+
+    def test_feed_page_is_one_range_query_per_page(self):
+        for number in range(25):
+            AnimalLog.objects.create(user=self.vet, animal=self.rex, activity_type='feeding', notes=f'Meal {number}')
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dashboard/admin/arusha/activity/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['activities']), 20)
+        self.assertEqual(sum('core_activityevent' in query['sql'] for query in queries.captured_queries), 1)
+
+        response = self.client.get('/dashboard/admin/arusha/activity/', {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(len(response.context['activities']), 5)
+        self.assertContains(response, 'logged feeding for Rex')
+        self.assertContains(self.client.get('/dashboard/admin/arusha/'), 'View all activity')
+
+
+class AnimalTimelineTests(TestCase):
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.rex = Animal.objects.create(
+            name='Rex', species='dog', force_number='D-1', age=3, owner_name='TPF', branch=self.branch,
+        )
+        base = timezone.now() - timedelta(days=30)
+        self.expected = []
+        for day in range(6):
+            when = base + timedelta(days=day)
+            record = MedicalRecord.objects.create(
+                animal=self.rex, veterinarian=self.vet, report_type='checkup', diagnosis=f'Day {day}', treatment='None',
+            )
+            MedicalRecord.objects.filter(pk=record.pk).update(date_recorded=when)
+            log = AnimalLog.objects.create(user=self.vet, animal=self.rex, activity_type='feeding', notes=f'Meal {day}')
+            # Same timestamp as the record: ties are broken by source, then id.
+            AnimalLog.objects.filter(pk=log.pk).update(date=when)
+            self.expected += [(when, 0, 'medical_record', record.pk), (when, 3, 'animal_log', log.pk)]
+            if day % 2:
+                incident = EmergencyIncident.objects.create(
+                    reporter=self.vet, animal=self.rex, incident_type='injury', description=f'Cut {day}',
+                )
+                EmergencyIncident.objects.filter(pk=incident.pk).update(date_reported=when + timedelta(hours=1))
+                self.expected.append((when + timedelta(hours=1), 4, 'incident', incident.pk))
+        self.expected = [(kind, pk) for _, _, kind, pk in sorted(self.expected, reverse=True)]
+
+    def _walk(self, per_page):
+        seen, cursor = [], None
+        while True:
+            page = animal_timeline(self.rex, cursor=cursor, per_page=per_page)
+            seen += [(entry.kind, entry.object.pk) for entry in page]
+            if not page.has_next():
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_merge_every_source_in_time_order(self):
+        full = [(entry.kind, entry.object.pk) for entry in animal_timeline(self.rex, per_page=100)]
+        self.assertEqual(full, self.expected)
+        for per_page in (1, 4, 7):
+            self.assertEqual(self._walk(per_page), self.expected)
+
+    def test_a_page_is_one_query_per_source(self):
+        first = animal_timeline(self.rex, per_page=4)
+        with self.assertNumQueries(5):
+            animal_timeline(self.rex, cursor=first.next_cursor, per_page=4)
+        self.assertEqual(len(animal_timeline(self.rex, cursor='garbage', per_page=4)), 4)
+
+    def test_detail_page_and_endpoint_load_older_history(self):
+        self.client.force_login(self.vet)
+        response = self.client.get(f'/core/animals/{self.rex.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['timeline']), 15)
+
+        for number in range(10):
+            TrainingRecord.objects.create(
+                animal=self.rex, training_place='Moshi', training_duration='2 weeks',
+                training_time='Morning', training_handler=f'Handler {number}',
+            )
+        page = self.client.get(f'/core/animals/{self.rex.pk}/').context['timeline']
+        data = self.client.get(f'/core/api/animals/{self.rex.pk}/timeline/', {'cursor': page.next_cursor}).json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNone(data['next'])
+        self.assertEqual(data['results'][-1]['kind'], 'medical_record')
+
+
+class BranchRegistryTests(TestCase):
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='Dar es Salaam')
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+
+    def test_lookups_are_normalized_and_query_free_once_loaded(self):
+        self.assertEqual(get_branch('DAR_ES_SALAAM'), self.branch)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_branch('dar es salaam').pk, self.branch.pk)
+            self.assertEqual(get_branch_by_id(self.branch.pk).name, 'Dar es Salaam')
+            self.assertIsNone(get_branch('Mbeya'))
+
+    def test_saves_invalidate_this_process_and_the_others(self):
+        get_branch('dar es salaam')
+        with self.captureOnCommitCallbacks(execute=True):
+            Branch.objects.create(name='Mbeya')
+        self.assertIsNotNone(get_branch('mbeya'))
+
+        # Another process bumping the version token forces a reload here.
+        Branch.objects.filter(pk=self.branch.pk).update(name='Dodoma')
+        self.assertIsNotNone(get_branch('dar es salaam'))
+        branches._cache().set(branches.VERSION_KEY, 'elsewhere')
+        self.assertIsNone(get_branch('dar es salaam'))
+        self.assertEqual(get_branch('dodoma').pk, self.branch.pk)
+
+    def test_views_get_the_branch_injected(self):
+        self.client.force_login(self.vet)
+        get_branch('dar es salaam')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dashboard/vet/dar_es_salaam/update-task/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('FROM "core_branch"' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(self.client.get('/dashboard/vet/nowhere/update-task/').status_code, 404)
+
+
+class UserSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='Dar es Salaam')
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.backend = CachedUserBackend()
+
+    def test_authenticated_pages_spend_no_queries_on_identity(self):
+        self.client.force_login(self.vet)
+        self.client.get('/dashboard/vet/dar_es_salaam/update-task/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dashboard/vet/dar_es_salaam/update-task/')
+        self.assertEqual(response.status_code, 200)
+        identity_tables = ('"accounts_customuser"', '"django_session"', '"core_branch"', '"auth_permission"')
+        self.assertEqual(
+            [query['sql'] for query in queries.captured_queries if 'FROM' in query['sql']
+             and any(f'FROM {table}' in query['sql'] for table in identity_tables)],
+            [],
+        )
+
+    def test_snapshot_carries_branch_and_permissions(self):
+        self.backend.get_user(self.vet.pk).has_perm('core.add_animal')
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.vet.pk)
+            self.assertEqual(user.role, 'veterinarian')
+            self.assertEqual(user.branch.name, 'Dar es Salaam')
+            self.assertFalse(user.has_perm('core.add_animal'))
+
+    def test_snapshot_leaves_out_the_password_hash(self):
+        self.backend.get_user(self.vet.pk)
+        snapshot = identity._cache().get(identity.snapshot_key(self.vet.pk))
+        self.assertNotIn('password', snapshot['values'])
+        self.assertNotIn(self.vet.password, repr(snapshot))
+
+        user = self.backend.get_user(self.vet.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.get_session_auth_hash(), self.vet.get_session_auth_hash())
+        user.set_password('n3w-Secret!')
+        self.assertNotEqual(user.get_session_auth_hash(), self.vet.get_session_auth_hash())
+
+    def test_an_evicted_version_token_drops_every_snapshot(self):
+        self.backend.get_user(self.vet.pk)
+        identity._cache().delete(identity.VERSION_KEY)
+        CustomUser.objects.filter(pk=self.vet.pk).update(role='admin')
+        self.assertEqual(self.backend.get_user(self.vet.pk).role, 'admin')
+
+    def test_user_and_permission_changes_invalidate(self):
+        self.backend.get_user(self.vet.pk)
+        self.vet.role = 'admin'
+        self.vet.save()
+        self.assertEqual(self.backend.get_user(self.vet.pk).role, 'admin')
+
+        group = Group.objects.create(name='Animal clerks')
+        self.vet.groups.add(group)
+        self.assertFalse(self.backend.get_user(self.vet.pk).has_perm('core.add_animal'))
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.add(Permission.objects.get(codename='add_animal'))
+        self.assertTrue(self.backend.get_user(self.vet.pk).has_perm('core.add_animal'))
+
+        self.vet.is_active = False
+        self.vet.save()
+        self.assertIsNone(self.backend.get_user(self.vet.pk))
+
+    def test_branch_edits_show_through_the_registry(self):
+        self.backend.get_user(self.vet.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.branch.name = 'Dodoma'
+            self.branch.save()
+        self.assertEqual(self.backend.get_user(self.vet.pk).branch.name, 'Dodoma')
+
+
+class FragmentCacheTests(TestCase):
+
+    def setUp(self):
+        caches['counters'].clear()
+        self.branch = Branch.objects.create(name='ARUSHA')
+        self.vet = CustomUser.objects.create_user(
+            username='vet', email='vet@example.com', role='veterinarian', branch=self.branch,
+        )
+        self.client.force_login(self.vet)
+
+    def _animal(self, n, branch=None):
+        return Animal.objects.create(
+            name=f'Dog {n}', species='dog', force_number=f'D-{n}', age=2, owner_name='TPF', branch=branch or self.branch,
+        )
+
+    def _stats_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries if 'core_branchstats' in query['sql']]
+
+    def test_vet_dashboard_serves_cached_stats_until_a_write(self):
+        self._animal(1)
+        response, queries = self._stats_queries('/dashboard/vet/ARUSHA/')
+        self.assertTrue(queries)
+        self.assertContains(response, 'id="total-animals">1<')
+
+        response, queries = self._stats_queries('/dashboard/vet/ARUSHA/')
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'id="total-animals">1<')
+
+        self._animal(2)
+        response, queries = self._stats_queries('/dashboard/vet/ARUSHA/')
+        self.assertContains(response, 'id="total-animals">2<')
+
+    def test_fragments_are_separate_per_role_and_branch(self):
+        other = Branch.objects.create(name='MBEYA')
+        renders = []
+
+        def render(label):
+            return lambda: renders.append(label) or label
+
+        self.assertEqual(render_fragment('card', render('vet'), role='veterinarian', branch=self.branch, depends=['animals']), 'vet')
+        self.assertEqual(render_fragment('card', render('admin'), role='admin', branch='arusha', depends=['animals']), 'admin')
+        self.assertEqual(render_fragment('card', render('mbeya'), role='admin', branch=other, depends=['animals']), 'mbeya')
+        self.assertEqual(render_fragment('card', render('all'), role='superadmin', depends=['animals']), 'all')
+        self.assertEqual(render_fragment('card', render('again'), role='admin', branch=self.branch.pk, depends=['animals']), 'admin')
+
+        # A write in Arusha invalidates Arusha and the all-branches fragments only
+        self._animal(1)
+        self.assertEqual(render_fragment('card', render('admin 2'), role='admin', branch=self.branch, depends=['animals']), 'admin 2')
+        self.assertEqual(render_fragment('card', render('mbeya 2'), role='admin', branch=other, depends=['animals']), 'mbeya')
+        self.assertEqual(render_fragment('card', render('all 2'), role='superadmin', depends=['animals']), 'all 2')
+        self.assertEqual(renders, ['vet', 'admin', 'mbeya', 'all', 'admin 2', 'all 2'])
+
+    def test_superadmin_overview_is_cached_and_follows_writes(self):
+        chief = CustomUser.objects.create_user(username='chief', email='chief@example.com', role='superadmin')
+        self.client.force_login(chief)
+        self.client.get('/dashboard/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dashboard/')
+        self.assertFalse(any('"core_animal"' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(response.context['overview']['total_users'], 1)
+
+        CustomUser.objects.create_user(username='clerk', email='clerk@example.com', role='user', branch=self.branch)
+        self.assertContains(self.client.get('/dashboard/'), '<p class="text-3xl font-bold text-blue-700">2</p>')
+
+    def test_unknown_options_are_rejected(self):
+        with self.assertRaises(TemplateSyntaxError):
+            Template('{% load fragments %}{% cachefragment "x" role="admin" %}{% endcachefragment %}')
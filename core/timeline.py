@@ -0,0 +1,132 @@
+"""
+Per-animal history timeline.
+
+Medical records, vet tasks, training sessions, activity logs and incidents
+of one animal are merged newest first behind a single cursor:
+
+    page = animal_timeline(animal, cursor=request.GET.get('cursor'))
+    page.object_list  # TimelineEntry tuples
+    page.next_cursor  # older history, or None
+
+Each source is read with its own (animal, -timestamp) index, limited to one
+page past the cursor, and the streams are k-way merged on
+(timestamp, source, pk), so a page costs one short range query per source
+however long the animal's history is. The cursor is the key of the last
+entry shown; only older pages are offered (the page loads more history
+in place).
+"""
+import base64
+import binascii
+import heapq
+import json
+from collections import namedtuple
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import MedicalRecord, VetTask, TrainingRecord, AnimalLog, EmergencyIncident
+from .pagination import CursorEncoder, CursorPage, InvalidCursor
+
+# `timestamp` is the field entries are ordered by; `title` and `summary`
+# render an instance. Sources are ranked by their position in the list.
+TimelineSource = namedtuple('TimelineSource', ['kind', 'label', 'model', 'timestamp', 'title', 'summary'])
+
+TIMELINE_SOURCES = [
+    TimelineSource(
+        'medical_record', 'Medical record', MedicalRecord, 'date_recorded',
+        lambda record: record.get_report_type_display(), lambda record: record.diagnosis,
+    ),
+    TimelineSource(
+        'vet_task', 'Vet task', VetTask, 'created_at',
+        lambda task: task.title, lambda task: f"{task.get_status_display()}, due {task.due_date:%Y-%m-%d}",
+    ),
+    TimelineSource(
+        'training', 'Training', TrainingRecord, 'created_at',
+        lambda training: f"Training at {training.training_place}",
+        lambda training: f"{training.training_duration} with {training.training_handler}",
+    ),
+    TimelineSource(
+        'animal_log', 'Activity log', AnimalLog, 'date',
+        lambda log: log.get_activity_type_display(), lambda log: log.notes,
+    ),
+    TimelineSource(
+        'incident', 'Incident', EmergencyIncident, 'date_reported',
+        lambda incident: f"{incident.get_incident_type_display()} ({incident.get_severity_display()})",
+        lambda incident: incident.description,
+    ),
+]
+SOURCE_RANKS = {source.kind: rank for rank, source in enumerate(TIMELINE_SOURCES)}
+
+TimelineEntry = namedtuple('TimelineEntry', ['kind', 'label', 'timestamp', 'object', 'title', 'summary'])
+
+
+def _key(entry):
+    return (entry.timestamp, SOURCE_RANKS[entry.kind], entry.object.pk)
+
+
+def encode_cursor(entry):
+    timestamp, rank, pk = _key(entry)
+    raw = json.dumps([timestamp, TIMELINE_SOURCES[rank].kind, pk], cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, kind, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        timestamp = parse_datetime(timestamp)
+        if timestamp is None or kind not in SOURCE_RANKS or not isinstance(pk, int):
+            raise InvalidCursor(cursor)
+        return timestamp, SOURCE_RANKS[kind], pk
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursor(cursor)
+
+
+def _older_than(source, rank, key):
+    """Rows of `source` after the cursor key in (timestamp, rank, pk) descending order"""
+    timestamp, cursor_rank, pk = key
+    older = Q(**{f'{source.timestamp}__lt': timestamp})
+    same_time = Q(**{source.timestamp: timestamp})
+    if rank < cursor_rank:
+        return older | same_time
+    if rank == cursor_rank:
+        return older | (same_time & Q(pk__lt=pk))
+    return older
+
+
+def _stream(animal, source, rank, key, limit):
+    rows = source.model.objects.filter(animal=animal)
+    if key is not None:
+        rows = rows.filter(_older_than(source, rank, key))
+    for row in rows.order_by(f'-{source.timestamp}', '-pk')[:limit]:
+        yield TimelineEntry(
+            source.kind, source.label, getattr(row, source.timestamp), row, source.title(row), source.summary(row),
+        )
+
+
+def animal_timeline(animal, cursor=None, per_page=20):
+    """One page of the animal's history; an invalid cursor shows the newest page"""
+    try:
+        key = decode_cursor(cursor) if cursor else None
+    except InvalidCursor:
+        key = None
+    streams = [_stream(animal, source, rank, key, per_page + 1) for rank, source in enumerate(TIMELINE_SOURCES)]
+    merged = heapq.merge(*streams, key=_key, reverse=True)
+    entries = [entry for _, entry in zip(range(per_page + 1), merged)]
+    has_more = len(entries) > per_page
+    entries = entries[:per_page]
+    return CursorPage(
+        entries,
+        next_cursor=encode_cursor(entries[-1]) if has_more else None,
+        previous_cursor=None,
+    )
+
+
+def serialize_entry(entry):
+    return {
+        'kind': entry.kind,
+        'label': entry.label,
+        'id': entry.object.pk,
+        'timestamp': entry.timestamp.isoformat(),
+        'title': entry.title,
+        'summary': entry.summary,
+    }
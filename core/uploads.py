@@ -0,0 +1,290 @@
+"""
+Resumable, chunked uploads for medical documents and report files.
+
+Field stations on slow links upload in small pieces instead of one
+multipart POST that restarts from zero when the connection drops:
+
+    POST   /core/api/uploads/             {purpose, filename, size} -> {id, offset: 0}
+    PUT    /core/api/uploads/<id>/        raw bytes, Upload-Offset: <n> -> {offset}
+    GET    /core/api/uploads/<id>/        -> {offset, size, status}, to resume
+    DELETE /core/api/uploads/<id>/        abandon it
+
+Chunks are streamed from the request to a partial file UPLOAD_READ_SIZE
+bytes at a time, so memory use does not depend on the chunk or file size.
+The declared size is checked against the purpose's limit and the branch
+quota before anything is received, every chunk is checked against the
+declared size and the quota again, and the first bytes must match the file
+type the extension claims. The last chunk moves the file into the content-addressed blob
+store (core.storage); forms then take the session id in place of a file
+(ChunkedUploadField in core.forms). Sessions left unfinished for
+UPLOAD_SESSION_TTL are removed by `manage.py collect_media_garbage`.
+"""
+import os
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from .models import MedicalRecord, Report, StoredBlob, UploadSession
+from .storage import content_addressed_storage
+
+UPLOAD_READ_SIZE = 64 * 1024
+
+UploadPurpose = namedtuple('UploadPurpose', ['label', 'extensions'])
+
+UPLOAD_PURPOSES = {
+    'medical_document': UploadPurpose('Medical document', ['.pdf', '.jpg', '.jpeg', '.png', '.tif', '.tiff', '.docx', '.txt']),
+    'report_file': UploadPurpose('Report file', ['.pdf', '.jpg', '.jpeg', '.png', '.docx', '.xlsx', '.csv', '.txt']),
+}
+
+# Leading bytes each extension must start with; None means plain text.
+SIGNATURES = {
+    '.pdf': [b'%PDF-'],
+    '.png': [b'\x89PNG\r\n\x1a\n'],
+    '.jpg': [b'\xff\xd8\xff'],
+    '.jpeg': [b'\xff\xd8\xff'],
+    '.tif': [b'II*\x00', b'MM\x00*'],
+    '.tiff': [b'II*\x00', b'MM\x00*'],
+    '.docx': [b'PK\x03\x04'],
+    '.xlsx': [b'PK\x03\x04'],
+    '.csv': None,
+    '.txt': None,
+}
+SIGNATURE_LENGTH = 8
+
+
+class UploadError(Exception):
+    """A rejected upload request; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+# ------------------------------
+# Validation
+# ------------------------------
+
+def max_upload_size():
+    return getattr(settings, 'UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+
+
+def check_filename(purpose, filename):
+    if purpose not in UPLOAD_PURPOSES:
+        raise UploadError(f"Unknown upload purpose '{purpose}'.")
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext not in UPLOAD_PURPOSES[purpose].extensions:
+        allowed = ', '.join(UPLOAD_PURPOSES[purpose].extensions)
+        raise UploadError(f"{UPLOAD_PURPOSES[purpose].label}s must be one of: {allowed}.", status=415)
+    return ext
+
+
+def check_signature(ext, head):
+    """Reject a file whose first bytes do not match its extension"""
+    signatures = SIGNATURES[ext]
+    if signatures is None:
+        if b'\x00' in head:
+            raise UploadError("This does not look like a text file.", status=415)
+        return
+    if not any(head.startswith(signature) for signature in signatures):
+        raise UploadError(f"The file content does not match its {ext} extension.", status=415)
+
+
+def branch_quota(branch):
+    """Upload quota in bytes for a branch; None means unlimited"""
+    if branch is None:
+        return None
+    quotas = getattr(settings, 'BRANCH_UPLOAD_QUOTAS', {})
+    return quotas.get(branch.name.upper(), getattr(settings, 'BRANCH_UPLOAD_QUOTA', None))
+
+
+def branch_usage(branch, opened_by=None):
+    """
+    Bytes of stored documents and report files of a branch, plus uploads in
+    progress (only those opened no later than the session `opened_by`)
+    """
+    names = (
+        MedicalRecord.objects.filter(animal__branch=branch).exclude(document='').values('document')
+    )
+    stored = StoredBlob.objects.filter(
+        Q(name__in=names) | Q(name__in=Report.objects.filter(branch=branch).exclude(file='').values('file'))
+    ).aggregate(total=Sum('size'))['total'] or 0
+    pending = UploadSession.objects.filter(branch=branch, status='active')
+    if opened_by is not None:
+        pending = pending.filter(created_at__lte=opened_by.created_at)
+    pending = pending.aggregate(total=Sum('size'))['total'] or 0
+    return stored + pending
+
+
+def check_size(size, branch):
+    if size <= 0:
+        raise UploadError("The file is empty.")
+    if size > max_upload_size():
+        raise UploadError(f"Files may be at most {filesizeformat(max_upload_size())}.", status=413)
+    quota = branch_quota(branch)
+    if quota is not None and branch_usage(branch) + size > quota:
+        raise UploadError(f"{branch.name} has used its {filesizeformat(quota)} upload quota.", status=413)
+
+
+def validate_uploaded_file(purpose, uploaded_file, branch):
+    """The same checks for a file posted the old way, as a form ValidationError"""
+    try:
+        ext = check_filename(purpose, uploaded_file.name)
+        check_size(uploaded_file.size, branch)
+        uploaded_file.seek(0)
+        check_signature(ext, uploaded_file.read(SIGNATURE_LENGTH))
+        uploaded_file.seek(0)
+    except UploadError as error:
+        raise ValidationError(str(error))
+
+
+# ------------------------------
+# Sessions
+# ------------------------------
+
+def partial_upload_dir():
+    return getattr(settings, 'UPLOAD_PARTIAL_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'partial_uploads')
+
+
+def partial_path(session):
+    return os.path.join(partial_upload_dir(), f'{session.pk}.part')
+
+
+def start_upload(user, purpose, filename, size, branch=None):
+    """Open a session for `size` bytes after checking type, size and quota"""
+    check_filename(purpose, filename)
+    check_size(size, branch)
+    session = UploadSession.objects.create(
+        user=user, branch=branch, purpose=purpose,
+        filename=os.path.basename(filename)[:255], size=size,
+    )
+    os.makedirs(partial_upload_dir(), exist_ok=True)
+    open(partial_path(session), 'wb').close()
+    return session
+
+
+def append_chunk(session, offset, stream, length):
+    """
+    Write `length` bytes read from `stream` at `offset`. The offset must be
+    what the server already has, so a client that lost a response asks for
+    the status and carries on from there; resending a chunk is harmless.
+
+    The session row is held from the offset check until `received` is
+    updated, so two requests for the same offset write one after the other
+    and the second is answered with a 409.
+    """
+    rejected = None
+    with transaction.atomic():
+        _lock_session(session)
+        if session.status != 'active':
+            raise UploadError(f"This upload is {session.status}.", status=409, offset=session.received)
+        if offset != session.received:
+            raise UploadError("Offset does not match the bytes received.", status=409, offset=session.received)
+        if length <= 0:
+            raise UploadError("Empty chunk.")
+        if length > getattr(settings, 'UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024):
+            raise UploadError("Chunk too large.", status=413)
+        if offset + length > session.size:
+            raise UploadError("Chunk goes past the declared file size.", status=413, offset=session.received)
+        try:
+            _check_quota(session)
+            written = _write_chunk(session, offset, stream, length)
+        except UploadError as error:
+            rejected = error
+        else:
+            # Whatever arrived is kept, so a connection dropped mid-chunk
+            # resumes from the last byte written.
+            session.received = offset + written
+            session.save(update_fields=['received', 'updated_at'])
+    if rejected is not None:
+        abort_upload(session)
+        raise rejected
+    if written != length:
+        raise UploadError("The chunk was cut short; resume from the returned offset.", offset=session.received)
+    if session.received == session.size:
+        _complete(session)
+    return session
+
+
+def _lock_session(session):
+    """Hold the session row until the transaction ends and reload it"""
+    rows = UploadSession.objects.filter(pk=session.pk)
+    if connection.features.has_select_for_update:
+        list(rows.select_for_update().values_list('pk', flat=True))
+    else:
+        # SQLite: the no-op UPDATE takes the database write lock instead.
+        rows.update(received=F('received'))
+    session.refresh_from_db()
+
+
+def _check_quota(session):
+    """Reject the upload if the branch went over quota after it was opened; earlier uploads win"""
+    quota = branch_quota(session.branch)
+    if quota is not None and branch_usage(session.branch, opened_by=session) > quota:
+        raise UploadError(f"{session.branch.name} has used its {filesizeformat(quota)} upload quota.", status=413)
+
+
+def _write_chunk(session, offset, stream, length):
+    """Copy up to `length` bytes into the partial file; returns how many arrived"""
+    ext = os.path.splitext(session.filename)[1].lower()
+    written = 0
+    with open(partial_path(session), 'r+b') as partial:
+        partial.seek(offset)
+        while written < length:
+            data = stream.read(min(UPLOAD_READ_SIZE, length - written))
+            if not data:
+                break
+            if offset == 0 and written == 0:
+                check_signature(ext, data[:SIGNATURE_LENGTH])
+            partial.write(data)
+            written += len(data)
+        partial.truncate(offset + written)
+    return written
+
+
+def _complete(session):
+    with open(partial_path(session), 'rb') as partial:
+        session.blob_name = content_addressed_storage.save(session.filename, File(partial, name=session.filename))
+    session.status = 'complete'
+    session.save(update_fields=['blob_name', 'status', 'updated_at'])
+    os.unlink(partial_path(session))
+
+
+def abort_upload(session):
+    session.status = 'aborted'
+    session.save(update_fields=['status', 'updated_at'])
+    _remove_partial(session)
+
+
+def _remove_partial(session):
+    try:
+        os.unlink(partial_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def get_completed_upload(upload_id, user, purpose):
+    """The finished session `upload_id` of `user` for `purpose`, as a form ValidationError otherwise"""
+    try:
+        return UploadSession.objects.get(pk=upload_id, user=user, purpose=purpose, status='complete')
+    except (UploadSession.DoesNotExist, ValidationError, ValueError):
+        raise ValidationError("The uploaded file could not be found; please upload it again.")
+
+
+def expire_upload_sessions(now=None):
+    """Delete sessions idle for UPLOAD_SESSION_TTL and their partial files; returns how many"""
+    ttl = getattr(settings, 'UPLOAD_SESSION_TTL', timedelta(hours=48))
+    expired = UploadSession.objects.filter(updated_at__lt=(now or timezone.now()) - ttl)
+    count = 0
+    for session in expired.iterator():
+        _remove_partial(session)
+        count += 1
+    expired.delete()
+    return count
@@ -8,6 +8,8 @@ urlpatterns = [
     # Animal management
     path('animals/', views.animal_list, name='animal_list'),
     path('animals/add/', views.add_animal, name='add_animal'),
+    path('animals/import/', views.animal_import, name='animal_import'),
+    path('animals/export/', views.animal_export, name='animal_export'),
     path('animals/<int:animal_id>/', views.view_animal_detail, name='view_animal_detail'),
     
     # Task management
@@ -24,9 +26,21 @@ urlpatterns = [
     path('messages/compose/', views.compose_message, name='compose_message'),
     path('messages/<int:message_id>/reply/', views.reply_message, name='reply_message'),
     
+    # Search
+    path('search/', views.global_search, name='global_search'),
+
     # API endpoints
+    path('api/search/', views.search_api, name='search_api'),
+    path('api/animals/autocomplete/', views.animal_autocomplete, name='animal_autocomplete'),
+    path('api/animals/<int:animal_id>/timeline/', views.animal_timeline_api, name='animal_timeline_api'),
+    path('api/uploads/', views.upload_start, name='upload_start'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_detail, name='upload_detail'),
     path('api/notifications/count/', views.notification_count_api, name='notification_count_api'),
     path('api/messages/unread/', views.unread_message_count_api, name='unread_message_count_api'),
+    path('api/events/', views.unread_counts_stream, name='unread_counts_stream'),
+    path('api/audit/metrics/', views.audit_metrics_api, name='audit_metrics_api'),
+    path('api/metrics/', views.request_metrics_api, name='request_metrics_api'),
+    path('metrics/', views.prometheus_metrics, name='prometheus_metrics'),
 
     # Reports
     path('reports/', views.reports_list, name='reports_list'),
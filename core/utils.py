@@ -1,33 +1,27 @@
 from django.contrib.auth import get_user_model
 from .models import SystemLog, Notification
+from .audit import write_system_log
+from .jobs import background_task  # noqa: F401  (tasks are declared with core.utils.background_task)
+from .branches import is_same_branch, normalize_branch_name  # noqa: F401
+from .counters import adjust_counters, notification_key
+from .realtime import publish_unread_counts
 from django.utils import timezone
 
 User = get_user_model()
 
 def log_action(user, action, message, ip_address=None):
     """
-    Log user actions to the system log
+    Log user actions to the system log (written in batches, see core.audit)
     """
-    SystemLog.objects.create(
+    write_system_log(SystemLog(
         user=user,
         role=user.role,
-        branch=user.branch,
+        branch=user.branch.name if user.branch else '',
+        branch_fk_id=user.branch_id,
         action=action,
         message=message,
         ip_address=ip_address
-    )
-
-def normalize_branch_name(name):
-    """
-    Normalize branch names by:
-    - Stripping whitespace
-    - Lowercasing
-    - Removing spaces and underscores
-    """
-    if not name:
-        return ""
-    return name.strip().lower().replace("_", "").replace(" ", "")
-
+    ))
 
 def create_notification(user, notification_type, title, message, link=None):
     """
@@ -56,7 +50,16 @@ def notify_users(users, notification_type, title, message, link=None):
                 link=link
             )
         )
+    deliver_notifications(notifications)
+
+def deliver_notifications(notifications):
+    """
+    Insert unsaved Notifications (each with its own text) in one query
+    """
     Notification.objects.bulk_create(notifications)
+    # bulk_create skips post_save, so bump the counters and push explicitly
+    adjust_counters(added=[notification_key(notification.user_id) for notification in notifications])
+    publish_unread_counts(notification.user_id for notification in notifications)
 
 def get_user_notifications(user, unread_only=False):
     """
@@ -108,13 +111,7 @@ def can_access_branch(user, branch_name):
     """
     Check if a user can access a specific branch
     """
-    if user.role == 'superadmin':
-        return True
-    
-    if user.branch and user.branch.name.lower() == branch_name.lower():
-        return True
-    
-    return False
+    return user.role == 'superadmin' or is_same_branch(user.branch, branch_name)
 
 def get_user_permissions(user):
     """
@@ -1,9 +1,16 @@
+import hmac
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods, require_POST
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.db.models import Q
-from django.core.paginator import Paginator
 from django.utils import timezone
 from django.forms import inlineformset_factory
 from core.models import Animal, TrainingRecord
@@ -19,11 +26,23 @@ from core.models import TrainingSession
 from .models import (
     Branch, Animal, Notification, Message, VetTask, 
     SupportTicket, TicketReply, MedicalRecord, AnimalLog,
-    EquipmentLog, EmergencyIncident, DailyActivityReport
+    EquipmentLog, EmergencyIncident, DailyActivityReport, UploadSession
 )
-from .forms import MessageForm, MessageReplyForm, VetTaskForm, SupportTicketForm, TicketReplyForm, AnimalForm
-from .utils import log_action, create_notification, notify_users, can_access_branch, get_user_dashboard_url
-from accounts.models import CustomUser
+from .forms import MessageForm, MessageReplyForm, VetTaskForm, SupportTicketForm, TicketReplyForm, AnimalForm, AnimalImportUploadForm
+from .utils import log_action, create_notification, can_access_branch, get_user_dashboard_url
+from .branches import with_branch
+from horse.middleware.instrumentation import registry as metrics_registry, prometheus_text, query_budget
+from .audit import get_audit_metrics
+from .jobs import get_job_metrics
+from .tasks import notify_branch_admins
+from .uploads import UploadError, abort_upload, append_chunk, start_upload
+from .pagination import paginate
+from .autocomplete import lookup_animals
+from .search import SEARCH_SOURCES, search as search_index, search_filter
+from .timeline import animal_timeline, serialize_entry
+from .animal_io import AnimalFileError, COLUMNS, import_animals, export_csv_response, export_xlsx_response
+from .counters import get_unread_notification_count, get_unread_message_count
+from .realtime import get_broker, get_unread_counts, format_sse
 
 
 # ------------------------------
@@ -73,12 +92,8 @@ def add_animal(request):
             animal.assigned_users.add(request.user)
 
             # Notify admins/superadmins
-            admins = CustomUser.objects.filter(
-                branch=branch,
-                role__in=['admin', 'superadmin']
-            )
-            notify_users(
-                users=admins,
+            notify_branch_admins.delay(
+                branch_id=animal.branch_id,
                 notification_type='animal_assigned',
                 title='New Animal Added',
                 message=f"New animal '{animal.name}' (#{animal.force_number}) added by {request.user.get_full_name()}.",
@@ -107,9 +122,8 @@ def add_animal(request):
     })
 
 
-@login_required
-def animal_list(request):
-    """List all animals with filtering and pagination"""
+def _filtered_animals(request):
+    """Animals visible to the user, narrowed by the list page's filters"""
     user = request.user
 
     # Base queryset based on user role
@@ -130,16 +144,18 @@ def animal_list(request):
         animals = animals.filter(species=species_filter)
 
     if search:
-        animals = animals.filter(
-            Q(name__icontains=search) | 
-            Q(force_number__icontains=search) |
-            Q(species__icontains=search)
-        )
+        animals = search_filter(animals, search)
+    return animals, branch_filter, species_filter, search
+
+
+@login_required
+def animal_list(request):
+    """List all animals with filtering and pagination"""
+    user = request.user
+    animals, branch_filter, species_filter, search = _filtered_animals(request)
 
     # Pagination
-    paginator = Paginator(animals, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, animals.for_list('roster'), per_page=12)
 
     # Context for filters
     context = {
@@ -157,6 +173,60 @@ def animal_list(request):
     return render(request, 'core/animal_list.html', context)
 
 
+@login_required
+def animal_import(request):
+    """Bulk-import animals and training records from a CSV or XLSX file"""
+    if request.user.role not in ['admin', 'veterinarian', 'superadmin']:
+        return render(request, 'errors/unauthorized.html', status=403)
+
+    errors = []
+    if request.method == 'POST':
+        form = AnimalImportUploadForm(request.POST, request.FILES, user=request.user)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            branch = form.cleaned_data.get('branch') or request.user.branch
+            if branch is None:
+                form.add_error(None, "Choose the branch to import into.")
+            else:
+                try:
+                    result = import_animals(upload, upload.name, branch, request.user)
+                except AnimalFileError as exc:
+                    form.add_error('file', str(exc))
+                else:
+                    if not result.errors:
+                        messages.success(
+                            request,
+                            f"Imported {result.animals} animals and {result.training_records} training records."
+                        )
+                        return redirect('animal_list')
+                    errors = result.errors
+                    messages.error(request, "Nothing was imported; fix the rows below and upload the file again.")
+    else:
+        form = AnimalImportUploadForm(user=request.user)
+
+    return render(request, 'core/animal_import.html', {
+        'form': form,
+        'errors': errors,
+        'columns': COLUMNS,
+    })
+
+
+@login_required
+def animal_export(request):
+    """Download the (filtered) animal list with training records as CSV or XLSX"""
+    if request.user.role not in ['admin', 'veterinarian', 'superadmin']:
+        return render(request, 'errors/unauthorized.html', status=403)
+
+    animals = _filtered_animals(request)[0]
+    if request.GET.get('format') == 'xlsx':
+        try:
+            return export_xlsx_response(animals)
+        except AnimalFileError as exc:
+            messages.error(request, str(exc))
+            return redirect('animal_list')
+    return export_csv_response(animals)
+
+
 # ------------------------------
 # Task Management Views
 # ------------------------------
@@ -204,25 +274,24 @@ def assign_vet_task(request):
 # ------------------------------
 
 @login_required
-def ticket_list(request, branch):
+@with_branch
+def ticket_list(request, branch, branch_obj):
     """List support tickets for a branch"""
     if not can_access_branch(request.user, branch):
         return HttpResponseForbidden("Unauthorized")
 
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
-    tickets = SupportTicket.objects.filter(branch=branch_obj).order_by('-created_at')
+    tickets = SupportTicket.objects.filter(branch=branch_obj).order_by('-created_at').for_list()
     
     # Filter by status if provided
     status_filter = request.GET.get('status')
     if status_filter:
         tickets = tickets.filter(status=status_filter)
 
-    paginator = Paginator(tickets, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, tickets, per_page=15)
 
     context = {
         'page_obj': page_obj,
+        'tickets': page_obj,
         'branch': branch,
         'status_filter': status_filter,
         'status_choices': SupportTicket.STATUS_CHOICES,
@@ -232,12 +301,12 @@ def ticket_list(request, branch):
 
 
 @login_required
-def ticket_detail(request, branch, ticket_id):
+@with_branch
+def ticket_detail(request, branch, ticket_id, branch_obj):
     """View and reply to a support ticket"""
     if not can_access_branch(request.user, branch):
         return HttpResponseForbidden("Unauthorized")
 
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
     ticket = get_object_or_404(SupportTicket, id=ticket_id, branch=branch_obj)
     replies = ticket.replies.all()
 
@@ -280,13 +349,12 @@ def ticket_detail(request, branch, ticket_id):
 
 
 @login_required
-def ticket_create(request, branch):
+@with_branch
+def ticket_create(request, branch, branch_obj):
     """Create a new support ticket"""
     if not can_access_branch(request.user, branch):
         return HttpResponseForbidden("Unauthorized")
 
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
-
     if request.method == 'POST':
         form = SupportTicketForm(request.POST)
         if form.is_valid():
@@ -296,12 +364,8 @@ def ticket_create(request, branch):
             ticket.save()
 
             # Notify admins about new ticket
-            admins = CustomUser.objects.filter(
-                branch=branch_obj,
-                role__in=['admin', 'superadmin']
-            )
-            notify_users(
-                users=admins,
+            notify_branch_admins.delay(
+                branch_id=branch_obj.id,
                 notification_type='system_alert',
                 title='New Support Ticket',
                 message=f'New support ticket created: {ticket.subject}',
@@ -326,12 +390,10 @@ def inbox(request):
     messages_qs = Message.objects.filter(
         receiver=request.user, 
         is_deleted=False
-    ).order_by('-timestamp')
-    
-    paginator = Paginator(messages_qs, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    ).order_by('-timestamp').for_list()
     
+    page_obj = paginate(request, messages_qs, per_page=15)
+
     return render(request, 'core/inbox.html', {'page_obj': page_obj})
 
 
@@ -446,37 +508,256 @@ def deleted_messages(request):
     return render(request, 'messages/deleted.html', {'messages': messages})
 
 
+# ------------------------------
+# Search
+# ------------------------------
+
+def _search_scope(request):
+    """(query, kinds, branch_ids) for the search views; superadmins see every branch"""
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('type')
+    kinds = [kind] if kind in {source.kind for source in SEARCH_SOURCES} else None
+    if request.user.role == 'superadmin':
+        branch_ids = None
+    else:
+        branch_ids = [request.user.branch_id] if request.user.branch_id else []
+    return query, kinds, branch_ids
+
+
+@login_required
+def global_search(request):
+    """Ranked search across animals, medical records, animal logs and incidents"""
+    query, kinds, branch_ids = _search_scope(request)
+    hits = search_index(query, branch_ids=branch_ids, kinds=kinds, limit=50) if query else []
+    return render(request, 'core/search.html', {
+        'query': query,
+        'selected_type': kinds[0] if kinds else '',
+        'sources': SEARCH_SOURCES,
+        'hits': hits,
+    })
+
+
 # ------------------------------
 # API Views
 # ------------------------------
 
 @login_required
+@query_budget(5)
+def animal_autocomplete(request):
+    """Top matches for a partial force number or name, for AnimalLookupWidget"""
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
+    if request.user.role == 'superadmin':
+        branch_id = request.GET.get('branch') or None
+    elif request.user.branch_id:
+        branch_id = request.user.branch_id
+    else:
+        return JsonResponse({'results': []})
+
+    response = JsonResponse({'results': lookup_animals(request.GET.get('q'), branch_id=branch_id, limit=max(limit, 1))})
+    response['Cache-Control'] = 'private, max-age=30'
+    return response
+
+
+@login_required
+def animal_timeline_api(request, animal_id):
+    """Older pages of an animal's history for the detail page's 'Load older' button"""
+    if request.user.role not in ['admin', 'veterinarian', 'superadmin']:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+
+    animal = get_object_or_404(Animal, pk=animal_id, branch=request.user.branch)
+    page = animal_timeline(animal, cursor=request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [serialize_entry(entry) for entry in page],
+        'next': page.next_cursor,
+    })
+
+
+# ------------------------------
+# Chunked uploads
+# ------------------------------
+
+def _upload_state(session):
+    return {
+        'id': str(session.pk),
+        'url': reverse('upload_detail', args=[session.pk]),
+        'offset': session.received,
+        'size': session.size,
+        'status': session.status,
+    }
+
+
+def _upload_error(error):
+    payload = {'error': str(error)}
+    if error.offset is not None:
+        payload['offset'] = error.offset
+    return JsonResponse(payload, status=error.status)
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    """Open a resumable upload: JSON {purpose, filename, size}"""
+    try:
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise TypeError('Expected a JSON object')
+        size = int(data.get('size', 0))
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Expected JSON with purpose, filename and size'}, status=400)
+    try:
+        session = start_upload(
+            request.user, data.get('purpose'), str(data.get('filename') or ''), size, branch=request.user.branch,
+        )
+    except UploadError as error:
+        return _upload_error(error)
+    return JsonResponse(_upload_state(session), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PUT', 'PATCH', 'DELETE'])
+def upload_detail(request, upload_id):
+    """Status (GET), next chunk (PUT with Upload-Offset) or abandon (DELETE) of the user's upload"""
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    if request.method == 'DELETE':
+        if session.status == 'active':
+            abort_upload(session)
+        return JsonResponse(_upload_state(session))
+    if request.method in ('PUT', 'PATCH'):
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Upload-Offset and Content-Length are required'}, status=400)
+        try:
+            # Read from the request stream, never request.body, so the chunk is not held in memory.
+            append_chunk(session, offset, request, length)
+        except UploadError as error:
+            return _upload_error(error)
+    return JsonResponse(_upload_state(session))
+
+
+@login_required
+def search_api(request):
+    query, kinds, branch_ids = _search_scope(request)
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 50)
+    except ValueError:
+        limit = 20
+    hits = search_index(query, branch_ids=branch_ids, kinds=kinds, limit=limit)
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {
+                'type': hit.kind,
+                'id': hit.object_id,
+                'title': hit.title,
+                'snippet': hit.snippet,
+                'url': hit.url,
+                'rank': hit.rank,
+            }
+            for hit in hits
+        ],
+    })
+
+
+@login_required
+@query_budget(3)
 def notification_count_api(request):
     """API endpoint to get unread notification count"""
-    count = request.user.notifications.filter(is_read=False).count()
+    count = get_unread_notification_count(request.user.id)
     return JsonResponse({'count': count})
 
 
 @login_required
+@query_budget(3)
 def unread_message_count_api(request):
     """API endpoint to get unread message count"""
-    count = request.user.received_messages.filter(
-        is_read=False, 
-        is_deleted=False
-    ).count()
+    count = get_unread_message_count(request.user.id)
     return JsonResponse({'count': count})
 
 
+
+def _can_view_metrics(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    user = request.user
+    return user.is_authenticated and (user.is_staff or user.role == 'superadmin')
+
+
+@login_required
+def audit_metrics_api(request):
+    """Queue depth and write/drop counters of the batched SystemLog writer"""
+    if not _can_view_metrics(request):
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    return JsonResponse(get_audit_metrics())
+
+
+@login_required
+def request_metrics_api(request):
+    """Per-view query counts, SQL/template time and response sizes"""
+    if not _can_view_metrics(request):
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    return JsonResponse(metrics_registry.snapshot())
+
+
+def prometheus_metrics(request):
+    """The same metrics in the Prometheus text format (staff session or METRICS_TOKEN)"""
+    if not _can_view_metrics(request):
+        return HttpResponseForbidden("Unauthorized")
+    audit = get_audit_metrics()
+    jobs = get_job_metrics()
+    body = prometheus_text({
+        'tpf_systemlog_queue_depth': ('gauge', 'SystemLog entries waiting to be written', audit['queue_depth']),
+        'tpf_systemlog_dropped_total': ('counter', 'SystemLog entries dropped', audit['dropped']),
+        'tpf_jobs_queued': ('gauge', 'Background jobs waiting to run', jobs['queued']),
+        'tpf_jobs_failed': ('gauge', 'Background jobs that used up their retries', jobs['failed']),
+        'tpf_jobs_oldest_due_seconds': ('gauge', 'Age of the oldest due background job', jobs['oldest_due_seconds']),
+    })
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def _unread_events_async(user_id, keepalive):
+    subscription = get_broker().subscribe(user_id)
+    wait = sync_to_async(subscription.get, thread_sensitive=False)
+    try:
+        yield format_sse(await sync_to_async(get_unread_counts)(user_id))
+        while True:
+            payload = await wait(timeout=keepalive)
+            yield format_sse(payload) if payload is not None else ": keepalive\n\n"
+    finally:
+        subscription.close()
+
+
+@login_required
+def unread_counts_stream(request):
+    """
+    Server-Sent Events stream of unread notification/message counts. Only
+    served under ASGI: under WSGI an open tab would hold a worker thread for
+    the whole connection, so the stream is refused with 204, which makes
+    EventSource stop and messages.js poll instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    keepalive = getattr(settings, 'REALTIME_KEEPALIVE_SECONDS', 25)
+    events = _unread_events_async(request.user.id, keepalive)
+
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def view_animal_detail(request, animal_id):
     if request.user.role not in ['admin', 'veterinarian', 'superadmin']:
         return render(request, 'errors/unauthorized.html', status=403)
 
     animal = get_object_or_404(Animal, pk=animal_id, branch=request.user.branch)
-
-    medical_records = animal.medical_records.all().order_by('-date_recorded')
-    tasks = animal.vet_tasks.all().order_by('-due_date')      # use correct related_name
-    training_records = animal.training_records.all().order_by('-date_recorded')
+    timeline = animal_timeline(animal, cursor=request.GET.get('cursor'))
 
     log_action(
         user=request.user,
@@ -486,9 +767,7 @@ def view_animal_detail(request, animal_id):
 
     context = {
         'animal': animal,
-        'medical_records': medical_records,
-        'tasks': tasks,
-        'training_records': training_records
+        'timeline': timeline,
     }
 
     return render(request, 'core/animal_detail.html', context)
@@ -511,7 +790,8 @@ def reports_list(request):
     else:
         reports = Report.objects.none()
 
-    return render(request, 'core/reports_list.html', {'reports': reports})
+    reports = paginate(request, reports)
+    return render(request, 'core/reports_list.html', {'reports': reports, 'page_obj': reports})
 
 
 @login_required
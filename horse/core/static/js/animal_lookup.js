@@ -0,0 +1,46 @@
+// Suggestions for AnimalLookupWidget inputs (core.forms), fetched from the
+// autocomplete endpoint while the user types a force number or name.
+(function () {
+    if (window.animalLookupLoaded) {
+        return;
+    }
+    window.animalLookupLoaded = true;
+
+    const DEBOUNCE_MS = 150;
+
+    function attach(input) {
+        const list = document.getElementById(input.getAttribute('list'));
+        let timer = null;
+        let controller = null;
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            const term = input.value.trim();
+            if (!term || !list) {
+                return;
+            }
+            timer = setTimeout(() => {
+                if (controller) {
+                    controller.abort();
+                }
+                controller = new AbortController();
+                const url = `${input.dataset.animalLookup}?q=${encodeURIComponent(term)}`;
+                fetch(url, {signal: controller.signal, credentials: 'same-origin'})
+                    .then(response => response.json())
+                    .then(data => {
+                        list.replaceChildren(...data.results.map(animal => {
+                            const option = document.createElement('option');
+                            option.value = animal.force_number;
+                            option.label = `${animal.name} (${animal.species})`;
+                            return option;
+                        }));
+                    })
+                    .catch(() => {});
+            }, DEBOUNCE_MS);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        document.querySelectorAll('input[data-animal-lookup]').forEach(attach);
+    });
+})();
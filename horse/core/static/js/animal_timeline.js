@@ -0,0 +1,44 @@
+// "Load older history" on the animal detail page: fetches the next page
+// from the timeline endpoint and appends it instead of reloading the page.
+(function () {
+    const more = document.getElementById('animal-timeline-more');
+    const list = document.getElementById('animal-timeline');
+    if (!more || !list) {
+        return;
+    }
+
+    function render(entry) {
+        const item = document.createElement('li');
+        item.className = 'border-l-4 border-blue-400 pl-3';
+        const meta = document.createElement('div');
+        meta.className = 'text-xs text-gray-500';
+        meta.textContent = `${new Date(entry.timestamp).toLocaleString()} · ${entry.label}`;
+        const title = document.createElement('div');
+        title.className = 'font-medium';
+        title.textContent = entry.title;
+        const summary = document.createElement('div');
+        summary.className = 'text-sm text-gray-700';
+        summary.textContent = entry.summary.length > 200 ? `${entry.summary.slice(0, 199)}…` : entry.summary;
+        item.append(meta, title, summary);
+        return item;
+    }
+
+    more.addEventListener('click', event => {
+        event.preventDefault();
+        const url = `${more.dataset.timelineUrl}?cursor=${encodeURIComponent(more.dataset.cursor)}`;
+        fetch(url, {credentials: 'same-origin'})
+            .then(response => response.json())
+            .then(data => {
+                list.append(...data.results.map(render));
+                if (data.next) {
+                    more.dataset.cursor = data.next;
+                    more.href = `?cursor=${data.next}`;
+                } else {
+                    more.remove();
+                }
+            })
+            .catch(() => {
+                window.location.href = more.href;
+            });
+    });
+})();
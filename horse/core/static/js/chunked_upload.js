@@ -0,0 +1,131 @@
+// Resumable uploads for ChunkedFileInput widgets (core.forms). When the form
+// is submitted, each chosen file is sent to the uploads API in chunks; the
+// upload id goes into the hidden '<name>_upload' input and the file itself
+// is left out of the form post. Upload ids are remembered per file in
+// localStorage, so a page reloaded after a dropped connection resumes
+// instead of starting again.
+(function () {
+    if (window.chunkedUploadLoaded) {
+        return;
+    }
+    window.chunkedUploadLoaded = true;
+
+    const CHUNK_SIZE = 512 * 1024;
+    const MAX_RETRIES = 8;
+
+    function csrfToken(form) {
+        const input = form.querySelector('input[name="csrfmiddlewaretoken"]');
+        return input ? input.value : '';
+    }
+
+    function fileKey(file, purpose) {
+        return `chunked-upload:${purpose}:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function request(url, options) {
+        const response = await fetch(url, {credentials: 'same-origin', ...options});
+        const data = await response.json().catch(() => ({}));
+        return {response, data};
+    }
+
+    async function session(input, file, token) {
+        const key = fileKey(file, input.dataset.purpose);
+        const saved = localStorage.getItem(key);
+        if (saved) {
+            const {response, data} = await request(saved, {headers: {'X-CSRFToken': token}});
+            if (response.ok && data.status !== 'aborted') {
+                return {url: saved, key, ...data};
+            }
+            localStorage.removeItem(key);
+        }
+        const {response, data} = await request(input.dataset.chunkedUpload, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': token},
+            body: JSON.stringify({purpose: input.dataset.purpose, filename: file.name, size: file.size}),
+        });
+        if (!response.ok) {
+            throw new Error(data.error || 'Upload refused');
+        }
+        localStorage.setItem(key, data.url);
+        return {url: data.url, key, ...data};
+    }
+
+    async function upload(input, file, token, progress) {
+        const upload = await session(input, file, token);
+        let offset = upload.offset;
+        let retries = 0;
+        while (upload.status !== 'complete' && offset < file.size) {
+            progress.textContent = `Uploading ${file.name}: ${Math.floor(100 * offset / file.size)}%`;
+            try {
+                const {response, data} = await request(upload.url, {
+                    method: 'PUT',
+                    headers: {'Content-Type': 'application/octet-stream', 'Upload-Offset': offset, 'X-CSRFToken': token},
+                    body: file.slice(offset, offset + CHUNK_SIZE),
+                });
+                if (response.status >= 500) {
+                    throw new TypeError('Server error');
+                }
+                if (response.status >= 400 && response.status !== 409) {
+                    localStorage.removeItem(upload.key);
+                    throw new Error(data.error || 'Upload refused');
+                }
+                if (data.offset !== undefined) {
+                    offset = data.offset;
+                }
+                upload.status = data.status;
+                if (response.ok) {
+                    retries = 0;
+                }
+            } catch (error) {
+                if (error.message && !(error instanceof TypeError)) {
+                    throw error;
+                }
+                // Network or server failure: back off, then ask the server where to resume.
+                if (++retries > MAX_RETRIES) {
+                    throw new Error('Connection lost; submit again to resume the upload.');
+                }
+                await sleep(Math.min(30000, 1000 * 2 ** retries));
+                const {response, data} = await request(upload.url, {headers: {'X-CSRFToken': token}}).catch(() => ({}));
+                if (response && response.ok) {
+                    offset = data.offset;
+                    upload.status = data.status;
+                }
+            }
+        }
+        localStorage.removeItem(upload.key);
+        progress.textContent = `${file.name} uploaded.`;
+        return upload.id;
+    }
+
+    function attach(form) {
+        form.addEventListener('submit', async event => {
+            const inputs = [...form.querySelectorAll('input[data-chunked-upload]')].filter(input => input.files.length);
+            if (!inputs.length) {
+                return;
+            }
+            event.preventDefault();
+            const token = csrfToken(form);
+            try {
+                for (const input of inputs) {
+                    const progress = form.querySelector(`[data-upload-progress-for="${input.id}"]`) || document.createElement('p');
+                    const id = await upload(input, input.files[0], token, progress);
+                    form.querySelector(`input[name="${input.name}_upload"]`).value = id;
+                    input.value = '';
+                }
+            } catch (error) {
+                alert(error.message);
+                return;
+            }
+            form.submit();
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        const forms = new Set([...document.querySelectorAll('input[data-chunked-upload]')].map(input => input.form));
+        forms.forEach(form => form && attach(form));
+    });
+})();
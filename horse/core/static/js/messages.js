@@ -1,17 +1,51 @@
-function updateUnreadCount() {
-    const branchName = document.body.dataset.branch;
-    fetch(`/api/messages/unread-count/${branchName}/`)
-        .then(response => response.json())
-        .then(data => {
-            const counter = document.getElementById('unread-message-count');
-            if (counter) {
-                counter.textContent = data.count;
-                counter.style.display = data.count > 0 ? 'block' : 'none';
-            }
-        });
+const UNREAD_STREAM_URL = '/core/api/events/';
+const UNREAD_POLL_URLS = {
+    notifications: '/core/api/notifications/count/',
+    messages: '/core/api/messages/unread/',
+};
+const UNREAD_POLL_INTERVAL = 60000;
+
+// Badges are marked with data-unread="notifications" or data-unread="messages".
+function renderCount(kind, count) {
+    document.querySelectorAll(`[data-unread="${kind}"]`).forEach(counter => {
+        counter.textContent = count;
+        counter.style.display = count > 0 ? '' : 'none';
+    });
+}
+
+function renderUnreadCounts(data) {
+    renderCount('messages', data.messages);
+    renderCount('notifications', data.notifications);
+}
+
+function updateUnreadCounts() {
+    Object.entries(UNREAD_POLL_URLS).forEach(([kind, url]) => {
+        fetch(url)
+            .then(response => response.json())
+            .then(data => renderCount(kind, data.count));
+    });
+}
+
+function startPolling() {
+    updateUnreadCounts();
+    setInterval(updateUnreadCounts, UNREAD_POLL_INTERVAL);
 }
 
 document.addEventListener('DOMContentLoaded', () => {
-    updateUnreadCount();
-    setInterval(updateUnreadCount, 60000);
-});
\ No newline at end of file
+    // The server pushes counts only when they change; polling is the
+    // fallback for browsers without EventSource and for servers that
+    // answer the stream with 204 (WSGI deployments).
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    const source = new EventSource(UNREAD_STREAM_URL);
+    source.addEventListener('unread', event => renderUnreadCounts(JSON.parse(event.data)));
+    source.onerror = () => {
+        // EventSource reconnects by itself unless the server refused the stream.
+        if (source.readyState === EventSource.CLOSED) {
+            startPolling();
+        }
+    };
+});
@@ -1,5 +1,6 @@
 from django.db.models import Q
 from core.models import Message
+from core.counters import get_unread_message_count
 
 def get_message_thread(message):
     return Message.objects.filter(
@@ -9,9 +10,4 @@ def get_message_thread(message):
     ).order_by('timestamp')
 
 def get_unread_messages_count(user, branch):
-    return Message.objects.filter(
-        receiver=user,
-        branch=branch,
-        is_read=False,
-        is_deleted=False
-    ).count()
\ No newline at end of file
+    return get_unread_message_count(user.id, branch.id)
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""
+Per-request SQL, template and response-size instrumentation.
+
+RequestMetricsMiddleware records, for every request, the number of SQL
+queries and their total time, the time spent rendering templates, the total
+latency and the response size, and aggregates them per (URL name, user role)
+in the process-wide `registry`. core.views serves the aggregates as JSON and
+in the Prometheus text format.
+
+Views may declare a query budget, either with the @query_budget(n) decorator
+or in settings.QUERY_BUDGETS = {'url_name': n}. Requests that go over it are
+logged and counted per view, with the most recent RECENT_VIOLATIONS kept in
+full; horse.test_runner.BudgetTestRunner fails the test run when any were
+recorded.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+RECENT_VIOLATIONS = 100
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_time', 'template_time', 'template_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Used as a connection.execute_wrapper()
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+
+
+class ViewMetrics:
+    __slots__ = ('requests', 'queries', 'max_queries', 'sql_time', 'template_time',
+                 'duration', 'response_bytes', 'latency_buckets')
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.duration = 0.0
+        self.response_bytes = 0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'queries': self.queries,
+            'avg_queries': self.queries / self.requests if self.requests else 0,
+            'max_queries': self.max_queries,
+            'sql_seconds': self.sql_time,
+            'template_seconds': self.template_time,
+            'duration_seconds': self.duration,
+            'response_bytes': self.response_bytes,
+        }
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.views = defaultdict(ViewMetrics)
+        self.violations = Counter()
+        self.recent_violations = deque(maxlen=RECENT_VIOLATIONS)
+
+    def record(self, view, role, stats, duration, response_bytes):
+        with self._lock:
+            metrics = self.views[(view, role)]
+            metrics.requests += 1
+            metrics.queries += stats.queries
+            metrics.max_queries = max(metrics.max_queries, stats.queries)
+            metrics.sql_time += stats.sql_time
+            metrics.template_time += stats.template_time
+            metrics.duration += duration
+            metrics.response_bytes += response_bytes
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    metrics.latency_buckets[index] += 1
+
+    def record_violation(self, view, path, queries, budget):
+        with self._lock:
+            self.violations[view] += 1
+            self.recent_violations.append({'view': view, 'path': path, 'queries': queries, 'budget': budget})
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'views': [
+                    {'view': view, 'role': role, **metrics.as_dict()}
+                    for (view, role), metrics in sorted(self.views.items())
+                ],
+                'budget_violations': list(self.recent_violations),
+                'budget_violation_counts': dict(self.violations),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.views.clear()
+            self.violations.clear()
+            self.recent_violations.clear()
+
+
+registry = MetricsRegistry()
+
+
+def query_budget(max_queries):
+    """Declare the most SQL queries a view may run per request"""
+    def decorator(view_func):
+        # Outer decorators built with functools.wraps copy the attribute along.
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def _instrument_templates():
+    """Time template rendering; only the outermost render of a request is counted"""
+    if getattr(Template.render, 'instrumented', False):
+        return
+    original_render = Template.render
+
+    def render(self, context):
+        stats = _current.get()
+        if stats is None:
+            return original_render(self, context)
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original_render(self, context)
+        finally:
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                stats.template_time += time.perf_counter() - started
+
+    render.instrumented = True
+    Template.render = render
+
+
+class RequestMetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        _instrument_templates()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.view_name if match else None) or 'unresolved'
+        user = getattr(request, 'user', None)
+        role = (getattr(user, 'role', None) or 'user') if user is not None and user.is_authenticated else 'anonymous'
+        size = 0 if response.streaming else len(response.content)
+        registry.record(view, role, stats, duration, size)
+
+        budget = self._budget(match)
+        if budget is not None and stats.queries > budget:
+            logger.warning("%s ran %d queries (budget %d): %s", view, stats.queries, budget, request.path)
+            registry.record_violation(view, request.path, stats.queries, budget)
+        return response
+
+    def _budget(self, match):
+        if match is None:
+            return None
+        budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        for name in (match.view_name, match.url_name):
+            if name in budgets:
+                return budgets[name]
+        return getattr(match.func, 'query_budget', None)
+
+
+# ------------------------------
+# Prometheus text format
+# ------------------------------
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def prometheus_text(extra=None):
+    """Render the registry, plus optional {name: (type, help, value)} series, for Prometheus"""
+    with registry._lock:
+        views = sorted(registry.views.items())
+        violations = dict(registry.violations)
+
+    series = [
+        ('tpf_http_requests_total', 'counter', 'Requests handled', lambda m: m.requests),
+        ('tpf_http_sql_queries_total', 'counter', 'SQL queries run', lambda m: m.queries),
+        ('tpf_http_sql_queries_max', 'gauge', 'Most SQL queries run by one request', lambda m: m.max_queries),
+        ('tpf_http_sql_seconds_total', 'counter', 'Time spent in SQL', lambda m: m.sql_time),
+        ('tpf_http_template_seconds_total', 'counter', 'Time spent rendering templates', lambda m: m.template_time),
+        ('tpf_http_response_bytes_total', 'counter', 'Response body bytes', lambda m: m.response_bytes),
+    ]
+    lines = []
+    for name, kind, help_text, value in series:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [f'{name}{_labels(view=view, role=role)} {value(metrics)}' for (view, role), metrics in views]
+
+    name = 'tpf_http_request_duration_seconds'
+    lines += [f'# HELP {name} Request latency', f'# TYPE {name} histogram']
+    for (view, role), metrics in views:
+        for bound, count in zip(LATENCY_BUCKETS, metrics.latency_buckets):
+            lines.append(f'{name}_bucket{_labels(view=view, role=role, le=bound)} {count}')
+        lines.append(f'{name}_bucket{_labels(view=view, role=role, le="+Inf")} {metrics.requests}')
+        lines.append(f'{name}_sum{_labels(view=view, role=role)} {metrics.duration}')
+        lines.append(f'{name}_count{_labels(view=view, role=role)} {metrics.requests}')
+
+    name = 'tpf_query_budget_violations_total'
+    lines += [f'# HELP {name} Requests over their declared query budget', f'# TYPE {name} counter']
+    lines += [f'{name}{_labels(view=view)} {count}' for view, count in sorted(violations.items())]
+
+    for name, (kind, help_text, value) in (extra or {}).items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
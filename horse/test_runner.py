@@ -0,0 +1,27 @@
+"""
+Test runner that fails the run when any request went over its query budget
+(see horse.middleware.instrumentation).
+"""
+from django.test.runner import DiscoverRunner
+
+from horse.middleware.instrumentation import registry
+
+
+class BudgetTestRunner(DiscoverRunner):
+
+    def run_suite(self, suite, **kwargs):
+        registry.reset()
+        return super().run_suite(suite, **kwargs)
+
+    def suite_result(self, suite, result, **kwargs):
+        failures = super().suite_result(suite, result, **kwargs)
+        snapshot = registry.snapshot()
+        violations = sum(snapshot['budget_violation_counts'].values())
+        if violations:
+            self.log(f"\nQuery budgets exceeded {violations} times; most recent:")
+            for violation in snapshot['budget_violations']:
+                self.log(
+                    f"  {violation['view']} ({violation['path']}): "
+                    f"{violation['queries']} queries, budget {violation['budget']}"
+                )
+        return failures + violations
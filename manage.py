@@ -6,7 +6,8 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tpf_animal_system.settings')
+    settings_module = 'tpf_animal_system.test_settings' if sys.argv[1:2] == ['test'] else 'tpf_animal_system.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -0,0 +1,65 @@
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from core.models import Branch, VetTask, Animal, DailyActivityReport
+
+
+def _counts_by_branch(queryset, **aggregates):
+    """
+    Group a queryset by branch_id and return {branch_id: {alias: value}}
+    """
+    rows = queryset.values('branch_id').annotate(**aggregates).order_by()
+    return {row.pop('branch_id'): row for row in rows}
+
+
+def get_branch_summaries(branches=None, today=None):
+    """
+    Build the per-branch summary rows for the superadmin dashboards.
+
+    Every metric is computed with one grouped query per source table, so the
+    number of queries stays constant no matter how many branches exist.
+    Returns (branch_summaries, branch_labels, branch_reports).
+    """
+    if branches is None:
+        branches = Branch.objects.all()
+    if today is None:
+        today = timezone.now().date()
+
+    users = _counts_by_branch(
+        CustomUser.objects.exclude(role='superadmin'),
+        user_count=Count('id'),
+    )
+    tasks = _counts_by_branch(VetTask.objects.all(), task_count=Count('id'))
+    reports = _counts_by_branch(
+        DailyActivityReport.objects.all(),
+        total_reports=Count('id'),
+        reports_today=Count('id', filter=Q(date=today)),
+    )
+    animals = _counts_by_branch(
+        Animal.objects.all(),
+        animal_count=Count('id'),
+        species_count=Count('species', distinct=True),
+    )
+
+    branch_summaries = []
+    branch_labels = []
+    branch_reports = []
+
+    for branch_obj in branches:
+        branch_reports_row = reports.get(branch_obj.id, {})
+        branch_animals_row = animals.get(branch_obj.id, {})
+
+        branch_summaries.append({
+            'branch': branch_obj.name,
+            'user_count': users.get(branch_obj.id, {}).get('user_count', 0),
+            'task_count': tasks.get(branch_obj.id, {}).get('task_count', 0),
+            'reports_today': branch_reports_row.get('reports_today', 0),
+            'animal_count': branch_animals_row.get('animal_count', 0),
+            'species_count': branch_animals_row.get('species_count', 0),
+        })
+
+        branch_labels.append(branch_obj.name)
+        branch_reports.append(branch_reports_row.get('total_reports', 0))
+
+    return branch_summaries, branch_labels, branch_reports
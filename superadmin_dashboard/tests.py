@@ -1,3 +1,101 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from core.models import Branch, Animal, VetTask, DailyActivityReport
+from .services import get_branch_summaries
+
+
+class BranchSummaryQueryTests(TestCase):
+    """
+    The branch summary must not issue queries per branch.
+    """
+
+    def _seed_branch(self, index):
+        branch = Branch.objects.create(name=f'BRANCH_{index}')
+        vet = CustomUser.objects.create_user(
+            username=f'vet{index}', email=f'vet{index}@example.com',
+            role='veterinarian', branch=branch,
+        )
+        handler = CustomUser.objects.create_user(
+            username=f'user{index}', email=f'user{index}@example.com',
+            role='user', branch=branch,
+        )
+        dog = Animal.objects.create(
+            name=f'Dog {index}', species='dog', force_number=f'D-{index}',
+            age=3, owner_name='TPF', branch=branch,
+        )
+        Animal.objects.create(
+            name=f'Horse {index}', species='horse', force_number=f'H-{index}',
+            age=5, owner_name='TPF', branch=branch,
+        )
+        VetTask.objects.create(
+            title='Checkup', description='Routine', animal=dog,
+            assigned_by=vet, assigned_to=handler, branch=branch,
+            due_date=timezone.now() + timedelta(days=1),
+        )
+        today = timezone.now().date()
+        DailyActivityReport.objects.create(
+            user=handler, branch=branch, date=today, summary='Fed', hours_worked=8,
+        )
+        DailyActivityReport.objects.create(
+            user=handler, branch=branch, date=today - timedelta(days=1),
+            summary='Walked', hours_worked=6,
+        )
+        return branch
+
+    def test_metrics_per_branch(self):
+        self._seed_branch(1)
+        Branch.objects.create(name='EMPTY')
+        CustomUser.objects.create_user(
+            username='root', email='root@example.com', role='superadmin',
+        )
+
+        summaries, labels, reports = get_branch_summaries(
+            branches=Branch.objects.order_by('name'),
+        )
+
+        self.assertEqual(labels, ['BRANCH_1', 'EMPTY'])
+        self.assertEqual(reports, [2, 0])
+        self.assertEqual(summaries[0], {
+            'branch': 'BRANCH_1',
+            'user_count': 2,
+            'task_count': 1,
+            'reports_today': 1,
+            'animal_count': 2,
+            'species_count': 2,
+        })
+        self.assertEqual(summaries[1]['user_count'], 0)
+        self.assertEqual(summaries[1]['species_count'], 0)
+
+    def test_query_count_is_independent_of_branch_count(self):
+        self._seed_branch(1)
+        with self.assertNumQueries(5):
+            get_branch_summaries()
+
+        for index in range(2, 16):
+            self._seed_branch(index)
+        with self.assertNumQueries(5):
+            summaries, _, _ = get_branch_summaries()
+        self.assertEqual(len(summaries), 15)
+
+
+class AnalyticsPageTests(TestCase):
+
+    def test_counts_the_animals_of_active_branches(self):
+        root = CustomUser.objects.create_user(username='root', email='root@example.com', role='superadmin')
+        active = Branch.objects.create(name='ARUSHA')
+        closed = Branch.objects.create(name='CLOSED', is_active=False)
+        for number, branch in enumerate([active, active, closed]):
+            Animal.objects.create(
+                name=f'Dog {number}', species='dog', force_number=f'D-{number}',
+                age=3, owner_name='TPF', branch=branch,
+            )
+        self.client.force_login(root)
 
-# Create your tests here.
+        response = self.client.get('/dashboard/analytics/')
+        self.assertEqual(response.status_code, 200)
+        summaries = response.context['branch_summaries']
+        self.assertEqual([(row['branch'], row['animal_count']) for row in summaries], [('ARUSHA', 2)])
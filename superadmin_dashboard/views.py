@@ -3,12 +3,19 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.http import HttpResponse
 from django.db.models import Count
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.contrib.auth.hashers import make_password
 from django.contrib import messages
 from accounts.models import CustomUser
 from core.models import VetTask, SupportTicket, Branch, SystemLog, Notification, Animal, DailyActivityReport
 from .forms import BranchForm, CustomUserForm
-from datetime import date
+from .services import get_branch_summaries
+from core.stats import get_stats_totals
+from core.counters import get_unread_notification_count
+from datetime import date, datetime, timedelta
+from django.utils.dateparse import parse_date
+from core.log_archive import search_system_logs
+from core.pagination import paginate
 from core.models import Branch
 from core.models import TrainingSession
 
@@ -16,94 +23,70 @@ from core.models import TrainingSession
 def is_superadmin(user):
     return user.is_authenticated and user.role == 'superadmin'
 
-@login_required
-def superadmin_dashboard(request):
-    if request.user.role != 'superadmin':
-        return render(request, 'errors/unauthorized.html', status=403)
-
+def get_dashboard_overview():
+    """Cards, charts and branch summaries of the superadmin dashboard"""
     # ----------------------------
     # Overview Cards
     # ----------------------------
+    stats = get_stats_totals()
     total_users = CustomUser.objects.exclude(role='superadmin').count()
-    total_animals = Animal.objects.count()
     total_branches = Branch.objects.count()
-    reports_today = DailyActivityReport.objects.filter(date=timezone.now().date()).count()
-
-    # ----------------------------
-    # Notifications
-    # ----------------------------
-    all_notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-    notifications = all_notifications[:5]
-    unread_notifications_count = all_notifications.filter(is_read=False).count()
 
     # ----------------------------
     # Users by Role Chart
     # ----------------------------
     role_data = CustomUser.objects.exclude(role='superadmin').values('role').annotate(count=Count('id'))
-    role_labels = [entry['role'].capitalize() for entry in role_data]
-    role_counts = [entry['count'] for entry in role_data]
-
-    # ----------------------------
-    # Task Status Chart
-    # ----------------------------
-    task_status_data = [
-        VetTask.objects.filter(status='pending').count(),
-        VetTask.objects.filter(status='in_progress').count(),
-        VetTask.objects.filter(status='completed').count(),
-        VetTask.objects.filter(status='overdue').count(),  # optional if you track overdue
-    ]
 
     # ----------------------------
     # Branch Summaries
     # ----------------------------
-    branch_summaries = []
-    branch_labels = []
-    branch_reports = []
-
-    branches = Branch.objects.all()
-    for branch_obj in branches:
-        user_count = CustomUser.objects.filter(branch=branch_obj).exclude(role='superadmin').count()
-        task_count = VetTask.objects.filter(branch=branch_obj).count()
-        reports_today_count = DailyActivityReport.objects.filter(branch=branch_obj, date=timezone.now().date()).count()
-        total_reports_count = DailyActivityReport.objects.filter(branch=branch_obj).count()
-        animal_count = Animal.objects.filter(branch=branch_obj).count()
-        species_count = Animal.objects.filter(branch=branch_obj).values('species').distinct().count()
-
-        branch_summaries.append({
-            'branch': branch_obj.name,
-            'user_count': user_count,
-            'task_count': task_count,
-            'reports_today': reports_today_count,
-            'animal_count': animal_count,
-            'species_count': species_count,
-        })
-
-        branch_labels.append(branch_obj.name)
-        branch_reports.append(total_reports_count)
+    branch_summaries, branch_labels, branch_reports = get_branch_summaries()
 
     # ----------------------------
     # Animals by Species Chart
     # ----------------------------
     species_data = Animal.objects.values('species').annotate(count=Count('id'))
-    species_labels = [s['species'] for s in species_data]
-    species_counts = [s['count'] for s in species_data]
 
-    # ----------------------------
-    # Context
-    # ----------------------------
-    context = {
+    return {
         'total_users': total_users,
-        'total_animals': total_animals,
+        'total_animals': stats['animal_count'],
         'total_branches': total_branches,
-        'reports_today': reports_today,
-        'role_labels': role_labels,
-        'role_counts': role_counts,
-        'task_status_data': task_status_data,
+        'reports_today': stats['today']['report_count'],
+        'role_labels': [entry['role'].capitalize() for entry in role_data],
+        'role_counts': [entry['count'] for entry in role_data],
+        'task_status_data': [
+            stats['tasks_pending'],
+            stats['tasks_in_progress'],
+            stats['tasks_completed'],
+            stats['tasks_overdue'],
+        ],
         'branch_summaries': branch_summaries,
         'branch_labels': branch_labels,
         'branch_reports': branch_reports,
-        'species_labels': species_labels,
-        'species_counts': species_counts,
+        'species_labels': [s['species'] for s in species_data],
+        'species_counts': [s['count'] for s in species_data],
+    }
+
+
+@login_required
+def superadmin_dashboard(request):
+    if request.user.role != 'superadmin':
+        return render(request, 'errors/unauthorized.html', status=403)
+
+    # ----------------------------
+    # Notifications
+    # ----------------------------
+    all_notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
+    notifications = all_notifications[:5]
+    unread_notifications_count = get_unread_notification_count(request.user.id)
+
+    # ----------------------------
+    # Context
+    # ----------------------------
+    context = {
+        # Only computed when the cached overview fragment has to be rendered (core.fragments)
+        'overview': SimpleLazyObject(get_dashboard_overview),
+        'today': timezone.localdate(),
         'notifications': notifications,
         'unread_notifications_count': unread_notifications_count,
     }
@@ -125,8 +108,9 @@ def superadmin_manage_users(request):
     if not is_superadmin(request.user):
         return render(request, 'errors/unauthorized.html', status=403)
 
-    users = CustomUser.objects.all().order_by('branch', 'role', 'username')
-    return render(request, 'superadmin_dashboard/admin_user_list.html', {'users': users})
+    # Keyset pagination needs non-null sort keys, so users are no longer grouped by (nullable) branch.
+    users = paginate(request, CustomUser.objects.select_related('branch').order_by('role', 'username'), per_page=50)
+    return render(request, 'superadmin_dashboard/admin_user_list.html', {'users': users, 'page_obj': users})
 
 
 @login_required
@@ -200,21 +184,13 @@ def superadmin_analytics(request):
     today = timezone.now().date()
     reports_today = DailyActivityReport.objects.filter(date=today).count()
 
-    branch_summaries = []
-    all_branches = Branch.objects.filter(is_active=True)
-    for branch in all_branches:
-        user_count = CustomUser.objects.filter(branch=branch.name).count()
-        task_count = VetTask.objects.filter(branch=branch).count()
-        reports = DailyActivityReport.objects.filter(branch=branch, date=today).count()
-        animals = Animal.objects.filter(branch=branch, is_active=True).count()
-
-        branch_summaries.append({
-            'branch': branch.name,
-            'user_count': user_count,
-            'task_count': task_count,
-            'reports_today': reports,
-            'animal_count': animals
-        })
+    # Only branches have an is_active flag; every animal of an active branch
+    # is counted (the old per-branch loop filtered Animal on is_active too,
+    # which raised FieldError as soon as a branch existed).
+    branch_summaries, _, _ = get_branch_summaries(
+        branches=Branch.objects.filter(is_active=True),
+        today=today,
+    )
 
     top_users = (
         DailyActivityReport.objects
@@ -238,7 +214,7 @@ def superadmin_tickets(request):
     if not is_superadmin(request.user):
         return render(request, 'errors/unauthorized.html', status=403)
 
-    tickets = SupportTicket.objects.select_related('created_by').order_by('-created_at')
+    tickets = SupportTicket.objects.order_by('-created_at').for_list()
     branch_groups = {}
     for ticket in tickets:
         branch_name = ticket.branch.name if ticket.branch else "Unknown"
@@ -292,8 +268,37 @@ def superadmin_view_logs(request):
     if not is_superadmin(request.user):
         return render(request, 'errors/unauthorized.html', status=403)
 
-    logs = SystemLog.objects.all().order_by('-timestamp')[:200]
-    return render(request, 'superadmin_dashboard/system_logs.html', {'logs': logs})
+    filters = {
+        'username': request.GET.get('username', '').strip(),
+        'action': request.GET.get('action', ''),
+        'start': request.GET.get('start', ''),
+        'end': request.GET.get('end', ''),
+    }
+    user_id = None
+    if filters['username']:
+        user_id = CustomUser.objects.filter(username=filters['username']).values_list('id', flat=True).first()
+    start_date = parse_date(filters['start']) if filters['start'] else None
+    end_date = parse_date(filters['end']) if filters['end'] else None
+
+    if filters['username'] and user_id is None:
+        logs = []
+    else:
+        logs = search_system_logs(
+            user=user_id,
+            action=filters['action'] or None,
+            start=_start_of_day(start_date) if start_date else None,
+            end=_start_of_day(end_date + timedelta(days=1)) if end_date else None,
+            limit=200,
+        )
+    return render(request, 'superadmin_dashboard/system_logs.html', {
+        'logs': logs,
+        'filters': filters,
+        'action_choices': SystemLog.ACTION_CHOICES,
+    })
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
 
 
 @login_required
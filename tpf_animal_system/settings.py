@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -57,6 +58,7 @@ MIDDLEWARE = [
 
 MIDDLEWARE += [
     'horse.middleware.message_handling.MessageErrorMiddleware',
+    'horse.middleware.instrumentation.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'tpf_animal_system.urls'
@@ -65,13 +67,20 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept per process; the dev server's
+            # autoreloader still resets them when a template changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -140,4 +149,120 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # <-- this is your image folder
 
 # Message configuration
-MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
\ No newline at end of file
+MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
+
+# Real-time unread counters (core.realtime). Leave unset to use the
+# in-process pub/sub; set to e.g. redis://localhost:6379/0 to fan out
+# across worker processes.
+REALTIME_BROKER_URL = os.environ.get('REALTIME_BROKER_URL')
+REALTIME_KEEPALIVE_SECONDS = 25
+
+# Caches. `counters` and `identity` are shared by all worker processes: Redis
+# when UNREAD_COUNTER_CACHE_URL is set, local file caches otherwise. The
+# per-user unread counters (core.counters) are adjusted with cache.incr(),
+# which is only atomic on Redis; without it UNREAD_COUNTER_CACHE is None and
+# the counts are read from the database. `identity` holds sessions, user
+# snapshots and the branch registry token apart from the fragment churn in
+# `counters`, and the file caches are sized so that culling stays rare. The
+# test suite uses test_settings.
+if os.environ.get('UNREAD_COUNTER_CACHE_URL'):
+    COUNTER_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['UNREAD_COUNTER_CACHE_URL'],
+    }
+    IDENTITY_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['UNREAD_COUNTER_CACHE_URL'],
+        'KEY_PREFIX': 'identity',
+    }
+    UNREAD_COUNTER_CACHE = 'counters'
+else:
+    COUNTER_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('UNREAD_COUNTER_CACHE_DIR', '/var/tmp/tpf_unread_counters'),
+        'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 4},
+    }
+    IDENTITY_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('IDENTITY_CACHE_DIR', '/var/tmp/tpf_identity'),
+        'OPTIONS': {'MAX_ENTRIES': 20000, 'CULL_FREQUENCY': 10},
+    }
+    UNREAD_COUNTER_CACHE = None
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'counters': COUNTER_CACHE,
+    'identity': IDENTITY_CACHE,
+}
+
+# Branch registry (core.branches): every process keeps the Branch rows in
+# memory and reloads them when the version token in this cache changes, so
+# it must be a cache all worker processes share.
+BRANCH_REGISTRY_CACHE = 'identity'
+
+# Identity (core.identity): request.user is served from a per-user snapshot
+# (without the password hash) in USER_SNAPSHOT_CACHE, and sessions are read
+# through the same shared cache, so authenticated requests spend no queries
+# on who the user is.
+AUTHENTICATION_BACKENDS = ['core.identity.CachedUserBackend']
+USER_SNAPSHOT_CACHE = 'identity'
+USER_SNAPSHOT_TIMEOUT = 3600
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'identity'
+
+# Dashboard fragments (core.fragments, {% cachefragment %}): rendered
+# sidebars, stats cards and recent lists, keyed by role, branch and data
+# version, so a write anywhere invalidates them on every worker.
+FRAGMENT_CACHE = 'counters'
+FRAGMENT_CACHE_TIMEOUT = 600
+
+# Audit log (core.audit). Entries are queued and bulk-written by a background
+# thread every SYSTEM_LOG_FLUSH_INTERVAL seconds or SYSTEM_LOG_BATCH_SIZE
+# entries; tests write synchronously.
+SYSTEM_LOG_ASYNC = True
+SYSTEM_LOG_BATCH_SIZE = 200
+SYSTEM_LOG_FLUSH_INTERVAL = 2.0
+SYSTEM_LOG_QUEUE_SIZE = 10000
+
+# Background jobs (core.jobs), run by `manage.py run_jobs` workers. Tests
+# run them inline. A job whose worker has held it for JOB_LOCK_TIMEOUT is
+# assumed lost and requeued; finished jobs are kept for JOB_RETENTION.
+JOB_QUEUE_ASYNC = True
+JOB_LOCK_TIMEOUT = timedelta(minutes=15)
+JOB_RETENTION = timedelta(days=7)
+
+# Chunked uploads (core.uploads). Medical documents and report files are
+# sent in resumable chunks; BRANCH_UPLOAD_QUOTAS overrides the per-branch
+# quota by branch name. Unfinished sessions expire after UPLOAD_SESSION_TTL.
+UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+BRANCH_UPLOAD_QUOTA = 10 * 1024 ** 3
+BRANCH_UPLOAD_QUOTAS = {}
+UPLOAD_SESSION_TTL = timedelta(hours=48)
+
+# Reminders (core.reminders): how long before each kind of date its
+# notification goes out, and how many events one sweep may notify.
+REMINDER_LEAD_TIMES = {
+    'vaccination': timedelta(days=3),
+    'deworming': timedelta(days=3),
+    'delivery': timedelta(days=7),
+    'task_due': timedelta(days=1),
+}
+REMINDER_BATCH_SIZE = 500
+REMINDER_MAX_BATCHES = 20
+
+# SystemLog retention (core.log_archive). The live table keeps this many
+# calendar months; `manage.py archive_system_logs` moves older months into
+# gzipped JSON-lines files under SYSTEM_LOG_ARCHIVE_DIR.
+SYSTEM_LOG_RETENTION_MONTHS = 6
+SYSTEM_LOG_ARCHIVE_DIR = os.environ.get('SYSTEM_LOG_ARCHIVE_DIR', os.path.join(BASE_DIR, 'log_archive'))
+
+# Request instrumentation (horse.middleware.instrumentation). Query budgets
+# per URL name, in addition to views decorated with @query_budget; the test
+# runner fails the run when a request goes over its budget. METRICS_TOKEN
+# lets a Prometheus scraper read /core/metrics/ without a staff session.
+QUERY_BUDGETS = {
+    'unread_counts_stream': 3,
+}
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+TEST_RUNNER = 'horse.test_runner.BudgetTestRunner'
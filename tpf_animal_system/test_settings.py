@@ -0,0 +1,16 @@
+"""
+Settings for the test suite (`manage.py test` selects them, pytest-django
+reads them from pytest.ini): isolated in-memory caches and background work
+done inline.
+"""
+from .settings import *  # noqa: F401,F403
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'counters': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'unread-counters'},
+    'identity': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'identity'},
+}
+UNREAD_COUNTER_CACHE = 'counters'
+
+SYSTEM_LOG_ASYNC = False
+JOB_QUEUE_ASYNC = False
@@ -1,4 +1,5 @@
 from django import forms
+from core.forms import AnimalLookupField, AnimalLookupWidget
 from core.models import (
     AnimalLog, DailyActivityReport, Message, 
     EmergencyIncident, EquipmentLog, SupportTicket
@@ -9,9 +10,10 @@ class AnimalLogForm(forms.ModelForm):
     class Meta:
         model = AnimalLog
         fields = ['animal', 'activity_type', 'notes']
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'notes': forms.Textarea(attrs={'rows': 4, 'class': 'w-full border rounded px-3 py-2'}),
-            'animal': forms.Select(attrs={'class': 'w-full border rounded px-3 py-2'}),
+            'animal': AnimalLookupWidget(attrs={'class': 'w-full border rounded px-3 py-2'}),
             'activity_type': forms.Select(attrs={'class': 'w-full border rounded px-3 py-2'}),
         }
 
@@ -42,9 +44,10 @@ class EmergencyIncidentForm(forms.ModelForm):
     class Meta:
         model = EmergencyIncident
         fields = ['animal', 'incident_type', 'severity', 'description', 'photo', 'location']
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'description': forms.Textarea(attrs={'rows': 4, 'class': 'w-full border rounded px-3 py-2'}),
-            'animal': forms.Select(attrs={'class': 'w-full border rounded px-3 py-2'}),
+            'animal': AnimalLookupWidget(attrs={'class': 'w-full border rounded px-3 py-2'}),
             'incident_type': forms.Select(attrs={'class': 'w-full border rounded px-3 py-2'}),
             'severity': forms.Select(attrs={'class': 'w-full border rounded px-3 py-2'}),
             'location': forms.TextInput(attrs={'class': 'w-full border rounded px-3 py-2'}),
@@ -2,8 +2,9 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
 from django.contrib import messages
-from core.models import Branch
-from core.utils import normalize_branch_name
+from core.branches import is_same_branch, with_branch
+from core.counters import get_unread_notification_count
+from core.pagination import paginate
 from django.db.models import Q
 
 
@@ -59,10 +60,11 @@ def user_dashboard(request, branch):
 
 @login_required
 def user_tasks(request, branch):
-    tasks = VetTask.objects.filter(assigned_to=request.user).order_by('-date_assigned')
+    tasks = paginate(request, VetTask.objects.filter(assigned_to=request.user).order_by('-date_assigned').for_list())
     return render(request, 'user_dashboard/tasks.html', {
         'branch': branch,
         'tasks': tasks,
+        'page_obj': tasks,
     })
 
 
@@ -85,7 +87,7 @@ def animal_logs(request, branch):
     if request.user.role.lower() != 'user' or request.user.branch.name.lower() != branch.lower():
         return render(request, 'errors/unauthorized.html', status=403)
 
-    logs = AnimalLog.objects.filter(user=request.user).order_by('-date')
+    logs = paginate(request, AnimalLog.objects.filter(user=request.user).order_by('-date').for_list())
     form = AnimalLogForm(request.POST or None)
     if request.method == 'POST' and form.is_valid():
         log = form.save(commit=False)
@@ -96,6 +98,7 @@ def animal_logs(request, branch):
     return render(request, 'user_dashboard/animal_logs.html', {
         'form': form,
         'logs': logs,
+        'page_obj': logs,
         'branch': branch
     })
 
@@ -105,7 +108,7 @@ def report_activity(request, branch):
     if request.user.role.lower() != 'user' or request.user.branch.name.lower() != branch.lower():
         return render(request, 'errors/unauthorized.html', status=403)
 
-    reports = DailyActivityReport.objects.filter(user=request.user).order_by('-date')
+    reports = paginate(request, DailyActivityReport.objects.filter(user=request.user).order_by('-date'))
     form = DailyActivityReportForm(request.POST or None)
     if request.method == 'POST' and form.is_valid():
         report = form.save(commit=False)
@@ -117,6 +120,7 @@ def report_activity(request, branch):
     return render(request, 'user_dashboard/report_activity.html', {
         'form': form,
         'reports': reports,
+        'page_obj': reports,
         'branch': branch,
     })
 
@@ -126,7 +130,7 @@ def user_messages(request, branch):
     if request.user.role.lower() != 'user' or request.user.branch.name.lower() != branch.lower():
         return render(request, 'errors/unauthorized.html', status=403)
 
-    inbox = UserMessage.objects.filter(receiver=request.user).order_by('-timestamp')
+    inbox = paginate(request, UserMessage.objects.filter(receiver=request.user).order_by('-timestamp').for_list())
     form = UserMessageForm(request.POST or None)
     if request.method == 'POST' and form.is_valid():
         message = form.save(commit=False)
@@ -136,6 +140,7 @@ def user_messages(request, branch):
 
     return render(request, 'user_dashboard/user_messages.html', {
         'inbox': inbox,
+        'page_obj': inbox,
         'form': form,
         'branch': branch
     })
@@ -152,28 +157,28 @@ def notifications_view(request, branch):
             notif.save()
         return redirect('notifications_view', branch=branch)
 
+    notifications = paginate(request, notifications)
     return render(request, 'user_dashboard/notifications.html', {
         'notifications': notifications,
+        'page_obj': notifications,
         'branch': branch,
     })
 
 
 @login_required
 def api_unread_notifications_count(request):
-    count = request.user.notifications.filter(is_read=False).count()
+    count = get_unread_notification_count(request.user.id)
     return JsonResponse({'count': count})
 
 @login_required
-def assigned_animals(request, branch):
+@with_branch
+def assigned_animals(request, branch, branch_obj):
     # Check user role and branch access
-    if request.user.role.lower() != 'user' or request.user.branch.name.lower() != branch.lower():
+    if request.user.role.lower() != 'user' or not is_same_branch(request.user.branch, branch):
         return render(request, 'errors/unauthorized.html', status=403)
 
-    # Get the Branch instance by name (case-insensitive)
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
-
     # Filter animals by assigned_users and branch instance
-    animals = Animal.objects.filter(assigned_users=request.user, branch=branch_obj)
+    animals = Animal.objects.filter(assigned_users=request.user, branch=branch_obj).for_list()
 
     return render(request, 'user_dashboard/assigned_animals.html', {
         'animals': animals,
@@ -183,7 +188,7 @@ def assigned_animals(request, branch):
 
 @login_required
 def report_emergency(request, branch):
-    if request.user.role.lower() != 'user' or normalize_branch_name(request.user.branch.name) != normalize_branch_name(branch):
+    if request.user.role.lower() != 'user' or not is_same_branch(request.user.branch, branch):
         return render(request, 'errors/unauthorized.html', status=403)
 
     form = EmergencyIncidentForm(request.POST or None, request.FILES or None)
@@ -195,18 +200,19 @@ def report_emergency(request, branch):
         incident.save()
         return redirect('report_emergency', branch=branch)
 
-    incidents = EmergencyIncident.objects.filter(reporter=request.user).order_by('-date_reported')
+    incidents = paginate(request, EmergencyIncident.objects.filter(reporter=request.user).order_by('-date_reported').for_list())
 
     return render(request, 'user_dashboard/report_emergency.html', {
         'form': form,
         'incidents': incidents,
+        'page_obj': incidents,
         'branch': branch
     })
 
 
 @login_required
 def equipment_log_view(request, branch):
-    if request.user.role.lower() != 'user' or normalize_branch_name(request.user.branch.name) != normalize_branch_name(branch):
+    if request.user.role.lower() != 'user' or not is_same_branch(request.user.branch, branch):
         return render(request, 'errors/unauthorized.html', status=403)
 
     form = EquipmentLogForm(request.POST or None)
@@ -216,10 +222,11 @@ def equipment_log_view(request, branch):
         log.save()
         return redirect('equipment_log_view', branch=branch)
 
-    logs = EquipmentLog.objects.filter(user=request.user).order_by('-timestamp')
+    logs = paginate(request, EquipmentLog.objects.filter(user=request.user).order_by('-timestamp').for_list())
     return render(request, 'user_dashboard/equipment_log.html', {
         'form': form,
         'logs': logs,
+        'page_obj': logs,
         'branch': branch
     })
 
@@ -242,7 +249,7 @@ def support_request_view(request, branch):
             branch=user.branch
         )
 
-    requests = requests.order_by('-created_at')
+    requests = requests.order_by('-created_at').for_list()
 
     return render(request, 'user_dashboard/support_request_list.html', {
         'requests': requests,
@@ -4,6 +4,7 @@ from core.models import (
     EquipmentLog, EmergencyIncident
 )
 from accounts.models import CustomUser
+from core.forms import AnimalLookupField, ChunkedUploadField
 
 REPORT_TYPE_CHOICES = [
     ('breeding', 'Breeding'),
@@ -20,7 +21,8 @@ REPORT_TYPE_CHOICES = [
 
 class MedicalRecordForm(forms.ModelForm):
     report_type = forms.ChoiceField(choices=REPORT_TYPE_CHOICES)
-    animal = forms.ModelChoiceField(queryset=Animal.objects.none(), label="Animal")
+    animal = AnimalLookupField(queryset=Animal.objects.none(), label="Animal")
+    document = ChunkedUploadField('medical_document', required=False)
 
     class Meta:
         model = MedicalRecord
@@ -58,6 +60,7 @@ class MedicalRecordForm(forms.ModelForm):
         user = kwargs.pop('user', None)
         branch = kwargs.pop('branch', None)
         super().__init__(*args, **kwargs)
+        self.fields['document'].bind(user, branch)
 
         # Filter animals by branch
         if branch:
@@ -68,6 +71,7 @@ class VetTaskForm(forms.ModelForm):
     class Meta:
         model = VetTask
         fields = ['animal', 'title', 'description', 'assigned_to', 'priority', 'due_date', 'notes']
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
             'notes': forms.Textarea(attrs={'rows': 2}),
@@ -147,6 +151,7 @@ class EmergencyReportForm(forms.ModelForm):
     class Meta:
         model = EmergencyIncident
         fields = ['animal', 'incident_type', 'severity', 'description', 'photo', 'location']
+        field_classes = {'animal': AnimalLookupField}
         widgets = {
             'description': forms.Textarea(attrs={'rows': 4, 'placeholder': 'Describe the emergency in detail...'}),
             'location': forms.TextInput(attrs={'placeholder': 'Location of the incident'}),
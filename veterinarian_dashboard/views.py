@@ -5,12 +5,20 @@ from django.contrib import messages
 from core.forms import MessageReplyForm
 from django.db.models import Q, Avg
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.functional import SimpleLazyObject
 from core.forms import MessageForm, MessageReplyForm, SupportTicketForm
 from datetime import datetime, timedelta
 from core.models import (
-    Notification, Animal, VetTask, Branch, Message, SupportTicket,
+    Notification, Animal, VetTask, Message, SupportTicket,
     MedicalRecord, EquipmentLog, EmergencyIncident, AnimalLog
 )
+from core.counters import get_unread_notification_count, get_unread_message_count
+from core.pagination import paginate
+from core.search import search_filter
+from core.stats import get_branch_stats
+from core.branches import is_same_branch, with_branch
+from core.performance import get_vet_performance
 from accounts.models import CustomUser
 from .forms import (
     MedicalRecordForm, VetTaskForm, PatientForm,
@@ -19,28 +27,24 @@ from .forms import (
 
 
 def is_authorized_branch(user, branch_name, role=None):
-    branch_check = user.branch and user.branch.name.lower() == branch_name.lower()
+    branch_check = is_same_branch(user.branch, branch_name)
     if role:
         return branch_check and user.role.lower() == role.lower()
     return branch_check
 
 @login_required
-def vet_dashboard(request, branch):
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
-
-    total_animals = Animal.objects.filter(branch=branch_obj).count()
-    total_tasks = VetTask.objects.filter(branch=branch_obj).count()
-    total_medical_records = MedicalRecord.objects.filter(animal__branch=branch_obj).count()
-    total_notifications = Notification.objects.filter(user=request.user, is_read=False).count()
+@with_branch
+def vet_dashboard(request, branch, branch_obj):
+    # Only read when the cached stats fragment has to be rendered (core.fragments)
+    stats = SimpleLazyObject(lambda: get_branch_stats(branch_obj))
+    total_notifications = get_unread_notification_count(request.user.id)
 
 
     recent_messages = Message.objects.filter(receiver=request.user).order_by("-timestamp")[:5]
 
     context = {
         "branch": branch_obj.name,
-        "total_animals": total_animals,
-        "total_tasks": total_tasks,
-        "total_medical_records": total_medical_records,
+        "stats": stats,
         "total_notifications": total_notifications,
         "recent_messages": recent_messages,
     }
@@ -50,12 +54,12 @@ def vet_dashboard(request, branch):
 
 
 @login_required
-def veterinarian_dashboard_data(request, branch):
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
-
-    total_animals = Animal.objects.filter(branch=branch_obj).count()
-    total_tasks = VetTask.objects.filter(branch=branch_obj).count()
-    total_medical_records = MedicalRecord.objects.filter(animal__branch=branch_obj).count()
+@with_branch
+def veterinarian_dashboard_data(request, branch, branch_obj):
+    stats = get_branch_stats(branch_obj)
+    total_animals = stats.animal_count
+    total_tasks = stats.task_count
+    total_medical_records = stats.medical_record_count
     total_notifications = Notification.objects.filter(user__branch=branch_obj).count()
 
     recent_messages = Message.objects.filter(
@@ -83,63 +87,50 @@ def veterinarian_dashboard_data(request, branch):
 
 @login_required
 def unread_message_count(request, branch):
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
-    count = Message.objects.filter(
-        receiver=request.user,
-        is_read=False,
-        receiver__branch=branch_obj
-    ).count()
+    # Only the user's own messages are counted, so another branch is always 0.
+    count = 0
+    if request.user.branch and request.user.branch.name.lower() == branch.lower():
+        count = get_unread_message_count(request.user.id)
     return JsonResponse({'unread_count': count})
 
 
 @login_required
 def notification_count_api(request):
     branch_id = request.GET.get('branch', None)
-    if not branch_id:
+    if not branch_id or str(request.user.branch_id) != branch_id:
         return JsonResponse({'notifications': 0, 'messages': 0})
 
-    try:
-        branch_obj = Branch.objects.get(id=branch_id)
-    except Branch.DoesNotExist:
-        return JsonResponse({'notifications': 0, 'messages': 0})
-
-    notifications_count = Notification.objects.filter(
-        user=request.user,
-        user__branch=branch_obj,
-        is_read=False
-    ).count()
-    messages_count = Message.objects.filter(
-        receiver=request.user,
-        receiver__branch=branch_obj,
-        is_read=False
-    ).count()
-
-    return JsonResponse({'notifications': notifications_count, 'messages': messages_count})
+    return JsonResponse({
+        'notifications': get_unread_notification_count(request.user.id),
+        'messages': get_unread_message_count(request.user.id),
+    })
 
 
 @login_required
-def messages_view(request, branch):
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
+@with_branch
+def messages_view(request, branch, branch_obj):
     messages_qs = Message.objects.filter(
         receiver=request.user,
         receiver__branch=branch_obj
-    ).order_by('-timestamp')
-    return render(request, 'veterinarian_dashboard/messages.html', {'branch': branch_obj, 'messages': messages_qs})
+    ).order_by('-timestamp').for_list()
+    messages_qs = paginate(request, messages_qs)
+    return render(request, 'veterinarian_dashboard/messages.html', {'branch': branch_obj, 'messages': messages_qs, 'page_obj': messages_qs})
 
 
 @login_required
-def notifications_view(request, branch):
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
+@with_branch
+def notifications_view(request, branch, branch_obj):
     notifications = Notification.objects.filter(
         user=request.user,
         user__branch=branch_obj
     ).order_by('-created_at')
-    return render(request, 'veterinarian_dashboard/notifications.html', {'branch': branch_obj, 'notifications': notifications})
+    notifications = paginate(request, notifications)
+    return render(request, 'veterinarian_dashboard/notifications.html', {'branch': branch_obj, 'notifications': notifications, 'page_obj': notifications})
 
 
 @login_required
-def update_task_view(request, branch):
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
+@with_branch
+def update_task_view(request, branch, branch_obj):
     tasks = VetTask.objects.filter(
         assigned_to=request.user,
         branch=branch_obj
@@ -148,9 +139,8 @@ def update_task_view(request, branch):
 
 
 @login_required
-def add_medical_record(request, branch):
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
-
+@with_branch
+def add_medical_record(request, branch, branch_obj):
     if request.method == 'POST':
         form = MedicalRecordForm(request.POST, request.FILES, branch=branch_obj, user=request.user)
         if form.is_valid():
@@ -181,12 +171,13 @@ def medical_records_list(request, branch):
     records = MedicalRecord.objects.filter(
         veterinarian=request.user,
         animal__branch__name__iexact=branch
-    ).order_by('-date_recorded')
+    ).order_by('-date_recorded').for_list()
+    records = paginate(request, records)
 
     return render(
         request,
         'veterinarian_dashboard/medical_records_list.html',
-        {'records': records, 'branch': branch}
+        {'records': records, 'page_obj': records, 'branch': branch}
     )
 
 
@@ -217,10 +208,12 @@ def vet_task_list(request, branch):
     tasks = VetTask.objects.filter(
         assigned_by=request.user,
         animal__branch__name__iexact=branch
-    ).order_by('-created_at')
+    ).order_by('-created_at').for_list()
+    tasks = paginate(request, tasks)
 
     return render(request, 'veterinarian_dashboard/task_list.html', {
         'tasks': tasks,
+        'page_obj': tasks,
         'branch': branch
     })
 
@@ -254,13 +247,15 @@ def search_medical_records(request, branch):
     records = MedicalRecord.objects.filter(
         veterinarian=request.user,
         animal__branch__name__iexact=branch
-    ).order_by('-date_recorded')
+    ).order_by('-date_recorded').for_list()
 
     if query:
-        records = records.filter(diagnosis__icontains=query)
+        records = search_filter(records, query)
+    records = paginate(request, records)
 
     return render(request, 'veterinarian_dashboard/search_medical_records.html', {
         'records': records,
+        'page_obj': records,
         'branch': branch,
         'query': query
     })
@@ -274,10 +269,12 @@ def pending_tasks(request, branch):
         assigned_by=request.user,
         status='pending',
         animal__branch__name__iexact=branch
-    ).order_by('-created_at')
+    ).order_by('-created_at').for_list()
+    tasks = paginate(request, tasks)
 
     return render(request, 'veterinarian_dashboard/pending_tasks.html', {
         'tasks': tasks,
+        'page_obj': tasks,
         'branch': branch
     })
 
@@ -291,20 +288,22 @@ def completed_tasks(request, branch):
         assigned_by=request.user,
         status='completed',
         animal__branch__name__iexact=branch
-    ).order_by('-created_at')
+    ).order_by('-created_at').for_list()
+    tasks = paginate(request, tasks)
 
     return render(request, 'veterinarian_dashboard/completed_tasks.html', {
         'tasks': tasks,
+        'page_obj': tasks,
         'branch': branch
     })
 
 
 @login_required
-def add_patient(request, branch):
+@with_branch
+def add_patient(request, branch, branch_obj):
     if not is_authorized_branch(request.user, branch, role='veterinarian'):
         return render(request, 'errors/unauthorized.html', status=403)
 
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
     form = PatientForm(request.POST or None)
     if request.method == 'POST' and form.is_valid():
         patient = form.save(commit=False)
@@ -317,66 +316,53 @@ def add_patient(request, branch):
 
 @login_required
 def patient_list(request, branch):
-    patients = Animal.objects.filter(branch__name__iexact=branch)
-    return render(request, 'veterinarian_dashboard/patient_list.html', {'patients': patients, 'branch': branch})
+    patients = paginate(request, Animal.objects.filter(branch__name__iexact=branch).for_list())
+    return render(request, 'veterinarian_dashboard/patient_list.html', {'patients': patients, 'page_obj': patients, 'branch': branch})
 
 
 @login_required
 def search_patients(request, branch):
     query = request.GET.get('q', '')
-    patients = Animal.objects.filter(branch__name__iexact=branch)
+    patients = Animal.objects.filter(branch__name__iexact=branch).for_list()
     if query:
-        patients = patients.filter(name__icontains=query)
-    return render(request, 'veterinarian_dashboard/search_patients.html', {'branch': branch, 'patients': patients, 'query': query})
+        patients = search_filter(patients, query)
+    patients = paginate(request, patients)
+    return render(request, 'veterinarian_dashboard/search_patients.html', {'branch': branch, 'patients': patients, 'page_obj': patients, 'query': query})
 
 
 @login_required
-def analytics_dashboard(request, branch):
-    animals = Animal.objects.filter(branch__name__iexact=branch)
-    tasks = VetTask.objects.filter(animal__branch__name__iexact=branch)
+@with_branch
+def analytics_dashboard(request, branch, branch_obj):
+    stats = get_branch_stats(branch_obj)
 
     return render(request, 'veterinarian_dashboard/analytics_dashboard.html', {
         'branch': branch,
-        'total_patients': animals.count(),
-        'active_cases': tasks.filter(status='pending').count(),
-        'pending_tasks': tasks.filter(status='pending').count(),
-        'completed_tasks': tasks.filter(status='completed').count(),
+        'total_patients': stats.animal_count,
+        'active_cases': stats.tasks_pending,
+        'pending_tasks': stats.tasks_pending,
+        'completed_tasks': stats.tasks_completed,
     })
 
 
 @login_required
-def performance_reports(request, branch):
+@with_branch
+def performance_reports(request, branch, branch_obj):
     vet = request.user
+    end = parse_date(request.GET.get('end', '')) or timezone.localdate()
+    start = parse_date(request.GET.get('start', '')) or end - timedelta(days=29)
+    if start > end:
+        start, end = end, start
+
+    # Both numbers cover the vet's work on this branch's animals.
+    reports = get_vet_performance(vet, start, end, branch=branch_obj)
+    reports['tasks_pending'] = VetTask.objects.filter(
+        assigned_to=vet, status='pending', animal__branch=branch_obj,
+    ).count()
 
-    tasks = VetTask.objects.filter(
-        assigned_to=vet,
-        animal__branch__name__iexact=branch
-    )
-
-    completed_tasks = tasks.filter(status='completed', due_date__isnull=False)
-
-    total_duration = timedelta()
-    count = 0
-
-    for task in completed_tasks:
-        if task.completed_at:
-            total_duration += (task.completed_at - task.created_at)
-            count += 1
-
-    avg_response_time = str(total_duration / count) if count else "N/A"
-
-    context = {
+    return render(request, 'veterinarian_dashboard/performance_reports.html', {
         'branch': branch,
-        'total_patients': Animal.objects.filter(
-            branch__name__iexact=branch,
-            assigned_users=vet
-        ).count(),
-        'tasks_completed': completed_tasks.count(),
-        'tasks_pending': tasks.filter(status='pending').count(),
-        'average_response_time': avg_response_time,
-    }
-
-    return render(request, 'veterinarian_dashboard/performance_reports.html', context)
+        'reports': reports,
+    })
 
 
 @login_required
@@ -402,18 +388,19 @@ def equipment_log_view(request, branch):
         messages.success(request, "Equipment log entry added successfully.")
         return redirect('equipment_logs', branch=branch)
 
-    logs = EquipmentLog.objects.filter(user=request.user).order_by('-timestamp')
+    logs = paginate(request, EquipmentLog.objects.filter(user=request.user).order_by('-timestamp').for_list())
     return render(request, 'veterinarian_dashboard/equipment_log.html', {
         'form': form,
         'logs': logs,
+        'page_obj': logs,
         'branch': branch
     })
 
 
 @login_required
 def inbox(request, branch):
-    messages_qs = Message.objects.filter(receiver=request.user).order_by('-timestamp')
-    context = {'messages': messages_qs, 'branch': branch}
+    messages_qs = paginate(request, Message.objects.filter(receiver=request.user).order_by('-timestamp').for_list())
+    context = {'messages': messages_qs, 'page_obj': messages_qs, 'branch': branch}
     return render(request, 'veterinarian_dashboard/inbox.html', context)
 
 
@@ -491,11 +478,11 @@ def reply_message(request, branch, message_id):
 
 
 @login_required
-def report_emergency_view(request, branch):
+@with_branch
+def report_emergency_view(request, branch, branch_obj):
     if not is_authorized_branch(request.user, branch, role='veterinarian'):
         return render(request, 'errors/unauthorized.html', status=403)
 
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
     form = EmergencyReportForm(request.POST or None, request.FILES or None, user=request.user)
     
     if request.method == 'POST' and form.is_valid():
@@ -512,11 +499,11 @@ def report_emergency_view(request, branch):
 
 
 @login_required
-def support_request_view(request, branch):
+@with_branch
+def support_request_view(request, branch, branch_obj):
     if not is_authorized_branch(request.user, branch, role='veterinarian'):
         return render(request, 'errors/unauthorized.html', status=403)
 
-    branch_obj = get_object_or_404(Branch, name__iexact=branch)
     form = SupportTicketForm(request.POST or None)
     
     if request.method == 'POST' and form.is_valid():
@@ -558,38 +545,43 @@ def send_message(request, branch):
 @login_required
 def sent_messages(request, branch):
     # Filter messages sent by the current user within the given branch
-    messages = Message.objects.filter(sender=request.user, branch__name__iexact=branch).order_by('-timestamp')
+    messages = paginate(request, Message.objects.filter(sender=request.user, branch__name__iexact=branch).order_by('-timestamp').for_list())
     context = {
         'sent_messages': messages,
+        'page_obj': messages,
         'branch': branch,
     }
     return render(request, 'veterinarian_dashboard/messages/sent_messages.html', context)
 
 @login_required
 def archived_messages(request, branch):
-    archived = Message.objects.filter(receiver=request.user, is_archived=True).order_by('-timestamp')
-    return render(request, 'veterinarian_dashboard/archived_messages.html', {'messages': archived, 'branch': branch})
+    archived = paginate(request, Message.objects.filter(receiver=request.user, is_archived=True).order_by('-timestamp').for_list())
+    return render(request, 'veterinarian_dashboard/archived_messages.html', {'messages': archived, 'page_obj': archived, 'branch': branch})
 
 
 @login_required
 def deleted_messages(request, branch):
-    deleted = Message.objects.filter(receiver=request.user, is_deleted=True).order_by('-timestamp')
+    deleted = paginate(request, Message.objects.filter(receiver=request.user, is_deleted=True).order_by('-timestamp').for_list())
     return render(request, 'veterinarian_dashboard/deleted_messages.html', {
         'messages': deleted,
+        'page_obj': deleted,
         'branch': branch,
     })
 
 @login_required
 def search_animal_logs(request, branch):
-    logs = AnimalLog.objects.filter(branch__name__iexact=branch)
+    logs = AnimalLog.objects.filter(animal__branch__name__iexact=branch).for_list()
 
     query = request.GET.get('q')
     if query:
-        logs = logs.filter(description__icontains=query)
+        logs = search_filter(logs, query)
+    logs = paginate(request, logs)
 
     context = {
         'branch': branch,
         'logs': logs,
+        'page_obj': logs,
+        'query': query,
     }
     return render(request, 'veterinarian_dashboard/search_animal_logs.html', context)
 